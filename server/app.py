@@ -1,15 +1,67 @@
+import base64
+import binascii
+import functools
+import hashlib
+import heapq
+import hmac
+import itertools
 import math
+import mimetypes
 import os
+import re
+import sqlite3
+import threading
+import time
 import uuid
-from datetime import datetime
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 import requests
 from dotenv import load_dotenv
-from flask import Flask, jsonify, render_template, request
+from flask import (
+    Flask,
+    Response,
+    g,
+    jsonify,
+    make_response,
+    render_template,
+    request,
+    send_from_directory,
+    url_for,
+)
 from flask_cors import CORS
-from werkzeug.security import check_password_hash, generate_password_hash
-
-from db import close_db, get_all, get_one, init_db, run
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+import archive
+import events
+import limits
+import metrics
+import stats
+import upstream
+from assets import DIST_DIR, ENCODINGS, accepted_encodings, compress, load_manifest, pick_encoding
+from cache import LRUCache
+from db import (
+    SCHEMA_VERSION,
+    close_db,
+    get_all,
+    get_one,
+    init_shards,
+    iter_rows,
+    locate,
+    mutate_one,
+    place_hospital,
+    row_version,
+    run,
+    scatter,
+    shard_names,
+    transaction,
+    use_shard,
+)
+from entities import VersionedCache
+from geo import doctors_within, nearest_doctors
+from jobs import JobQueue, QueueFullError
+from passwords import PasswordServiceBusy, passwords
+from slots import SlotError, availability, doctor_schedule, parse_slot
 
 
 load_dotenv()
@@ -28,6 +80,47 @@ app.config["GOOGLE_CALENDAR_EMBED_URL"] = os.environ.get("GOOGLE_CALENDAR_EMBED_
 
 app.config["RECAPTCHA_SECRET"] = os.environ.get("RECAPTCHA_SECRET", "")
 app.config["RECAPTCHA_SITE_KEY"] = os.environ.get("RECAPTCHA_SITE_KEY", "")
+app.config["RECAPTCHA_VERIFY_URL"] = os.environ.get(
+    "RECAPTCHA_VERIFY_URL", "https://www.google.com/recaptcha/api/siteverify"
+)
+app.config["GEMINI_API_URL"] = os.environ.get("GEMINI_API_URL", "https://generativelanguage.googleapis.com")
+
+app.config["SEARCH_DEFAULT_LIMIT"] = int(os.environ.get("SEARCH_DEFAULT_LIMIT", "20"))
+app.config["SEARCH_MAX_LIMIT"] = int(os.environ.get("SEARCH_MAX_LIMIT", "200"))
+app.config["SEARCH_CACHE_MAX_AGE"] = int(os.environ.get("SEARCH_CACHE_MAX_AGE", "15"))
+app.config["APPOINTMENTS_MAX_LIMIT"] = int(os.environ.get("APPOINTMENTS_MAX_LIMIT", "500"))
+app.config["FIRSTAID_WORKERS"] = int(os.environ.get("FIRSTAID_WORKERS", "4"))
+app.config["FIRSTAID_QUEUE_DEPTH"] = int(os.environ.get("FIRSTAID_QUEUE_DEPTH", "32"))
+app.config["FIRSTAID_MAX_WAIT"] = float(os.environ.get("FIRSTAID_MAX_WAIT", "10"))
+app.config["FIRSTAID_JOB_TIMEOUT"] = int(os.environ.get("FIRSTAID_JOB_TIMEOUT", "120"))
+app.config["FIRSTAID_CACHE_TTL"] = int(os.environ.get("FIRSTAID_CACHE_TTL", str(7 * 24 * 3600)))
+app.config["FIRSTAID_CACHE_MAX_ENTRIES"] = int(os.environ.get("FIRSTAID_CACHE_MAX_ENTRIES", "10000"))
+app.config["FIRSTAID_CACHE_LRU_SIZE"] = int(os.environ.get("FIRSTAID_CACHE_LRU_SIZE", "512"))
+app.config["PAGE_CACHE_SIZE"] = int(os.environ.get("PAGE_CACHE_SIZE", "256"))
+app.config["HOSPITAL_CACHE_SIZE"] = int(os.environ.get("HOSPITAL_CACHE_SIZE", "1024"))
+app.config["ENTITY_CACHE_CHECK_MS"] = int(os.environ.get("ENTITY_CACHE_CHECK_MS", "500"))
+app.config["EVENTS_HEARTBEAT"] = float(os.environ.get("EVENTS_HEARTBEAT", "15"))
+app.config["EVENTS_STREAM_MAX_AGE"] = float(os.environ.get("EVENTS_STREAM_MAX_AGE", "300"))
+# Each open stream holds a worker thread; keep the rest free for the other APIs.
+app.config["EVENTS_MAX_STREAMS"] = int(os.environ.get("EVENTS_MAX_STREAMS", "4"))
+app.config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN", "")
+# Metrics expose routes, query text and load; without a token they are closed unless made public on purpose.
+app.config["METRICS_PUBLIC"] = os.environ.get("METRICS_PUBLIC", "").lower() in {"1", "true", "yes"}
+app.config["AVAILABILITY_DAYS"] = int(os.environ.get("AVAILABILITY_DAYS", "7"))
+app.config["AVAILABILITY_MAX_DAYS"] = int(os.environ.get("AVAILABILITY_MAX_DAYS", "14"))
+app.config["STATS_MAX_DAYS"] = int(os.environ.get("STATS_MAX_DAYS", "366"))
+# Reverse proxies in front of the app whose X-Forwarded-For can be trusted (1 on Render).
+app.config["PROXY_FIX_HOPS"] = int(os.environ.get("PROXY_FIX_HOPS", "0"))
+if app.config["PROXY_FIX_HOPS"]:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config["PROXY_FIX_HOPS"], x_proto=app.config["PROXY_FIX_HOPS"])
+elif limits.RATE_LIMIT_ENABLED:
+    app.logger.warning(
+        "Rate limits are keyed on the client address but PROXY_FIX_HOPS is 0; behind a reverse proxy "
+        "every client shares the proxy's buckets. Set PROXY_FIX_HOPS to the number of trusted proxies."
+    )
+
+# Migrations run once per worker at import time rather than being checked per request.
+init_shards()
 
 
 def calc_age(dob: str | None) -> int | None:
@@ -41,37 +134,38 @@ def calc_age(dob: str | None) -> int | None:
     return int(diff.days // 365.25)
 
 
-def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    to_rad = lambda deg: (deg * math.pi) / 180
-    r = 6371.0
-    dlat = to_rad(lat2 - lat1)
-    dlon = to_rad(lon2 - lon1)
-    a = math.sin(dlat / 2) ** 2 + math.cos(to_rad(lat1)) * math.cos(to_rad(lat2)) * math.sin(dlon / 2) ** 2
-    return r * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+class GeminiError(RuntimeError):
+    pass
+
 
+def gemini_generate(prompt: str) -> str:
+    """Return Gemini's answer, raising GeminiError on any failure.
 
-def call_gemini(prompt: str) -> str:
+    Error messages may include the request URL, API key and all, so log them; never show them to users.
+    """
     key = os.environ.get("GEMINI_API_KEY")
     if not key:
-        return "Gemini API key missing."
+        raise GeminiError("Gemini API key missing.")
     try:
-        resp = requests.post(
-            f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={key}",
+        resp = upstream.gemini.post(
+            f"{app.config['GEMINI_API_URL']}/v1beta/models/gemini-1.5-flash:generateContent?key={key}",
             json={"contents": [{"parts": [{"text": prompt}]}]},
-            timeout=20,
         )
         data = resp.json()
         if not resp.ok:
             detail = data.get("error", {}).get("message") or "Gemini API error"
-            return f"Gemini API error: {detail}"
-        return (
+            raise GeminiError(f"Gemini API error: {detail}")
+        text = (
             data.get("candidates", [{}])[0]
             .get("content", {})
             .get("parts", [{}])[0]
             .get("text")
-        ) or "No response received from Gemini."
+        )
+        if not text:
+            raise GeminiError("No response received from Gemini.")
+        return text
     except requests.RequestException as exc:
-        return f"Gemini request failed: {exc}"
+        raise GeminiError(f"Gemini request failed: {exc}") from exc
 
 
 def verify_recaptcha(token: str | None) -> bool:
@@ -81,10 +175,9 @@ def verify_recaptcha(token: str | None) -> bool:
     if not token:
         return False
     try:
-        resp = requests.post(
-            "https://www.google.com/recaptcha/api/siteverify",
+        resp = upstream.recaptcha.post(
+            app.config["RECAPTCHA_VERIFY_URL"],
             data={"secret": secret, "response": token},
-            timeout=10,
         )
         data = resp.json() if resp.ok else {}
         return bool(data.get("success"))
@@ -104,16 +197,121 @@ def sanitize_hospital(hospital: dict | None) -> dict | None:
     return {k: v for k, v in hospital.items() if k != "password_hash"}
 
 
+def busy_response(message: str, retry_after: int = 1):
+    resp = jsonify({"error": message})
+    resp.headers["Retry-After"] = str(retry_after)
+    return resp, 503
+
+
+def admit(policy_name: str, account_field: str | None = None):
+    """Guard a view with a ``limits.POLICIES`` entry.
+
+    Answers 429 once the caller's IP or account bucket is empty, and 503 while the
+    route is at its concurrency cap in this worker; both carry ``Retry-After``.
+    """
+    policy = limits.POLICIES[policy_name]
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not limits.RATE_LIMIT_ENABLED:
+                return view(*args, **kwargs)
+            account = None
+            if account_field:
+                data = request.get_json(force=True, silent=True)
+                account = data.get(account_field) if isinstance(data, dict) else None
+            wait = limits.check(policy, request.remote_addr, account if isinstance(account, str) else None)
+            if wait:
+                metrics.registry.inc("admission_rejected_total", {"policy": policy.name, "reason": "rate"})
+                resp = jsonify({"error": "Too many requests, please retry later"})
+                resp.headers["Retry-After"] = str(math.ceil(wait))
+                return resp, 429
+            if not policy.try_enter():
+                metrics.registry.inc("admission_rejected_total", {"policy": policy.name, "reason": "concurrency"})
+                return busy_response("Server is busy, please retry shortly")
+            try:
+                return view(*args, **kwargs)
+            finally:
+                policy.leave()
+
+        return wrapper
+
+    return decorator
+
+
+def conditional_response(etag_parts: tuple, cache_control: str, build):
+    """Answer ``If-None-Match`` with 304 before running ``build``; otherwise tag its 200 response.
+
+    ``etag_parts`` must change whenever the representation does (e.g. a row version).
+    """
+    etag = hashlib.sha1(repr((SCHEMA_VERSION, *etag_parts)).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        resp = make_response(build())
+        if resp.status_code != 200:
+            return resp
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = cache_control
+    return resp
+
+
 @app.teardown_appcontext
 def teardown_db(exc):
     close_db(exc)
 
 
 @app.before_request
-def ensure_db():
-    if not getattr(app, "_db_initialized", False):
-        init_db()
-        app._db_initialized = True
+def start_request_timer():
+    g._started = time.perf_counter()
+    metrics.registry.add_gauge("http_requests_in_flight", None, 1)
+
+
+@app.after_request
+def remember_status(resp):
+    g._status = resp.status_code
+    return resp
+
+
+@app.teardown_request
+def record_request_metrics(exc):
+    started = g.pop("_started", None)
+    if started is None:
+        return
+    labels = {"route": request.url_rule.rule if request.url_rule else "unmatched", "method": request.method}
+    metrics.registry.add_gauge("http_requests_in_flight", None, -1)
+    metrics.registry.observe("http_request_duration_seconds", labels, time.perf_counter() - started)
+    status = 500 if exc is not None else g.pop("_status", 500)
+    metrics.registry.inc("http_requests_total", {**labels, "status": status})
+
+
+ASSET_CACHE_CONTROL = "public, max-age=31536000, immutable"
+asset_manifest = load_manifest()
+
+
+@app.template_global()
+def asset_url(name: str) -> str:
+    """Fingerprinted URL for a file under static/, or the plain static URL when assets aren't built."""
+    hashed = asset_manifest.get(name) if asset_manifest else None
+    if hashed:
+        return url_for("serve_asset", filename=hashed)
+    return url_for("static", filename=name)
+
+
+@app.get("/assets/<path:filename>")
+def serve_asset(filename: str):
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    choice = pick_encoding(request.headers.get("Accept-Encoding", ""), os.path.join(DIST_DIR, filename))
+    if choice:
+        encoding, suffix = choice
+        resp = send_from_directory(DIST_DIR, filename + suffix, mimetype=mimetype)
+        resp.headers["Content-Encoding"] = encoding
+    else:
+        resp = send_from_directory(DIST_DIR, filename, mimetype=mimetype)
+    # Names are content-hashed, so a URL's bytes never change.
+    resp.headers["Cache-Control"] = ASSET_CACHE_CONTROL
+    resp.headers["Vary"] = "Accept-Encoding"
+    return resp
 
 
 @app.context_processor
@@ -125,80 +323,119 @@ def inject_globals():
     }
 
 
+PAGE_CACHE_CONTROL = "no-cache"
+# Everything a rendered page depends on besides its template arguments.
+PAGE_CONFIG_KEYS = (
+    "API_BASE",
+    "GA_MEASUREMENT_ID",
+    "GTM_CONTAINER_ID",
+    "RECAPTCHA_SITE_KEY",
+    "GOOGLE_CALENDAR_EMBED_URL",
+)
+page_cache = LRUCache(app.config["PAGE_CACHE_SIZE"])
+
+
+def _page_config() -> tuple:
+    return tuple(app.config.get(key) for key in PAGE_CONFIG_KEYS) + (request.script_root,)
+
+
+def render_page(template: str, **context):
+    """Serve a page rendered once per worker, with pre-compressed variants and an ETag.
+
+    Pages are static apart from config, so the cache key is the template, its
+    arguments and the config snapshot; changing any of them renders afresh.
+    """
+    if app.debug or app.config.get("TEMPLATES_AUTO_RELOAD"):
+        return render_template(template, api_base=app.config["API_BASE"], **context)
+    key = (template, tuple(sorted(context.items())), _page_config())
+    entry = page_cache.get(key)
+    if entry is None:
+        body = render_template(template, api_base=app.config["API_BASE"], **context).encode("utf-8")
+        entry = (hashlib.sha1(body).hexdigest(), {"identity": body, **compress(body)})
+        page_cache.set(key, entry)
+    etag, variants = entry
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        accepted = accepted_encodings(request.headers.get("Accept-Encoding", ""))
+        encoding = next((enc for enc, _ in ENCODINGS if enc in accepted and enc in variants), "identity")
+        resp = Response(variants[encoding], mimetype="text/html")
+        if encoding != "identity":
+            resp.headers["Content-Encoding"] = encoding
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = PAGE_CACHE_CONTROL
+    resp.headers["Vary"] = "Accept-Encoding"
+    return resp
+
+
 @app.route("/")
 def landing_page():
-    return render_template("landing.html", page="landing", api_base=app.config["API_BASE"])
+    return render_page("landing.html", page="landing")
 
 
 @app.route("/user/register")
 def user_register_page():
-    return render_template("user_register.html", page="user-register", api_base=app.config["API_BASE"])
+    return render_page("user_register.html", page="user-register")
 
 
 @app.route("/user/login")
 @app.route("/users/login")
 def user_login_page():
-    return render_template("user_login.html", page="user-login", api_base=app.config["API_BASE"])
+    return render_page("user_login.html", page="user-login")
 
 
 @app.route("/user/dashboard")
 def user_dashboard_page():
-    return render_template("user_dashboard.html", page="user-dashboard", api_base=app.config["API_BASE"])
+    return render_page("user_dashboard.html", page="user-dashboard")
 
 
 @app.route("/user/book")
 def user_book_page():
-    return render_template("book.html", page="book", api_base=app.config["API_BASE"])
+    return render_page("book.html", page="book")
 
 
 @app.route("/user/rebook")
 def user_rebook_page():
-    return render_template("rebook.html", page="rebook", api_base=app.config["API_BASE"])
+    return render_page("rebook.html", page="rebook")
 
 
 @app.route("/user/firstaid")
 def user_firstaid_page():
-    return render_template("firstaid.html", page="firstaid", api_base=app.config["API_BASE"])
+    return render_page("firstaid.html", page="firstaid")
 
 
 @app.route("/user/qr")
 def user_qr_page():
-    return render_template("qr.html", page="qr", api_base=app.config["API_BASE"])
+    return render_page("qr.html", page="qr")
 
 
 @app.route("/hospital/register")
 def hospital_register_page():
-    return render_template("hospital_register.html", page="hospital-register", api_base=app.config["API_BASE"])
+    return render_page("hospital_register.html", page="hospital-register")
 
 
 @app.route("/hospital/login")
 def hospital_login_page():
-    return render_template("hospital_login.html", page="hospital-login", api_base=app.config["API_BASE"])
+    return render_page("hospital_login.html", page="hospital-login")
 
 
 @app.route("/hospital/dashboard")
 def hospital_dashboard_page():
-    return render_template("hospital_dashboard.html", page="hospital-dashboard", api_base=app.config["API_BASE"])
+    return render_page("hospital_dashboard.html", page="hospital-dashboard")
 
 
 @app.route("/doctor/dashboard")
 def doctor_dashboard_page():
-    return render_template(
+    return render_page(
         "doctor_dashboard.html",
         page="doctor-dashboard",
-        api_base=app.config["API_BASE"],
         google_calendar_embed_url=app.config.get("GOOGLE_CALENDAR_EMBED_URL", ""),
     )
 
 
 @app.route("/hospital/<hospital_id>")
 def hospital_public_page(hospital_id: str):
-    return render_template(
-        "hospital_view.html",
-        page="hospital-view",
-        hospital_id=hospital_id,
-        api_base=app.config["API_BASE"],
-    )
+    return render_page("hospital_view.html", page="hospital-view", hospital_id=hospital_id)
 
 
 @app.get("/api/health")
@@ -206,7 +443,30 @@ def health():
     return jsonify({"ok": True, "timestamp": datetime.utcnow().isoformat()})
 
 
+def _metrics_allowed() -> bool:
+    token = app.config["METRICS_TOKEN"]
+    supplied = request.headers.get("Authorization", "").encode()
+    if not token:
+        return app.config["METRICS_PUBLIC"]
+    return hmac.compare_digest(supplied, f"Bearer {token}".encode())
+
+
+@app.get("/api/metrics")
+def prometheus_metrics():
+    if not _metrics_allowed():
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.get("/api/metrics/slow-queries")
+def slow_queries():
+    if not _metrics_allowed():
+        return jsonify({"error": "Unauthorized"}), 401
+    return jsonify(metrics.slow_queries())
+
+
 @app.post("/api/users/register")
+@admit("register")
 def register_user():
     try:
         data = request.get_json(force=True) or {}
@@ -221,18 +481,20 @@ def register_user():
         if not name or not email or not password:
             return jsonify({"error": "Missing required fields"}), 400
 
+        # Checked up front so duplicates don't cost a password hash; the UNIQUE index still guards races.
         exists = get_one("SELECT id FROM users WHERE email = ?", (email,))
         if exists:
             return jsonify({"error": "Email already registered"}), 400
 
         user_id = str(uuid.uuid4())
-        password_hash = generate_password_hash(password)
+        password_hash = passwords.hash(password)
         age = calc_age(data.get("dob"))
 
-        run(
+        created = mutate_one(
             """
             INSERT INTO users (id, name, email, mobile, password_hash, height, weight, dob, age, address, latitude, longitude)
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            RETURNING *
             """,
             (
                 user_id,
@@ -250,14 +512,18 @@ def register_user():
             ),
         )
 
-        user = sanitize_user(get_one("SELECT * FROM users WHERE id = ?", (user_id,)))
-        return jsonify({"user": user})
+        return jsonify({"user": sanitize_user(created)})
+    except sqlite3.IntegrityError:
+        return jsonify({"error": "Email already registered"}), 400
+    except PasswordServiceBusy:
+        return busy_response("Server is busy, please retry shortly")
     except Exception as exc:  # pragma: no cover
         app.logger.exception("Error in register_user")
         return jsonify({"error": f"Server error while registering user: {exc}"}), 500
 
 
 @app.post("/api/users/login")
+@admit("login", account_field="email")
 def login_user():
     try:
         data = request.get_json(force=True) or {}
@@ -269,10 +535,17 @@ def login_user():
         password = data.get("password", "")
 
         user = get_one("SELECT * FROM users WHERE email = ?", (email,))
-        if not user or not check_password_hash(user["password_hash"], password):
+        if not user:
+            return jsonify({"error": "Invalid credentials"}), 401
+        ok, upgraded_hash = passwords.verify(user["password_hash"], password)
+        if not ok:
             return jsonify({"error": "Invalid credentials"}), 401
+        if upgraded_hash:
+            run("UPDATE users SET password_hash = ? WHERE id = ?", (upgraded_hash, user["id"]))
 
         return jsonify({"user": sanitize_user(user)})
+    except PasswordServiceBusy:
+        return busy_response("Server is busy, please retry shortly")
     except Exception as exc:  # pragma: no cover
         app.logger.exception("Error in login_user")
         return jsonify({"error": f"Server error while logging in: {exc}"}), 500
@@ -280,19 +553,18 @@ def login_user():
 
 @app.get("/api/users/<user_id>")
 def get_user(user_id: str):
-    user = sanitize_user(get_one("SELECT * FROM users WHERE id = ?", (user_id,)))
-    if not user:
-        return jsonify({"error": "User not found"}), 404
-    return jsonify({"user": user})
+    def build():
+        user = sanitize_user(get_one("SELECT * FROM users WHERE id = ?", (user_id,)))
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+        return jsonify({"user": user})
+
+    return conditional_response(("user", user_id, row_version("user", user_id)), "private, no-cache", build)
 
 
 @app.put("/api/users/<user_id>")
 def update_user(user_id: str):
     data = request.get_json(force=True) or {}
-    existing = get_one("SELECT * FROM users WHERE id = ?", (user_id,))
-    if not existing:
-        return jsonify({"error": "User not found"}), 404
-
     allowed = {
         "name": "name",
         "mobile": "mobile",
@@ -313,13 +585,16 @@ def update_user(user_id: str):
     if updates:
         set_clause = ", ".join([f"{col} = ?" for col, _ in updates])
         params = [val for _, val in updates] + [user_id]
-        run(f"UPDATE users SET {set_clause} WHERE id = ?", params)
-
-    user = sanitize_user(get_one("SELECT * FROM users WHERE id = ?", (user_id,)))
-    return jsonify({"user": user})
+        user = mutate_one(f"UPDATE users SET {set_clause} WHERE id = ? RETURNING *", params)
+    else:
+        user = get_one("SELECT * FROM users WHERE id = ?", (user_id,))
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify({"user": sanitize_user(user)})
 
 
 @app.post("/api/hospitals/register")
+@admit("register")
 def register_hospital():
     try:
         data = request.get_json(force=True) or {}
@@ -331,63 +606,87 @@ def register_hospital():
         if any(not data.get(f) for f in required):
             return jsonify({"error": "Missing required fields"}), 400
 
-        existing = get_one("SELECT id FROM hospitals WHERE email = ?", (data.get("email"),))
+        # Checked up front so duplicates don't cost a password hash; the UNIQUE index still guards races.
+        existing = get_one("SELECT hospital_id FROM hospital_shards WHERE email = ?", (data.get("email"),))
         if existing:
             return jsonify({"error": "Email already registered"}), 400
 
         hospital_id = str(uuid.uuid4())
         doctor_id = str(uuid.uuid4())
-        password_hash = generate_password_hash(data.get("password"))
-
-        run(
-            """
-            INSERT INTO hospitals (id, name, email, password_hash, emergency, morning_from, morning_to, evening_from, evening_to, address, latitude, longitude)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                hospital_id,
-                data.get("name"),
-                data.get("email"),
-                password_hash,
-                1 if data.get("emergency") else 0,
-                data.get("morningFrom") or data.get("morning_from"),
-                data.get("morningTo") or data.get("morning_to"),
-                data.get("eveningFrom") or data.get("evening_from"),
-                data.get("eveningTo") or data.get("evening_to"),
-                data.get("address"),
-                data.get("latitude"),
-                data.get("longitude"),
-            ),
-        )
-
-        run(
-            """
-            INSERT INTO doctors (id, hospital_id, name, qualification, specialization, description, latitude, longitude)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (
-                doctor_id,
-                hospital_id,
-                data.get("doctorName"),
-                data.get("doctorQualification"),
-                data.get("doctorSpecialization"),
-                data.get("doctorDescription"),
-                data.get("latitude"),
-                data.get("longitude"),
-            ),
-        )
-
-        hospital = sanitize_hospital(get_one("SELECT * FROM hospitals WHERE id = ?", (hospital_id,)))
-        doctor = get_one("SELECT * FROM doctors WHERE id = ?", (doctor_id,))
+        password_hash = passwords.hash(data.get("password"))
+        shard = place_hospital(hospital_id)
+
+        # The home database's directory row claims the email across shards and commits first,
+        # so no hospital is ever on a shard without one; a failed shard insert deletes it again.
+        # A crash in between leaves an entry with no hospital, which login treats as unknown
+        # and `python shards.py prune` removes.
+        with transaction():
+            run(
+                "INSERT INTO hospital_shards (hospital_id, shard, email) VALUES (?, ?, ?)",
+                (hospital_id, shard, data.get("email")),
+            )
+        try:
+            # Hospital and its doctor are committed together; a crash can't leave a doctorless hospital.
+            with use_shard(shard), transaction():
+                hospital = mutate_one(
+                    """
+                    INSERT INTO hospitals (id, name, email, password_hash, emergency, morning_from, morning_to, evening_from, evening_to, address, latitude, longitude)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    RETURNING *
+                    """,
+                    (
+                        hospital_id,
+                        data.get("name"),
+                        data.get("email"),
+                        password_hash,
+                        1 if data.get("emergency") else 0,
+                        data.get("morningFrom") or data.get("morning_from"),
+                        data.get("morningTo") or data.get("morning_to"),
+                        data.get("eveningFrom") or data.get("evening_from"),
+                        data.get("eveningTo") or data.get("evening_to"),
+                        data.get("address"),
+                        data.get("latitude"),
+                        data.get("longitude"),
+                    ),
+                )
+
+                doctor = mutate_one(
+                    """
+                    INSERT INTO doctors (id, hospital_id, name, qualification, specialization, description, latitude, longitude)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    RETURNING *
+                    """,
+                    (
+                        doctor_id,
+                        hospital_id,
+                        data.get("doctorName"),
+                        data.get("doctorQualification"),
+                        data.get("doctorSpecialization"),
+                        data.get("doctorDescription"),
+                        data.get("latitude"),
+                        data.get("longitude"),
+                    ),
+                )
+        except BaseException:
+            with transaction():
+                run("DELETE FROM hospital_shards WHERE hospital_id = ?", (hospital_id,))
+            raise
+
+        hospital = sanitize_hospital(hospital)
         if hospital is not None:
             hospital["doctor"] = doctor
         return jsonify({"hospital": hospital, "doctor": doctor})
+    except sqlite3.IntegrityError:
+        return jsonify({"error": "Email already registered"}), 400
+    except PasswordServiceBusy:
+        return busy_response("Server is busy, please retry shortly")
     except Exception as exc:  # pragma: no cover
         app.logger.exception("Error in register_hospital")
         return jsonify({"error": f"Server error while registering hospital: {exc}"}), 500
 
 
 @app.post("/api/hospitals/login")
+@admit("login", account_field="email")
 def login_hospital():
     try:
         data = request.get_json(force=True) or {}
@@ -398,37 +697,68 @@ def login_hospital():
         email = data.get("email")
         password = data.get("password", "")
 
-        hospital = get_one("SELECT * FROM hospitals WHERE email = ?", (email,))
-        if not hospital or not check_password_hash(hospital["password_hash"], password):
+        entry = get_one("SELECT hospital_id, shard FROM hospital_shards WHERE email = ?", (email,))
+        if not entry:
             return jsonify({"error": "Invalid credentials"}), 401
-
-        doctor = get_one("SELECT * FROM doctors WHERE hospital_id = ?", (hospital["id"],))
+        with use_shard(entry["shard"]):
+            hospital = get_one("SELECT * FROM hospitals WHERE id = ?", (entry["hospital_id"],))
+            if not hospital:
+                return jsonify({"error": "Invalid credentials"}), 401
+            ok, upgraded_hash = passwords.verify(hospital["password_hash"], password)
+            if not ok:
+                return jsonify({"error": "Invalid credentials"}), 401
+            if upgraded_hash:
+                run("UPDATE hospitals SET password_hash = ? WHERE id = ?", (upgraded_hash, hospital["id"]))
+
+            cached = hospital_cache.get(hospital["id"])
+        doctor = cached[1]["doctor"] if cached else None
         hospital_out = sanitize_hospital(hospital)
         if hospital_out is not None:
             hospital_out["doctor"] = doctor
         return jsonify({"hospital": hospital_out, "doctor": doctor})
+    except PasswordServiceBusy:
+        return busy_response("Server is busy, please retry shortly")
     except Exception as exc:  # pragma: no cover
         app.logger.exception("Error in login_hospital")
         return jsonify({"error": f"Server error while logging in hospital: {exc}"}), 500
 
 
-@app.get("/api/hospitals/<hospital_id>")
-def get_hospital(hospital_id: str):
+def _load_hospital(hospital_id: str) -> dict | None:
     hospital = sanitize_hospital(get_one("SELECT * FROM hospitals WHERE id = ?", (hospital_id,)))
     if not hospital:
+        return None
+    hospital["doctor"] = get_one("SELECT * FROM doctors WHERE hospital_id = ?", (hospital_id,))
+    return hospital
+
+
+# Cached values are shared between requests; handlers must not mutate them.
+hospital_cache = VersionedCache(
+    "hospital",
+    _load_hospital,
+    maxsize=app.config["HOSPITAL_CACHE_SIZE"],
+    check_interval=app.config["ENTITY_CACHE_CHECK_MS"] / 1000,
+    # Bumped by every hospital and doctor write, whichever worker made it.
+    scope=("table", "search"),
+)
+
+
+@app.get("/api/hospitals/<hospital_id>")
+def get_hospital(hospital_id: str):
+    with use_shard(locate("hospitals", hospital_id)):
+        cached = hospital_cache.get(hospital_id)
+    if cached is None:
         return jsonify({"error": "Hospital not found"}), 404
-    doctor = get_one("SELECT * FROM doctors WHERE hospital_id = ?", (hospital_id,))
-    hospital["doctor"] = doctor
-    return jsonify({"hospital": hospital, "doctor": doctor})
+    version, hospital = cached
+
+    def build():
+        return jsonify({"hospital": hospital, "doctor": hospital["doctor"]})
+
+    return conditional_response(("hospital", hospital_id, version), "private, no-cache", build)
 
 
 @app.put("/api/hospitals/<hospital_id>")
 def update_hospital(hospital_id: str):
     data = request.get_json(force=True) or {}
-    existing = get_one("SELECT * FROM hospitals WHERE id = ?", (hospital_id,))
-    if not existing:
-        return jsonify({"error": "Hospital not found"}), 404
-
     allowed = {
         "name": "name",
         "address": "address",
@@ -448,25 +778,27 @@ def update_hospital(hospital_id: str):
                 val = 1 if bool(val) else 0
             updates.append((col, val))
 
-    if updates:
-        set_clause = ", ".join([f"{col} = ?" for col, _ in updates])
-        params = [val for _, val in updates] + [hospital_id]
-        run(f"UPDATE hospitals SET {set_clause} WHERE id = ?", params)
-
-    hospital = sanitize_hospital(get_one("SELECT * FROM hospitals WHERE id = ?", (hospital_id,)))
-    doctor = get_one("SELECT * FROM doctors WHERE hospital_id = ?", (hospital_id,))
-    if hospital is not None:
-        hospital["doctor"] = doctor
-    return jsonify({"hospital": hospital, "doctor": doctor})
+    with use_shard(locate("hospitals", hospital_id)):
+        if updates:
+            set_clause = ", ".join([f"{col} = ?" for col, _ in updates])
+            params = [val for _, val in updates] + [hospital_id]
+            hospital = mutate_one(f"UPDATE hospitals SET {set_clause} WHERE id = ? RETURNING *", params)
+            hospital_cache.invalidate(hospital_id)
+            if not hospital:
+                return jsonify({"error": "Hospital not found"}), 404
+            hospital = sanitize_hospital(hospital)
+            hospital["doctor"] = get_one("SELECT * FROM doctors WHERE hospital_id = ?", (hospital_id,))
+        else:
+            cached = hospital_cache.get(hospital_id)
+            if cached is None:
+                return jsonify({"error": "Hospital not found"}), 404
+            hospital = cached[1]
+    return jsonify({"hospital": hospital, "doctor": hospital["doctor"]})
 
 
 @app.put("/api/doctors/<doctor_id>")
 def update_doctor(doctor_id: str):
     data = request.get_json(force=True) or {}
-    existing = get_one("SELECT * FROM doctors WHERE id = ?", (doctor_id,))
-    if not existing:
-        return jsonify({"error": "Doctor not found"}), 404
-
     allowed = {
         "name": "name",
         "qualification": "qualification",
@@ -474,62 +806,166 @@ def update_doctor(doctor_id: str):
         "description": "description",
         "latitude": "latitude",
         "longitude": "longitude",
+        "slot_capacity": "slot_capacity",
     }
     updates: list[tuple[str, object]] = []
     for key, col in allowed.items():
         if key in data:
             updates.append((col, data.get(key)))
+    for col, val in updates:
+        if col == "slot_capacity" and (isinstance(val, bool) or not isinstance(val, int) or val < 0):
+            return jsonify({"error": "slot_capacity must be a non-negative integer"}), 400
+
+    with use_shard(locate("doctors", doctor_id)):
+        if updates:
+            set_clause = ", ".join([f"{col} = ?" for col, _ in updates])
+            params = [val for _, val in updates] + [doctor_id]
+            doctor = mutate_one(f"UPDATE doctors SET {set_clause} WHERE id = ? RETURNING *", params)
+            if doctor:
+                hospital_cache.invalidate(doctor["hospital_id"])
+        else:
+            doctor = get_one("SELECT * FROM doctors WHERE id = ?", (doctor_id,))
+    if not doctor:
+        return jsonify({"error": "Doctor not found"}), 404
+    return jsonify({"doctor": doctor})
 
-    if updates:
-        set_clause = ", ".join([f"{col} = ?" for col, _ in updates])
-        params = [val for _, val in updates] + [doctor_id]
-        run(f"UPDATE doctors SET {set_clause} WHERE id = ?", params)
 
-    doctor = get_one("SELECT * FROM doctors WHERE id = ?", (doctor_id,))
-    return jsonify({"doctor": doctor})
+def _fts_query(text: str, column: str | None = None) -> str:
+    """Build an FTS5 MATCH expression where every word of ``text`` is a prefix term."""
+    terms = [f'"{word}"*' for word in re.findall(r"\w+", text)]
+    if not terms:
+        return ""
+    expr = " AND ".join(terms)
+    return f"{column} : ({expr})" if column else expr
+
+
+def _parse_float(value: str | None) -> float | None:
+    if value is None or value == "":
+        return None
+    try:
+        parsed = float(value)
+    except ValueError:
+        return None
+    return parsed if math.isfinite(parsed) else None
+
+
+def _parse_limit(value: str | None, default: int | None) -> int | None:
+    try:
+        limit = int(value) if value else default
+    except ValueError:
+        limit = default
+    if limit is None:
+        return None
+    return max(1, min(limit, app.config["SEARCH_MAX_LIMIT"]))
 
 
 @app.get("/api/doctors/search")
 def search_doctors():
+    # Any hospital or doctor write bumps its shard's 'search' counter, invalidating every cached result.
+    args = tuple(sorted(request.args.items(multi=True)))
+    return conditional_response(
+        ("search", args, tuple(scatter(lambda: row_version("table", "search")))),
+        f"public, max-age={app.config['SEARCH_CACHE_MAX_AGE']}",
+        _search_doctors,
+    )
+
+
+def _search_doctors():
     specialization = (request.args.get("specialization") or "").strip()
-    user_lat = request.args.get("userLat")
-    user_lng = request.args.get("userLng")
+    text = (request.args.get("q") or "").strip()
+    lat = _parse_float(request.args.get("userLat"))
+    lng = _parse_float(request.args.get("userLng"))
+    radius_km = _parse_float(request.args.get("radiusKm"))
+    for name, value in (("userLat", lat), ("userLng", lng), ("radiusKm", radius_km)):
+        if value is None and request.args.get(name):
+            return jsonify({"error": f"{name} must be a finite number"}), 400
+    if (lat is not None and abs(lat) > 90) or (lng is not None and abs(lng) > 180):
+        return jsonify({"error": "userLat must be within ±90 and userLng within ±180"}), 400
+
+    match = " AND ".join(
+        expr for expr in (_fts_query(specialization, "specialization"), _fts_query(text)) if expr
+    )
 
     where = []
     params: list[object] = []
-    if specialization:
-        where.append("(d.specialization = ? OR d.specialization LIKE ?)")
-        params.extend([specialization, f"%{specialization}%"])
-    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
-
-    doctors = get_all(
-        f"""
-        SELECT
-          d.*, h.name AS hospital_name, h.address AS hospital_address,
-          h.latitude AS hospital_latitude, h.longitude AS hospital_longitude
-        FROM doctors d
-        JOIN hospitals h ON h.id = d.hospital_id
-        {where_sql}
-        """,
-        params,
+    if match:
+        where.append("d.rowid IN (SELECT rowid FROM doctors_fts WHERE doctors_fts MATCH ?)")
+        params.append(match)
+
+    # Every shard answers the query and the per-shard results, each already in order,
+    # are merged and cut to the limit.
+    if lat is not None and lng is not None:
+        limit = _parse_limit(request.args.get("limit"), app.config["SEARCH_DEFAULT_LIMIT"])
+        and_sql = "".join(f" AND {clause}" for clause in where)
+        within = radius_km is not None and radius_km > 0
+        if within:
+            found = scatter(lambda: doctors_within(lat, lng, radius_km, and_sql, params, limit=limit))
+        else:
+            found = scatter(lambda: nearest_doctors(lat, lng, limit, and_sql, params))
+        doctors = list(itertools.islice(heapq.merge(*found, key=lambda d: d["distance_km"]), limit))
+        # Without a radius, doctors at hospitals without coordinates trail the ranked results.
+        for shard in [] if within else shard_names():
+            if len(doctors) >= limit:
+                break
+            with use_shard(shard):
+                unlocated = get_all(
+                    f"""
+                    SELECT
+                      d.*, h.name AS hospital_name, h.address AS hospital_address,
+                      h.latitude AS hospital_latitude, h.longitude AS hospital_longitude,
+                      NULL AS distance_km
+                    FROM doctors d
+                    JOIN hospitals h ON h.id = d.hospital_id
+                    WHERE h.rowid NOT IN (SELECT id FROM hospitals_geo){and_sql}
+                    LIMIT ?
+                    """,
+                    [*params, limit - len(doctors)],
+                )
+            doctors.extend(unlocated)
+        return jsonify({"doctors": doctors})
+
+    limit = _parse_limit(request.args.get("limit"), None)
+    limit_sql = "LIMIT ?" if limit else ""
+
+    if match:
+        # Without a location, keyword matches are ranked by bm25 (name and specialization weigh most).
+        # Scores use each shard's own term statistics, which is close enough to merge on.
+        found = scatter(
+            lambda: get_all(
+                f"""
+                SELECT
+                  d.*, h.name AS hospital_name, h.address AS hospital_address,
+                  h.latitude AS hospital_latitude, h.longitude AS hospital_longitude,
+                  bm25(doctors_fts, 3.0, 1.0, 2.0, 0.5) AS search_rank
+                FROM doctors_fts f
+                JOIN doctors d ON d.rowid = f.rowid
+                JOIN hospitals h ON h.id = d.hospital_id
+                WHERE doctors_fts MATCH ?
+                ORDER BY search_rank
+                {limit_sql}
+                """,
+                [match, limit] if limit else [match],
+            )
+        )
+        doctors = list(itertools.islice(heapq.merge(*found, key=lambda d: d["search_rank"]), limit))
+        for doctor in doctors:
+            del doctor["search_rank"]
+        return jsonify({"doctors": doctors})
+
+    found = scatter(
+        lambda: get_all(
+            f"""
+            SELECT
+              d.*, h.name AS hospital_name, h.address AS hospital_address,
+              h.latitude AS hospital_latitude, h.longitude AS hospital_longitude
+            FROM doctors d
+            JOIN hospitals h ON h.id = d.hospital_id
+            {limit_sql}
+            """,
+            [limit] if limit else [],
+        )
     )
-
-    if user_lat and user_lng:
-        try:
-            lat = float(user_lat)
-            lng = float(user_lng)
-            for doc in doctors:
-                hlat = doc.get("hospital_latitude")
-                hlng = doc.get("hospital_longitude")
-                if hlat is None or hlng is None:
-                    doc["distance_km"] = None
-                else:
-                    doc["distance_km"] = haversine_km(lat, lng, float(hlat), float(hlng))
-            doctors.sort(key=lambda d: (d.get("distance_km") is None, d.get("distance_km") or 0))
-        except ValueError:
-            pass
-
-    return jsonify({"doctors": doctors})
+    return jsonify({"doctors": list(itertools.islice(itertools.chain(*found), limit))})
 
 
 @app.post("/api/appointments")
@@ -538,44 +974,250 @@ def create_appointment():
     required = ["userId", "hospitalId", "doctorId"]
     if any(not data.get(k) for k in required):
         return jsonify({"error": "Missing required fields"}), 400
+    # Users live in the home database, so a shard can't enforce the foreign key.
+    if not get_one("SELECT 1 FROM users WHERE id = ?", (data["userId"],)):
+        return jsonify({"error": "User not found"}), 404
 
-    appt_id = str(uuid.uuid4())
-    run(
+    shard = locate("hospitals", data["hospitalId"])
+    with use_shard(shard):
+        resp = _book_appointment(data)
+    events.tail_for(shard).poke()
+    return resp
+
+
+def _book_appointment(data: dict):
+    schedule = doctor_schedule(data["doctorId"])
+    if not schedule or schedule["hospital_id"] != data["hospitalId"]:
+        return jsonify({"error": "Doctor not found at this hospital"}), 404
+
+    slot_start = None
+    capacity_check = ""
+    capacity_params: list[object] = []
+    if data.get("slotStart"):
+        tz = _parse_tz(data.get("tz"))
+        if tz is None:
+            return jsonify({"error": f"Unknown timezone: {data.get('tz')}"}), 400
+        try:
+            slot_start = parse_slot(data["slotStart"], schedule, datetime.now(tz).replace(tzinfo=None))
+        except SlotError as exc:
+            return jsonify({"error": str(exc)}), 400
+        # Checked in the INSERT itself under the writer lock, so concurrent bookings from
+        # any worker see each other's counts and a slot can't be overbooked.
+        capacity_check = """
+            WHERE COALESCE((SELECT booked FROM slot_bookings WHERE doctor_id = ? AND slot_start = ?), 0)
+                  < (SELECT slot_capacity FROM doctors WHERE id = ?)
         """
-        INSERT INTO appointments (id, user_id, hospital_id, doctor_id, problem, status, preferred_time)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            appt_id,
-            data.get("userId"),
-            data.get("hospitalId"),
-            data.get("doctorId"),
-            data.get("problem"),
-            "Booked",
-            data.get("preferredTime"),
-        ),
-    )
-    appt = get_one("SELECT * FROM appointments WHERE id = ?", (appt_id,))
+        capacity_params = [data["doctorId"], slot_start, data["doctorId"]]
+
+    appt_id = str(uuid.uuid4())
+    with transaction():
+        appt = mutate_one(
+            f"""
+            INSERT INTO appointments (id, user_id, hospital_id, doctor_id, problem, status, preferred_time, slot_start)
+            SELECT ?, ?, ?, ?, ?, ?, ?, ?
+            {capacity_check}
+            RETURNING *
+            """,
+            (
+                appt_id,
+                data.get("userId"),
+                data.get("hospitalId"),
+                data.get("doctorId"),
+                data.get("problem"),
+                "Booked",
+                data.get("preferredTime") or slot_start,
+                slot_start,
+                *capacity_params,
+            ),
+        )
+        if appt:
+            _publish_appointment("appointment.created", appt_id)
+    if not appt:
+        return jsonify({"error": "That slot is fully booked"}), 409
     return jsonify({"appointment": appt})
 
 
-def _list_appointments(where_sql: str = "", params: list[object] | None = None) -> list[dict]:
-    params = params or []
-    return get_all(
-        f"""
+@app.get("/api/doctors/availability")
+def doctors_availability():
+    doctor_ids = [i for i in (request.args.get("doctorIds") or "").split(",") if i]
+    if not doctor_ids:
+        return jsonify({"error": "doctorIds is required"}), 400
+    if len(doctor_ids) > app.config["SEARCH_MAX_LIMIT"]:
+        return jsonify({"error": f"At most {app.config['SEARCH_MAX_LIMIT']} doctorIds per request"}), 400
+    tz = _parse_tz(request.args.get("tz"))
+    if tz is None:
+        return jsonify({"error": f"Unknown timezone: {request.args.get('tz')}"}), 400
+    now = datetime.now(tz).replace(tzinfo=None)
+    try:
+        first_day = date.fromisoformat(request.args["from"]) if request.args.get("from") else now.date()
+    except ValueError:
+        return jsonify({"error": "from must be YYYY-MM-DD"}), 400
+    days = _parse_limit(request.args.get("days"), app.config["AVAILABILITY_DAYS"])
+    days = min(days, app.config["AVAILABILITY_MAX_DAYS"])
+    slots = {}
+    for found in scatter(lambda: availability(doctor_ids, first_day, days, now)):
+        slots.update(found)
+    return jsonify({"from": first_day.isoformat(), "days": days, "availability": slots})
+
+
+SQL_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def _parse_tz(name: str | None) -> ZoneInfo | None:
+    """IANA zone for ``name`` (UTC when empty); None when unknown."""
+    try:
+        return ZoneInfo(name or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def utc_day_bounds(day: date, tz: timezone | ZoneInfo) -> tuple[str, str]:
+    """UTC ``[start, end)`` of the local calendar ``day`` in ``tz``, formatted like CURRENT_TIMESTAMP."""
+    start = datetime.combine(day, datetime.min.time(), tzinfo=tz).astimezone(timezone.utc)
+    end = datetime.combine(day + timedelta(days=1), datetime.min.time(), tzinfo=tz).astimezone(timezone.utc)
+    return start.strftime(SQL_TIMESTAMP_FORMAT), end.strftime(SQL_TIMESTAMP_FORMAT)
+
+
+class CursorError(ValueError):
+    pass
+
+
+def _encode_cursor(row: dict) -> str:
+    raw = f"{row['created_at']}|{row['id']}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(value: str) -> tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4)).decode()
+    except (binascii.Error, UnicodeDecodeError) as exc:
+        raise CursorError("Invalid cursor") from exc
+    created_at, sep, appt_id = raw.partition("|")
+    if not sep or not created_at or not appt_id:
+        raise CursorError("Invalid cursor")
+    return created_at, appt_id
+
+
+def _appointments_sql(
+    where: list[str], params: list[object], after: str | None, limit: int | None, source: str = "appointments"
+):
+    where = list(where)
+    params = list(params)
+    if after:
+        created_at, appt_id = _decode_cursor(after)
+        # Keyset on (created_at, id): rows strictly after the cursor in DESC order.
+        where.append("(a.created_at < ? OR (a.created_at = ? AND a.id < ?))")
+        params.extend([created_at, created_at, appt_id])
+    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
+    limit_sql = ""
+    if limit:
+        # One extra row tells us whether another page exists.
+        limit_sql = "LIMIT ?"
+        params.append(limit + 1)
+    sql = f"""
         SELECT
           a.*,
           a.problem AS reason,
           u.name AS user_name,
           u.email AS user_email,
           u.mobile AS user_mobile
-        FROM appointments a
+        FROM {source} a
         LEFT JOIN users u ON u.id = a.user_id
         {where_sql}
-        ORDER BY a.created_at DESC
-        """,
-        params,
-    )
+        ORDER BY a.created_at DESC, a.id DESC
+        {limit_sql}
+        """
+    return sql, params
+
+
+def _stream_appointments(rows, limit: int | None):
+    yield '{"appointments": ['
+    last = None
+    count = 0
+    has_more = False
+    for row in rows:
+        if limit and count == limit:
+            has_more = True
+            break
+        yield ("," if count else "") + app.json.dumps(row)
+        last = row
+        count += 1
+    yield "]"
+    if limit:
+        next_cursor = _encode_cursor(last) if has_more and last else None
+        yield ', "nextCursor": ' + app.json.dumps(next_cursor)
+    yield "}"
+
+
+def _merge_appointments(sources):
+    """Interleave per-shard results, each newest first, into one newest-first sequence."""
+    last_id = None
+    for row in heapq.merge(*sources, key=lambda r: (r["created_at"] or "", r["id"]), reverse=True):
+        # An interrupted archival can leave a row both archived and live in another shard.
+        if row["id"] != last_id:
+            yield row
+        last_id = row["id"]
+
+
+def _list_appointments(
+    where: list[str] | None = None,
+    params: list[object] | None = None,
+    archive_months: list[str] | None = None,
+    shards: list[str] | None = None,
+):
+    """Respond with appointments matching ``where``, newest first.
+
+    Honours the ``limit``/``after`` keyset-pagination args and ``stream=1``, which writes
+    the JSON array straight from the cursor instead of materialising it. With
+    ``archive_months`` the query also covers those monthly archives. With several
+    ``shards`` each is queried for a page and the pages are merged.
+    """
+    try:
+        limit = int(request.args["limit"]) if request.args.get("limit") else None
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit is not None:
+        limit = max(1, min(limit, app.config["APPOINTMENTS_MAX_LIMIT"]))
+    try:
+        sql, sql_params = _appointments_sql(where or [], params or [], request.args.get("after"), limit)
+    except CursorError as exc:
+        return jsonify({"error": str(exc)}), 400
+    stream = request.args.get("stream", "").lower() in {"1", "true", "yes"}
+    shards = shards or shard_names()
+
+    sources = []
+    for index, shard in enumerate(shards):
+        with use_shard(shard):
+            # Archives hold every shard's rows, so only the first shard reads them.
+            if archive_months and index == 0:
+                build = lambda source: _appointments_sql(  # noqa: E731
+                    where or [], params or [], request.args.get("after"), limit, source=source
+                )
+                rows = archive.fanout_rows("appointments", archive_months, build)
+                try:
+                    # Attaching happens on the first step, so range errors surface before streaming starts.
+                    first = next(rows, None)
+                except archive.ArchiveRangeError as exc:
+                    return jsonify({"error": str(exc)}), 400
+                rows = itertools.chain([first] if first is not None else [], rows)
+            elif stream or len(shards) > 1:
+                rows = iter_rows(sql, sql_params)
+            else:
+                rows = get_all(sql, sql_params)
+        sources.append(rows)
+    rows = sources[0] if len(sources) == 1 else _merge_appointments(sources)
+
+    if stream:
+        return Response(_stream_appointments(rows, limit), mimetype="application/json")
+
+    appointments = list(itertools.islice(rows, limit + 1 if limit else None))
+    if limit is None:
+        return jsonify({"appointments": appointments})
+    next_cursor = None
+    if len(appointments) > limit:
+        appointments = appointments[:limit]
+        next_cursor = _encode_cursor(appointments[-1])
+    return jsonify({"appointments": appointments, "nextCursor": next_cursor})
 
 
 @app.get("/api/appointments")
@@ -595,10 +1237,22 @@ def list_appointments():
     if hospital_id:
         where.append("a.hospital_id = ?")
         params.append(hospital_id)
-    where_sql = ("WHERE " + " AND ".join(where)) if where else ""
 
-    appointments = _list_appointments(where_sql, params)
-    return jsonify({"appointments": appointments})
+    # Hot rows only, unless a date range reaches back into archived months.
+    try:
+        created_from = date.fromisoformat(request.args["from"]) if request.args.get("from") else None
+        created_to = date.fromisoformat(request.args["to"]) + timedelta(days=1) if request.args.get("to") else None
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
+    if created_from:
+        where.append("a.created_at >= ?")
+        params.append(created_from.strftime(SQL_TIMESTAMP_FORMAT))
+    if created_to:
+        where.append("a.created_at < ?")
+        params.append(created_to.strftime(SQL_TIMESTAMP_FORMAT))
+    months = archive.months_between(created_from, created_to) if created_from else []
+
+    return _list_appointments(where, params, months, _appointment_shards(hospital_id, doctor_id))
 
 
 @app.get("/api/appointments/today")
@@ -606,26 +1260,149 @@ def list_today_appointments():
     doctor_id = request.args.get("doctorId")
     hospital_id = request.args.get("hospitalId")
 
-    where = ["date(a.created_at) = date('now')"]
-    params: list[object] = []
+    tz = _parse_tz(request.args.get("tz"))
+    if tz is None:
+        return jsonify({"error": f"Unknown timezone: {request.args.get('tz')}"}), 400
+    day_arg = request.args.get("date")
+    try:
+        day = date.fromisoformat(day_arg) if day_arg else datetime.now(tz).date()
+    except ValueError:
+        return jsonify({"error": "date must be YYYY-MM-DD"}), 400
+
+    # A plain range on created_at lets the (doctor_id|hospital_id, created_at) indexes serve it.
+    start, end = utc_day_bounds(day, tz)
+    where = ["a.created_at >= ?", "a.created_at < ?"]
+    params: list[object] = [start, end]
     if doctor_id:
         where.append("a.doctor_id = ?")
         params.append(doctor_id)
     if hospital_id:
         where.append("a.hospital_id = ?")
         params.append(hospital_id)
-    where_sql = "WHERE " + " AND ".join(where)
+    # Archival only takes rows older than ARCHIVE_AFTER_DAYS, so recent days (the dashboards'
+    # every poll) stay one indexed query on the live table. The day that far back may be
+    # partly archived already, hence the inclusive bound.
+    months: list[str] = []
+    if day <= datetime.now(tz).date() - timedelta(days=archive.ARCHIVE_AFTER_DAYS):
+        # The UTC bounds can fall in the neighbouring month.
+        months = archive.months_between(day - timedelta(days=1), day + timedelta(days=2))
+
+    return _list_appointments(where, params, months, _appointment_shards(hospital_id, doctor_id))
+
+
+@app.get("/api/stats")
+def appointment_stats():
+    hospital_id = request.args.get("hospitalId")
+    doctor_id = request.args.get("doctorId")
+    if not hospital_id and not doctor_id:
+        return jsonify({"error": "hospitalId or doctorId is required"}), 400
+    if hospital_id:
+        entity, entity_id, table = "hospital", hospital_id, "hospitals"
+    else:
+        entity, entity_id, table = "doctor", doctor_id, "doctors"
+    tz = _parse_tz(request.args.get("tz"))
+    if tz is None:
+        return jsonify({"error": f"Unknown timezone: {request.args.get('tz')}"}), 400
+    today = datetime.now(tz).date()
+    try:
+        first_day = date.fromisoformat(request.args["from"]) if request.args.get("from") else today
+        last_day = date.fromisoformat(request.args["to"]) if request.args.get("to") else max(first_day, today)
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD"}), 400
+    days = (last_day - first_day).days + 1
+    if days < 1:
+        return jsonify({"error": "to must not be before from"}), 400
+    if days > app.config["STATS_MAX_DAYS"]:
+        return jsonify({"error": f"At most {app.config['STATS_MAX_DAYS']} days per request"}), 400
+
+    with use_shard(locate(table, entity_id)):
+        if not get_one(f"SELECT 1 FROM {table} WHERE id = ?", (entity_id,)):
+            return jsonify({"error": f"{entity.capitalize()} not found"}), 404
+        report = stats.report(entity, entity_id, first_day, days, tz)
+    return jsonify(
+        {"entity": entity, "id": entity_id, "from": first_day.isoformat(), "to": last_day.isoformat(), **report}
+    )
+
+
+def _appointment_shards(hospital_id: str | None, doctor_id: str | None) -> list[str]:
+    """The one shard a hospital's or doctor's appointments live in; otherwise all of them."""
+    if hospital_id:
+        return [locate("hospitals", hospital_id)]
+    if doctor_id:
+        return [locate("doctors", doctor_id)]
+    return shard_names()
+
+
+def _publish_appointment(event_type: str, appt_id: str) -> None:
+    # Same row shape as the list endpoints, so dashboards can merge it in place.
+    sql, params = _appointments_sql(["a.id = ?"], [appt_id], None, None)
+    events.publish(event_type, get_one(sql, params))
 
-    appointments = _list_appointments(where_sql, params)
-    return jsonify({"appointments": appointments})
+
+# Column stamped when an appointment enters the status; the stats triggers read it.
+STATUS_TIMESTAMPS = {"In Consultation": "started_at", "Completed": "completed_at", "Cancelled": "cancelled_at"}
 
 
 def _set_appointment_status(appt_id: str, status: str):
-    existing = get_one("SELECT id FROM appointments WHERE id = ?", (appt_id,))
-    if not existing:
-        return None
-    run("UPDATE appointments SET status = ? WHERE id = ?", (status, appt_id))
-    return get_one("SELECT * FROM appointments WHERE id = ?", (appt_id,))
+    shard = locate("appointments", appt_id)
+    column = STATUS_TIMESTAMPS[status]
+    with use_shard(shard), transaction():
+        # Repeating the current status keeps the original time (SET sees the old row).
+        appt = mutate_one(
+            f"""
+            UPDATE appointments
+            SET status = ?, {column} = IIF(status IS ?, {column}, CURRENT_TIMESTAMP)
+            WHERE id = ? RETURNING *
+            """,
+            (status, status, appt_id),
+        )
+        if appt:
+            _publish_appointment("appointment.updated", appt_id)
+    events.tail_for(shard).poke()
+    return appt
+
+
+event_stream_slots = threading.BoundedSemaphore(max(1, app.config["EVENTS_MAX_STREAMS"]))
+
+def _event_stream(scope: str, scope_id: str):
+    raw = request.headers.get("Last-Event-ID") or request.args.get("lastEventId")
+    try:
+        last_event_id = int(raw) if raw else None
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID must be an integer"}), 400
+    if not event_stream_slots.acquire(blocking=False):
+        metrics.registry.inc("admission_rejected_total", {"policy": "events", "reason": "concurrency"})
+        # The dashboard polls instead while it is turned away.
+        return busy_response("Too many live feeds open, please retry shortly", retry_after=30)
+    try:
+        stream = events.stream(
+            scope,
+            scope_id,
+            last_event_id,
+            heartbeat=app.config["EVENTS_HEARTBEAT"],
+            max_age=app.config["EVENTS_STREAM_MAX_AGE"],
+            shard=locate("hospitals" if scope == "hospital" else "doctors", scope_id),
+        )
+        resp = Response(stream, mimetype="text/event-stream")
+    except BaseException:
+        event_stream_slots.release()
+        raise
+    # The server closes the response when the stream ends or the client goes away.
+    resp.call_on_close(event_stream_slots.release)
+    resp.headers["Cache-Control"] = "no-cache"
+    # Keep reverse proxies from buffering the stream.
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+
+@app.get("/api/hospitals/<hospital_id>/events")
+def hospital_events(hospital_id: str):
+    return _event_stream("hospital", hospital_id)
+
+
+@app.get("/api/doctors/<doctor_id>/events")
+def doctor_events(doctor_id: str):
+    return _event_stream("doctor", doctor_id)
 
 
 @app.put("/api/appointments/<appt_id>/cancel")
@@ -652,24 +1429,202 @@ def complete_appointment(appt_id: str):
     return jsonify({"appointment": appt})
 
 
+FIRSTAID_PREAMBLE = (
+    "You are a first-aid assistant. Provide safe, general advice, include urgent warning signs, "
+    "and recommend seeking professional care when appropriate.\n\n"
+)
+FIRSTAID_PENDING = {"queued", "running"}
+
+FIRSTAID_STOPWORDS = frozenset({"a", "an", "the", "my", "our", "your", "i", "im", "me", "please", "help"})
+
+firstaid_queue = JobQueue("firstaid", app.config["FIRSTAID_WORKERS"], app.config["FIRSTAID_QUEUE_DEPTH"])
+metrics.registry.add_collector(lambda reg: reg.set_gauge("firstaid_queue_depth", None, firstaid_queue.depth()))
+firstaid_lru = LRUCache(app.config["FIRSTAID_CACHE_LRU_SIZE"], ttl=app.config["FIRSTAID_CACHE_TTL"])
+
+
+def firstaid_prompt_key(prompt: str) -> str:
+    """Hash of the normalized prompt: case, punctuation, spacing and filler words are ignored."""
+    words = [w for w in re.findall(r"\w+", prompt.lower()) if w not in FIRSTAID_STOPWORDS]
+    normalized = " ".join(words) or prompt.strip().lower()
+    # The preamble is part of the key so rewording it invalidates earlier answers.
+    return hashlib.sha256(f"{FIRSTAID_PREAMBLE}\0{normalized}".encode()).hexdigest()
+
+
+def _firstaid_cached(key: str) -> tuple[str, str] | None:
+    hit = firstaid_lru.get(key)
+    if hit is not None:
+        return hit
+    row = get_one(
+        """
+        SELECT c.response_id, r.response
+        FROM firstaid_cache c
+        JOIN firstaid_responses r ON r.id = c.response_id
+        WHERE c.prompt_hash = ? AND c.expires_at > CURRENT_TIMESTAMP
+        """,
+        (key,),
+    )
+    if not row:
+        return None
+    hit = (row["response_id"], row["response"])
+    firstaid_lru.set(key, hit)
+    return hit
+
+
+def _store_firstaid_response(response: str) -> str:
+    # Content-addressed, so identical answers share one row however many chats point at them.
+    response_id = hashlib.sha256(response.encode()).hexdigest()
+    run("INSERT OR IGNORE INTO firstaid_responses (id, response) VALUES (?, ?)", (response_id, response))
+    return response_id
+
+
+def _cache_firstaid_response(key: str, response_id: str, response: str) -> None:
+    ttl = app.config["FIRSTAID_CACHE_TTL"]
+    with transaction():
+        run(
+            """
+            INSERT OR REPLACE INTO firstaid_cache (prompt_hash, response_id, created_at, expires_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP, datetime('now', ?))
+            """,
+            (key, response_id, f"+{ttl} seconds"),
+        )
+        run("DELETE FROM firstaid_cache WHERE expires_at <= CURRENT_TIMESTAMP")
+        run(
+            """
+            DELETE FROM firstaid_cache WHERE prompt_hash IN (
+                SELECT prompt_hash FROM firstaid_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (app.config["FIRSTAID_CACHE_MAX_ENTRIES"],),
+        )
+    firstaid_lru.set(key, (response_id, response))
+
+
+def _firstaid_answer(prompt: str) -> tuple[str, str]:
+    """Return ``(response_id, response)``, from cache when possible; raises GeminiError."""
+    key = firstaid_prompt_key(prompt)
+    hit = _firstaid_cached(key)
+    if hit is not None:
+        return hit
+    response = gemini_generate(FIRSTAID_PREAMBLE + prompt)
+    response_id = _store_firstaid_response(response)
+    _cache_firstaid_response(key, response_id, response)
+    return response_id, response
+
+
+def _record_firstaid_chat(user_id: str | None, prompt: str, response_id: str) -> str:
+    chat_id = str(uuid.uuid4())
+    run(
+        "INSERT INTO firstaid_chats (id, user_id, prompt, response_id) VALUES (?, ?, ?, ?)",
+        (chat_id, user_id, prompt, response_id),
+    )
+    return chat_id
+
+
+def _fail_firstaid_job(job_id: str, error: str) -> None:
+    run(
+        "UPDATE firstaid_jobs SET status = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+        (error, job_id),
+    )
+
+
+def _run_firstaid_job(job_id: str, user_id: str | None, prompt: str) -> None:
+    with app.app_context():
+        try:
+            run(
+                "UPDATE firstaid_jobs SET status = 'running', updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (job_id,),
+            )
+            response_id, _response = _firstaid_answer(prompt)
+            with transaction():
+                chat_id = _record_firstaid_chat(user_id, prompt, response_id)
+                run(
+                    "UPDATE firstaid_jobs SET status = 'done', chat_id = ?, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                    (chat_id, job_id),
+                )
+        except GeminiError as exc:
+            app.logger.warning("First-aid job %s failed: %s", job_id, exc)
+            _fail_firstaid_job(job_id, "First-aid assistant is unavailable, please try again later")
+        except Exception:
+            app.logger.exception("Error in first-aid job")
+            _fail_firstaid_job(job_id, "Server error while generating first aid")
+
+
+def _load_firstaid_job(job_id: str) -> dict | None:
+    job = get_one(
+        """
+        SELECT j.id, j.user_id, j.status, j.chat_id, j.error, j.created_at, j.updated_at,
+               COALESCE(c.response, r.response) AS response
+        FROM firstaid_jobs j
+        LEFT JOIN firstaid_chats c ON c.id = j.chat_id
+        LEFT JOIN firstaid_responses r ON r.id = c.response_id
+        WHERE j.id = ?
+        """,
+        (job_id,),
+    )
+    if job and job["status"] in FIRSTAID_PENDING:
+        # A job whose worker died (restart, crash) would otherwise stay pending forever.
+        updated = datetime.strptime(job["updated_at"], SQL_TIMESTAMP_FORMAT)
+        if (datetime.utcnow() - updated).total_seconds() > app.config["FIRSTAID_JOB_TIMEOUT"]:
+            _fail_firstaid_job(job_id, "First-aid request timed out")
+            job.update(status="failed", error="First-aid request timed out")
+    return job
+
+
 @app.post("/api/firstaid")
+@admit("firstaid", account_field="userId")
 def first_aid():
     data = request.get_json(force=True) or {}
     prompt = (data.get("prompt") or "").strip()
     if not prompt:
         return jsonify({"error": "Prompt is required"}), 400
 
-    response = call_gemini(
-        "You are a first-aid assistant. Provide safe, general advice, include urgent warning signs, and recommend seeking professional care when appropriate.\n\n"
-        + prompt
-    )
+    job_id = str(uuid.uuid4())
+    hit = _firstaid_cached(firstaid_prompt_key(prompt))
+    if hit is not None:
+        # Cached answers skip the queue entirely.
+        response_id, response = hit
+        with transaction():
+            chat_id = _record_firstaid_chat(data.get("userId"), prompt, response_id)
+            run(
+                "INSERT INTO firstaid_jobs (id, user_id, prompt, status, chat_id) VALUES (?, ?, ?, 'done', ?)",
+                (job_id, data.get("userId"), prompt, chat_id),
+            )
+        return jsonify({"jobId": job_id, "status": "done", "response": response, "id": chat_id})
 
-    chat_id = str(uuid.uuid4())
     run(
-        "INSERT INTO firstaid_chats (id, user_id, prompt, response) VALUES (?, ?, ?, ?)",
-        (chat_id, data.get("userId"), prompt, response),
+        "INSERT INTO firstaid_jobs (id, user_id, prompt, status) VALUES (?, ?, ?, 'queued')",
+        (job_id, data.get("userId"), prompt),
     )
-    return jsonify({"response": response, "id": chat_id})
+    try:
+        firstaid_queue.submit(job_id, _run_firstaid_job, job_id, data.get("userId"), prompt)
+    except QueueFullError:
+        _fail_firstaid_job(job_id, "Rejected: first-aid queue is full")
+        return busy_response("First-aid assistant is busy, please retry shortly", retry_after=5)
+    return jsonify({"jobId": job_id, "status": "queued"}), 202
+
+
+@app.get("/api/firstaid/jobs/<job_id>")
+def first_aid_job(job_id: str):
+    try:
+        wait = min(max(float(request.args.get("wait") or 0), 0.0), app.config["FIRSTAID_MAX_WAIT"])
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+
+    job = _load_firstaid_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    # Long-poll: wake on the local completion event, else re-check the table (job may run in another worker).
+    deadline = time.monotonic() + wait
+    while job["status"] in FIRSTAID_PENDING:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if not firstaid_queue.wait(job_id, min(remaining, 1.0)):
+            time.sleep(min(0.25, max(deadline - time.monotonic(), 0)))
+        job = _load_firstaid_job(job_id) or job
+
+    return jsonify({"job": job})
 
 
 if __name__ == "__main__":
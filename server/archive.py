@@ -0,0 +1,272 @@
+"""Move finished appointments and old first-aid chats into monthly archive databases.
+
+Usage:
+    cd server
+    python archive.py                         # archive rows older than ARCHIVE_AFTER_DAYS
+    python archive.py --days 90 --batch-size 1000
+    python archive.py --enable-incremental-vacuum   # one-off full VACUUM for older databases
+
+Notes:
+- Respects `DB_PATH` env var; archives go to `ARCHIVE_DIR` (default: `archive/` next to the
+  database), one `archive-YYYY-MM.db` file per month of `created_at`.
+- Completed and cancelled appointments and all first-aid chats older than the horizon are
+  moved. Booked and in-progress appointments stay in the main database however old they are.
+- Works in batches: each batch is written and committed to its archive first, then deleted
+  from the main database in one short transaction. A crash in between leaves copies in both,
+  and the next run replaces the archived copy. Readers prefer the main database's row.
+- Afterwards freed pages are returned to the filesystem with `PRAGMA incremental_vacuum`.
+  Databases created before auto_vacuum was enabled need `--enable-incremental-vacuum` once.
+  That runs a full VACUUM, which blocks writers while it runs.
+- With `DB_SHARDS` set every shard is archived in turn. The monthly files are shared, so a
+  hospital's archived rows stay readable wherever shards.py moves it.
+- Safe to run while the server runs, e.g. nightly from cron.
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from db import DB_PATH, attach_home, get_pool, init_shards, rebuild_search_indexes, row_to_dict, scatter, transaction
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR") or os.path.join(os.path.dirname(os.path.abspath(DB_PATH)), "archive")
+ARCHIVE_AFTER_DAYS = int(os.environ.get("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE", "500"))
+VACUUM_STEP_PAGES = 2000
+ARCHIVE_FILE = re.compile(r"^archive-(\d{4}-\d{2})\.db$")
+
+# table -> (rows eligible once older than the horizon, secondary indexes in the archive)
+ARCHIVED_TABLES: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "appointments": (
+        "status IN ('Completed', 'Cancelled')",
+        ("created_at", "user_id, created_at", "doctor_id, created_at", "hospital_id, created_at"),
+    ),
+    "firstaid_chats": ("1", ("created_at", "user_id, created_at")),
+}
+
+
+class ArchiveRangeError(ValueError):
+    pass
+
+
+def archive_path(month: str) -> str:
+    return os.path.join(ARCHIVE_DIR, f"archive-{month}.db")
+
+
+def archived_months() -> List[str]:
+    """``YYYY-MM`` of every archive file, oldest first."""
+    try:
+        names = os.listdir(ARCHIVE_DIR)
+    except FileNotFoundError:
+        return []
+    return sorted(m.group(1) for m in map(ARCHIVE_FILE.match, names) if m)
+
+
+def months_between(start: Optional[date], end: Optional[date]) -> List[str]:
+    """Archived months overlapping ``[start, end)``; either bound may be open."""
+    first = start.strftime("%Y-%m") if start else ""
+    last = (end - timedelta(days=1)).strftime("%Y-%m") if end else "9999-12"
+    return [m for m in archived_months() if first <= m <= last]
+
+
+def _columns(db: sqlite3.Connection, table: str, schema: str = "main") -> List[Tuple[str, str]]:
+    return [(row[1], row[2]) for row in db.execute(f'PRAGMA "{schema}".table_info({table})')]
+
+
+def _ensure_table(archive: sqlite3.Connection, table: str, columns: List[Tuple[str, str]]) -> None:
+    """Create ``table`` in the archive, or add columns that migrations added since."""
+    existing = {name for name, _ in _columns(archive, table)}
+    if not existing:
+        cols = ", ".join(f'"{name}" {decl}' for name, decl in columns)
+        archive.execute(f"CREATE TABLE {table} ({cols}, PRIMARY KEY (id))")
+        for index_cols in ARCHIVED_TABLES[table][1]:
+            suffix = index_cols.replace(", ", "_")
+            archive.execute(f"CREATE INDEX idx_{table}_{suffix} ON {table} ({index_cols})")
+        return
+    for name, decl in columns:
+        if name not in existing:
+            archive.execute(f'ALTER TABLE {table} ADD COLUMN "{name}" {decl}')
+
+
+def _write_archive(month: str, table: str, columns: List[Tuple[str, str]], rows: List[sqlite3.Row]) -> None:
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    archive = sqlite3.connect(archive_path(month))
+    try:
+        with archive:
+            _ensure_table(archive, table, columns)
+            names = ", ".join(f'"{name}"' for name, _ in columns)
+            placeholders = ", ".join("?" for _ in columns)
+            archive.executemany(
+                f"INSERT OR REPLACE INTO {table} ({names}) VALUES ({placeholders})",
+                [tuple(row[name] for name, _ in columns) for row in rows],
+            )
+    finally:
+        archive.close()
+
+
+def archive_table(table: str, cutoff: str, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Move ``table`` rows created before ``cutoff`` into monthly archives; return rows moved."""
+    eligible = f"created_at < ? AND {ARCHIVED_TABLES[table][0]}"
+    pool = get_pool()
+    moved = 0
+    while True:
+        reader = pool.acquire_reader()
+        try:
+            columns = _columns(reader, table)
+            rows = reader.execute(
+                f"SELECT * FROM {table} WHERE {eligible} ORDER BY created_at LIMIT ?", (cutoff, batch_size)
+            ).fetchall()
+        finally:
+            pool.release_reader(reader)
+        if not rows:
+            return moved
+        by_month: Dict[str, List[sqlite3.Row]] = {}
+        for row in rows:
+            by_month.setdefault(str(row["created_at"])[:7], []).append(row)
+        for month, month_rows in by_month.items():
+            _write_archive(month, table, columns, month_rows)
+        # Re-check eligibility: a row that changed since it was read stays, and the main
+        # database's copy keeps shadowing the archived one.
+        ids = [row["id"] for row in rows]
+        with transaction() as db:
+            deleted = db.execute(
+                f"DELETE FROM {table} WHERE id IN ({', '.join('?' for _ in ids)}) AND {eligible}",
+                (*ids, cutoff),
+            ).rowcount
+        moved += deleted
+        if len(rows) < batch_size:
+            return moved
+
+
+def incremental_vacuum(step_pages: int = VACUUM_STEP_PAGES) -> Optional[int]:
+    """Return free pages to the filesystem a step at a time; None if auto_vacuum is off."""
+    pool = get_pool()
+    freed = 0
+    while True:
+        with pool.writer_lock:
+            db = pool.writer()
+            if db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return None
+            free = db.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free:
+                return freed
+            # The pragma frees one page per step and returns no rows; executescript steps
+            # it to completion where execute() would stop after the first page.
+            db.executescript(f"PRAGMA incremental_vacuum({min(free, step_pages)})")
+            step = free - db.execute("PRAGMA freelist_count").fetchone()[0]
+        if step <= 0:
+            return freed
+        freed += step
+
+
+def enable_incremental_vacuum() -> None:
+    pool = get_pool()
+    with pool.writer_lock:
+        db = pool.writer()
+        db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        db.execute("VACUUM")
+    rebuild_search_indexes()
+
+
+@contextmanager
+def _fanout_connection(months: Sequence[str]) -> Iterator[Tuple[sqlite3.Connection, List[str]]]:
+    pool = get_pool()
+    conn = sqlite3.connect(f"file:{os.path.abspath(pool.path)}?mode=ro", uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    try:
+        if pool.home is not None:
+            attach_home(conn, pool.home)
+        attachable = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) - (pool.home is not None)
+        if len(months) > attachable:
+            raise ArchiveRangeError(
+                f"Date range spans {len(months)} archived months; at most {attachable} can be read at once"
+            )
+        schemas = []
+        for i, month in enumerate(months):
+            conn.execute(f"ATTACH DATABASE ? AS archive_{i}", (f"file:{archive_path(month)}?mode=ro",))
+            schemas.append(f"archive_{i}")
+        yield conn, schemas
+    finally:
+        conn.close()
+
+
+def union_source(conn: sqlite3.Connection, table: str, schemas: Sequence[str]) -> str:
+    """A subquery over the main table plus the attached archives, with the main table's columns.
+
+    Archived rows still present in the main database (interrupted archival) are skipped.
+    """
+    columns = [name for name, _ in _columns(conn, table)]
+    parts = [f"SELECT {', '.join(columns)} FROM main.{table}"]
+    for schema in schemas:
+        present = {name for name, _ in _columns(conn, table, schema)}
+        if not present:
+            continue
+        select = ", ".join(name if name in present else f"NULL AS {name}" for name in columns)
+        parts.append(
+            f"SELECT {select} FROM {schema}.{table} x "
+            f"WHERE NOT EXISTS (SELECT 1 FROM main.{table} m WHERE m.id = x.id)"
+        )
+    return "(" + " UNION ALL ".join(parts) + ")"
+
+
+def fanout_rows(
+    table: str, months: Sequence[str], build: Callable[[str], Tuple[str, List[Any]]], batch_size: int = 200
+) -> Iterator[Dict[str, Any]]:
+    """Yield the rows of ``build(source)`` with ``source`` covering ``table`` and its archives for ``months``.
+
+    ``build`` gets the FROM-clause subquery and returns ``(sql, params)``. Raises
+    ``ArchiveRangeError`` before yielding when more months are asked for than SQLite can attach.
+    """
+    with _fanout_connection(months) as (conn, schemas):
+        sql, params = build(union_source(conn, table, schemas))
+        cur = conn.execute(sql, params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row_to_dict(row)
+
+
+def _archive_shard(args: argparse.Namespace, cutoff: str) -> None:
+    path = get_pool().path
+    if args.enable_incremental_vacuum:
+        started = time.perf_counter()
+        enable_incremental_vacuum()
+        print(f"{path}: auto_vacuum=INCREMENTAL after full VACUUM in {time.perf_counter() - started:.1f}s")
+
+    for table in ARCHIVED_TABLES:
+        started = time.perf_counter()
+        moved = archive_table(table, cutoff, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - started
+        print(f"{path}: {table}: archived {moved} rows created before {cutoff} in {elapsed:.1f}s")
+
+    if not args.no_vacuum:
+        freed = incremental_vacuum()
+        if freed is None:
+            print(f"{path}: auto_vacuum is off; run once with --enable-incremental-vacuum to reclaim space")
+        else:
+            print(f"{path}: incremental_vacuum released {freed} pages")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="archive rows older than this")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="rows moved per transaction")
+    parser.add_argument("--no-vacuum", action="store_true", help="skip incremental_vacuum afterwards")
+    parser.add_argument(
+        "--enable-incremental-vacuum", action="store_true", help="switch an older database to auto_vacuum=INCREMENTAL"
+    )
+    args = parser.parse_args()
+
+    init_shards()
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=args.days)).strftime("%Y-%m-%d %H:%M:%S")
+    scatter(lambda: _archive_shard(args, cutoff))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Fingerprinted, pre-compressed static assets.
+
+Build step (run once per deploy, after the static files change):
+    cd server
+    python assets.py
+
+It copies every file under `static/` to `static/dist/` with a content hash in its
+name, writes `.br` and `.gz` variants next to it, and records the mapping in
+`static/dist/manifest.json`.
+At runtime templates call `asset_url('css/app.css')`; without a manifest it falls
+back to the plain `/static/...` URL so local development needs no build.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from typing import Dict, Optional, Set
+
+import brotli
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), "static")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_PATH = os.path.join(DIST_DIR, "manifest.json")
+COMPRESSIBLE = {".css", ".js", ".svg", ".json", ".txt", ".html", ".map"}
+# Compressed variants in order of preference, as (Accept-Encoding token, file suffix).
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def fingerprint(name: str, content: bytes) -> str:
+    root, ext = os.path.splitext(name)
+    return f"{root}.{hashlib.sha256(content).hexdigest()[:12]}{ext}"
+
+
+def build(static_dir: str = STATIC_DIR, dist_dir: str = DIST_DIR) -> Dict[str, str]:
+    manifest: Dict[str, str] = {}
+    staging = dist_dir + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) not in (dist_dir, staging)]
+        for filename in files:
+            src = os.path.join(root, filename)
+            name = os.path.relpath(src, static_dir).replace(os.sep, "/")
+            with open(src, "rb") as fh:
+                content = fh.read()
+            hashed = fingerprint(name, content)
+            dest = os.path.join(staging, hashed)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with open(dest, "wb") as fh:
+                fh.write(content)
+            if os.path.splitext(name)[1] in COMPRESSIBLE:
+                variants = compress(content)
+                for encoding, suffix in ENCODINGS:
+                    with open(dest + suffix, "wb") as fh:
+                        fh.write(variants[encoding])
+            manifest[name] = hashed
+    with open(os.path.join(staging, "manifest.json"), "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    # Swap the finished build in so a running server never sees a half-written dist/.
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    os.replace(staging, dist_dir)
+    return manifest
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Optional[Dict[str, str]]:
+    try:
+        with open(path, encoding="utf-8") as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        return None
+
+
+def accepted_encodings(accept_encoding: str) -> Set[str]:
+    accepted = set()
+    for token in accept_encoding.split(","):
+        coding, _, params = token.partition(";")
+        if params.replace(" ", "").lower() in {"q=0", "q=0.0", "q=0.00", "q=0.000"}:
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def compress(content: bytes) -> Dict[str, bytes]:
+    """Every encoding served for ``content``, keyed by Accept-Encoding token."""
+    return {
+        "br": brotli.compress(content, quality=11),
+        "gzip": gzip.compress(content, compresslevel=9, mtime=0),
+    }
+
+
+def pick_encoding(accept_encoding: str, path: str) -> Optional[tuple]:
+    """Return the best ``(encoding, suffix)`` the client accepts and that exists on disk."""
+    accepted = accepted_encodings(accept_encoding)
+    for encoding, suffix in ENCODINGS:
+        if encoding in accepted and os.path.exists(path + suffix):
+            return encoding, suffix
+    return None
+
+
+if __name__ == "__main__":
+    built = build()
+    print(f"Built {len(built)} assets into {DIST_DIR}")
@@ -0,0 +1,415 @@
+"""Endpoint-level load and latency benchmark.
+
+Usage:
+    cd server
+    python bench.py                                    # in-process, 10k hospitals / 1M appointments
+    python bench.py --mode http --threads 16 --duration 60 --output bench.json
+    python bench.py --baseline bench.json              # exit 1 if any endpoint regressed
+    python bench.py --hospitals 1000 --users 20000 --appointments 100000 --duration 10
+
+Notes:
+- Seeds a synthetic database with `synth.py` once per scale and seed, then reuses it
+  (`--db` to choose the path, `--reseed` to rebuild). Each run works on a copy, so bookings and
+  status changes never accumulate into the next run.
+- `--mode inproc` drives the WSGI app through Flask test clients; `--mode http` serves `wsgi:app`
+  on a local threaded server (or targets `--url`) and drives it over keep-alive HTTP.
+- Gemini is replaced by a local stub answering after `--firstaid-latency-ms`; reCAPTCHA is off.
+- Results are JSON: per-endpoint count, errors, throughput and p50/p95/p99/max latency. With
+  `--baseline`, p95 or throughput worse than `--tolerance` (default 15%) counts as a regression.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+
+import db
+from bulk_import import load
+from db import init_db
+from synth import CITIES, PROBLEMS, SPECIALIZATIONS, SyntheticDataset, synthetic_id
+
+# (operation, weight): roughly what the dashboards, booking flow and search page generate.
+WORKLOAD = (
+    ("search_geo", 22),
+    ("search_text", 10),
+    ("hospital_get", 10),
+    ("dashboard_list", 18),
+    ("dashboard_today", 12),
+    ("dashboard_stats", 12),
+    ("user_history", 6),
+    ("book", 8),
+    ("status", 6),
+    ("page", 5),
+    ("firstaid", 3),
+)
+FIRSTAID_PROMPTS = (
+    "minor burn on hand",
+    "child has a high fever",
+    "twisted ankle while running",
+    "nosebleed that will not stop",
+    "bee sting swelling",
+    "deep cut on finger",
+)
+# Fixed so the seeded database, and hence the baseline, is the same on every machine.
+BENCH_UNTIL = date(2026, 1, 1)
+
+
+class GeminiStub(BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def do_POST(self) -> None:  # noqa: N802 - http.server API
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        time.sleep(self.latency)
+        body = json.dumps({"candidates": [{"content": {"parts": [{"text": "Benchmark first-aid advice."}]}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+def _serve(server) -> str:
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+
+def start_gemini_stub(latency_ms: float) -> str:
+    GeminiStub.latency = latency_ms / 1000
+    return _serve(ThreadingHTTPServer(("127.0.0.1", 0), GeminiStub))
+
+
+def seed_database(path: str, dataset: SyntheticDataset) -> None:
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    started = time.perf_counter()
+    db.DB_PATH = path
+    init_db()
+    load(dataset.tables(), progress=True)
+    db.get_pool().close()
+    print(f"Seeded {path} in {time.perf_counter() - started:.0f}s", flush=True)
+
+
+def working_copy(seed_path: str) -> str:
+    """Copy the seeded database (checkpointed first) so a run's writes never leak into the next."""
+    with sqlite3.connect(seed_path) as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    fd, path = tempfile.mkstemp(prefix="pulsecare-bench-run-", suffix=".db")
+    os.close(fd)
+    shutil.copyfile(seed_path, path)
+    return path
+
+
+class InProcessClient:
+    def __init__(self, app) -> None:
+        self.client = app.test_client()
+
+    def request(self, method: str, path: str, body: Optional[dict] = None) -> Tuple[int, Any]:
+        resp = self.client.open(path, method=method, json=body)
+        return resp.status_code, resp.get_json(silent=True)
+
+
+class HttpClient:
+    def __init__(self, base_url: str) -> None:
+        self.base_url = base_url
+        self.session = requests.Session()
+
+    def request(self, method: str, path: str, body: Optional[dict] = None) -> Tuple[int, Any]:
+        resp = self.session.request(method, self.base_url + path, json=body, timeout=60)
+        try:
+            return resp.status_code, resp.json()
+        except ValueError:
+            return resp.status_code, None
+
+
+class Workload:
+    """Picks operations and their arguments from the synthetic dataset's id space."""
+
+    def __init__(self, dataset: SyntheticDataset, seed: int) -> None:
+        self.dataset = dataset
+        self.seed = seed
+        self.ops, self.weights = zip(*WORKLOAD)
+        self.booked: List[str] = []
+        self._lock = threading.Lock()
+
+    def _hospital(self, rng: random.Random) -> int:
+        return rng.randrange(self.dataset.counts["hospitals"])
+
+    def _user(self, rng: random.Random) -> str:
+        return synthetic_id("user", rng.randrange(self.dataset.counts["users"]))
+
+    def run(self, op: str, client, rng: random.Random) -> Tuple[int, bool]:
+        """Execute ``op`` and return ``(status, ok)``."""
+        ds = self.dataset
+        if op == "search_geo":
+            lat, lng = ds._point(rng, rng.randrange(len(CITIES)))
+            status, _ = client.request("GET", f"/api/doctors/search?userLat={lat}&userLng={lng}")
+            return status, status == 200
+        if op == "search_text":
+            word = rng.choice(SPECIALIZATIONS)[0].split()[0][: rng.randint(3, 6)]
+            status, _ = client.request("GET", f"/api/doctors/search?q={word}")
+            return status, status == 200
+        if op == "hospital_get":
+            status, _ = client.request("GET", f"/api/hospitals/{ds.hospital_ids[self._hospital(rng)]}")
+            return status, status == 200
+        if op == "dashboard_list":
+            doctor = rng.choice(ds.doctor_ids[self._hospital(rng)])
+            status, _ = client.request("GET", f"/api/appointments?doctorId={doctor}&limit=50")
+            return status, status == 200
+        if op == "dashboard_today":
+            doctor = rng.choice(ds.doctor_ids[self._hospital(rng)])
+            day = ds.until.isoformat()
+            status, _ = client.request("GET", f"/api/appointments/today?doctorId={doctor}&tz=Asia/Kolkata&date={day}")
+            return status, status == 200
+        if op == "dashboard_stats":
+            doctor = rng.choice(ds.doctor_ids[self._hospital(rng)])
+            day = ds.until.isoformat()
+            status, _ = client.request("GET", f"/api/stats?doctorId={doctor}&tz=Asia/Kolkata&from={day}&to={day}")
+            return status, status == 200
+        if op == "user_history":
+            status, _ = client.request("GET", f"/api/appointments?userId={self._user(rng)}&limit=20")
+            return status, status == 200
+        if op == "book":
+            h = self._hospital(rng)
+            body = {
+                "userId": self._user(rng),
+                "hospitalId": ds.hospital_ids[h],
+                "doctorId": rng.choice(ds.doctor_ids[h]),
+                "problem": rng.choice(PROBLEMS),
+                "preferredTime": "Morning",
+            }
+            status, data = client.request("POST", "/api/appointments", body)
+            if status == 200 and data:
+                with self._lock:
+                    self.booked.append(data["appointment"]["id"])
+            return status, status == 200
+        if op == "status":
+            with self._lock:
+                appt = self.booked.pop() if self.booked else None
+            if appt is None:
+                appt = synthetic_id("appointment", rng.randrange(ds.counts["appointments"]))
+            action = rng.choice(("get-in", "complete", "cancel"))
+            status, _ = client.request("PUT", f"/api/appointments/{appt}/{action}")
+            return status, status == 200
+        if op == "page":
+            status, _ = client.request("GET", rng.choice(("/", "/user/book", "/doctor/dashboard", "/user/dashboard")))
+            return status, status == 200
+        if op == "firstaid":
+            status, data = client.request("POST", "/api/firstaid", {"prompt": rng.choice(FIRSTAID_PROMPTS), "userId": None})
+            if status != 202 or not data:
+                return status, status == 200
+            # Time the full round trip a user waits for, as the page does.
+            while True:
+                status, polled = client.request("GET", f"/api/firstaid/jobs/{data['jobId']}?wait=10")
+                if status != 200 or not polled:
+                    return status, False
+                if polled["job"]["status"] not in {"queued", "running"}:
+                    return status, polled["job"]["status"] == "done"
+        raise ValueError(f"unknown operation {op}")
+
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summarize(latencies: Dict[str, List[float]], errors: Dict[str, int], elapsed: float) -> Dict[str, Any]:
+    endpoints = {}
+    for op in sorted(latencies):
+        values = sorted(latencies[op])
+        endpoints[op] = {
+            "count": len(values),
+            "errors": errors.get(op, 0),
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "mean_ms": round(sum(values) / len(values) * 1000, 3),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(values, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+            "max_ms": round(values[-1] * 1000, 3),
+        }
+    count = sum(e["count"] for e in endpoints.values())
+    return {
+        "total": {
+            "requests": count,
+            "errors": sum(errors.values()),
+            "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+        },
+        "endpoints": endpoints,
+    }
+
+
+def drive(make_client: Callable[[], Any], workload: Workload, threads: int, duration: float, warmup: float) -> Dict[str, Any]:
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    lock = threading.Lock()
+    start_at = time.monotonic() + warmup
+    stop_at = start_at + duration
+
+    def worker(index: int) -> None:
+        client = make_client()
+        rng = random.Random(f"{workload.seed}:worker:{index}")
+        local: Dict[str, List[float]] = defaultdict(list)
+        local_errors: Dict[str, int] = defaultdict(int)
+        while True:
+            op = rng.choices(workload.ops, workload.weights)[0]
+            began = time.monotonic()
+            if began >= stop_at:
+                break
+            try:
+                _, ok = workload.run(op, client, rng)
+            except Exception:  # a failed request is a data point, not a crash
+                ok = False
+            if began < start_at:
+                continue
+            local[op].append(time.monotonic() - began)
+            if not ok:
+                local_errors[op] += 1
+        with lock:
+            for op, values in local.items():
+                latencies[op].extend(values)
+            for op, n in local_errors.items():
+                errors[op] += n
+
+    pool = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return summarize(latencies, errors, duration)
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return a line per endpoint whose p95 or throughput regressed beyond ``tolerance``."""
+    regressions = []
+    for key in ("mode", "threads", "dataset"):
+        if baseline.get("meta", {}).get(key) != result["meta"][key]:
+            print(f"note: baseline {key} differs ({baseline.get('meta', {}).get(key)} vs {result['meta'][key]})")
+    print(f"\n{'endpoint':<18}{'p95 ms':>10}{'base':>10}{'Δ':>8}{'rps':>10}{'base':>10}{'Δ':>8}")
+    for op, now in result["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(op)
+        if not before:
+            print(f"{op:<18}{now['p95_ms']:>10.2f}{'-':>10}{'':>8}{now['throughput_rps']:>10.1f}{'-':>10}")
+            continue
+        p95_delta = now["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        rps_delta = now["throughput_rps"] / before["throughput_rps"] - 1 if before["throughput_rps"] else 0.0
+        flag = ""
+        if p95_delta > tolerance or rps_delta < -tolerance:
+            flag = "  REGRESSION"
+            regressions.append(f"{op}: p95 {p95_delta:+.0%}, throughput {rps_delta:+.0%}")
+        print(
+            f"{op:<18}{now['p95_ms']:>10.2f}{before['p95_ms']:>10.2f}{p95_delta:>+8.0%}"
+            f"{now['throughput_rps']:>10.1f}{before['throughput_rps']:>10.1f}{rps_delta:>+8.0%}{flag}"
+        )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mode", choices=("inproc", "http"), default="inproc")
+    parser.add_argument("--url", help="in http mode, benchmark this running server instead of a local one")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds before that")
+    parser.add_argument("--hospitals", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--appointments", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="seeded database path (default: one per scale in the temp dir)")
+    parser.add_argument("--reseed", action="store_true", help="rebuild the seeded database")
+    parser.add_argument("--firstaid-latency-ms", type=float, default=300.0)
+    parser.add_argument("--output", help="write the JSON result here (default: stdout)")
+    parser.add_argument("--baseline", help="JSON result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(
+        hospitals=args.hospitals, users=args.users, appointments=args.appointments, until=BENCH_UNTIL, seed=args.seed
+    )
+    seed_path = args.db or os.path.join(
+        tempfile.gettempdir(), f"pulsecare-bench-h{args.hospitals}-u{args.users}-a{args.appointments}-s{args.seed}.db"
+    )
+    run_path = None
+    if not args.url:
+        if args.reseed or not os.path.exists(seed_path):
+            seed_database(seed_path, dataset)
+        run_path = working_copy(seed_path)
+        db.DB_PATH = run_path
+        # Read by app.py at import time.
+        os.environ["GEMINI_API_KEY"] = "bench"
+        os.environ["GEMINI_API_URL"] = start_gemini_stub(args.firstaid_latency_ms)
+        os.environ["RECAPTCHA_SECRET"] = ""
+        # Measure capacity, not the per-IP admission limits (every client shares one IP).
+        os.environ["RATE_LIMIT_ENABLED"] = "0"
+
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+            make_client = lambda: HttpClient(base_url)  # noqa: E731
+        else:
+            from wsgi import app
+
+            if args.mode == "http":
+                from werkzeug.serving import make_server
+
+                logging.getLogger("werkzeug").setLevel(logging.WARNING)
+                base_url = _serve(make_server("127.0.0.1", 0, app, threaded=True))
+                make_client = lambda: HttpClient(base_url)  # noqa: E731
+            else:
+                make_client = lambda: InProcessClient(app)  # noqa: E731
+
+        print(f"Running {args.mode} benchmark: {args.threads} threads for {args.duration:.0f}s", file=sys.stderr, flush=True)
+        result = drive(make_client, Workload(dataset, args.seed), args.threads, args.duration, args.warmup)
+    finally:
+        if run_path:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(run_path + suffix):
+                    os.remove(run_path + suffix)
+
+    result["meta"] = {
+        "mode": "http" if args.url else args.mode,
+        "url": args.url,
+        "threads": args.threads,
+        "duration_s": args.duration,
+        "dataset": {**dataset.counts, "seed": args.seed},
+        "firstaid_latency_ms": args.firstaid_latency_ms,
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as fh:
+            regressions = compare(result, json.load(fh), args.tolerance)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
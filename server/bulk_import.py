@@ -0,0 +1,233 @@
+"""Bulk-load hospitals, doctors, users and appointments from CSV or NDJSON files.
+
+Usage:
+    cd server
+    python bulk_import.py --hospitals hospitals.csv --doctors doctors.ndjson
+    python bulk_import.py --users users.csv.gz --appointments appointments.jsonl --skip-existing
+
+Notes:
+- Respects `DB_PATH` env var; default is `server/data.db`. Runs pending migrations first.
+- Columns are the table's column names (see `db.py`); the first row/header decides which
+  are set. `id` is generated when absent. A `password` column is hashed into `password_hash`.
+- Everything loads in a single transaction: secondary indexes and triggers on the loaded
+  tables are dropped first and recreated afterwards, the geo/full-text indexes, slot
+  booking counts and appointment statistics are brought up to date, and foreign keys are
+  checked before commit. Any error rolls the whole import back.
+- Everything lands in the home database; imported hospitals get shard directory entries
+  there, and `python shards.py rebalance` spreads them over `DB_SHARDS` afterwards.
+- Files ending in `.gz` are decompressed on the fly.
+"""
+
+import argparse
+import csv
+import gzip
+import io
+import itertools
+import json
+import sqlite3
+import sys
+import time
+import uuid
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from db import (
+    DB_PATH,
+    executemany,
+    get_pool,
+    init_db,
+    rebuild_appointment_stats,
+    rebuild_search_indexes,
+    rebuild_slot_bookings,
+    sync_hospital_directory,
+    transaction,
+)
+from passwords import passwords
+
+# Load order respects the foreign keys between them.
+TABLES = ("hospitals", "doctors", "users", "appointments")
+BOOLEAN_COLUMNS = {("hospitals", "emergency")}
+DEFAULT_BATCH_SIZE = 50000
+
+
+class BulkImportError(RuntimeError):
+    pass
+
+
+def _open_text(path: str) -> io.TextIOBase:
+    if path == "-":
+        return sys.stdin
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Stream dict records from a CSV (header row) or NDJSON/JSONL file."""
+    name = path[:-3] if path.endswith(".gz") else path
+    with _open_text(path) as fh:
+        if name.endswith(".csv"):
+            for row in csv.DictReader(fh):
+                # CSV has no NULL; treat empty cells as missing values.
+                yield {k: (v if v != "" else None) for k, v in row.items()}
+        elif name.endswith((".ndjson", ".jsonl")):
+            for lineno, line in enumerate(fh, 1):
+                if line.strip():
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError as exc:
+                        raise BulkImportError(f"{path}:{lineno}: {exc}") from exc
+        else:
+            raise BulkImportError(f"{path}: expected a .csv, .ndjson or .jsonl file")
+
+
+def _coerce_bool(value: Any) -> Optional[int]:
+    if value is None or isinstance(value, (bool, int)):
+        return None if value is None else int(bool(value))
+    return 1 if str(value).strip().lower() in {"1", "true", "yes", "y", "on"} else 0
+
+
+def _table_columns(db, table: str) -> List[str]:
+    return [row["name"] for row in db.execute(f"PRAGMA table_info({table})")]
+
+
+def _rows(table: str, records: Iterable[Dict[str, Any]], known: List[str]) -> Tuple[List[str], Iterator[tuple]]:
+    """Fix the column list from the first record and yield parameter tuples in that order."""
+    records = iter(records)
+    first = next(records, None)
+    if first is None:
+        return [], iter(())
+    fields = list(first)
+    hash_password = "password" in fields and "password_hash" not in fields
+    columns = ["password_hash" if f == "password" and hash_password else f for f in fields]
+    unknown = [c for c in columns if c not in known]
+    if unknown:
+        raise BulkImportError(f"{table}: unknown column(s) {', '.join(unknown)}")
+    add_id = "id" not in columns
+    if add_id:
+        columns.insert(0, "id")
+
+    def generate() -> Iterator[tuple]:
+        for record in itertools.chain([first], records):
+            values = []
+            for field in fields:
+                value = record.get(field)
+                if field == "password" and hash_password:
+                    value = passwords.hash(value) if value is not None else None
+                elif (table, field) in BOOLEAN_COLUMNS:
+                    value = _coerce_bool(value)
+                values.append(value)
+            yield ((str(uuid.uuid4()),) if add_id else ()) + tuple(values)
+
+    return columns, generate()
+
+
+def _drop_derived(db, tables: Iterable[str]) -> List[str]:
+    """Drop secondary indexes and triggers on ``tables``; return the SQL to recreate them."""
+    placeholders = ", ".join("?" for _ in tables)
+    objects = db.execute(
+        f"""
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+        """,
+        tuple(tables),
+    ).fetchall()
+    for obj in objects:
+        db.execute(f'DROP {obj["type"].upper()} "{obj["name"]}"')
+    return [obj["sql"] for obj in objects]
+
+
+def load(
+    sources: Dict[str, Iterable[Dict[str, Any]]],
+    skip_existing: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    progress: bool = False,
+) -> Dict[str, int]:
+    """Insert ``sources`` (table -> records) in one transaction and return rows processed per table."""
+    unknown = set(sources) - set(TABLES)
+    if unknown:
+        raise BulkImportError(f"unknown table(s): {', '.join(sorted(unknown))}")
+    tables = [t for t in TABLES if t in sources]
+    verb = "INSERT OR IGNORE" if skip_existing else "INSERT"
+    counts: Dict[str, int] = {}
+    pool = get_pool()
+    with pool.writer_lock:
+        db = pool.writer()
+        # Checked once after the load instead of per row; cannot change inside a transaction.
+        db.execute("PRAGMA foreign_keys = OFF")
+        try:
+            with transaction():
+                # Rows loaded past this one are new, whether or not --skip-existing skips some.
+                last_rowid = db.execute("SELECT COALESCE(MAX(rowid), 0) FROM appointments").fetchone()[0]
+                recreate = _drop_derived(db, tables)
+                for table in tables:
+                    started = time.perf_counter()
+                    columns, rows = _rows(table, sources[table], _table_columns(db, table))
+                    if not columns:
+                        counts[table] = 0
+                        continue
+                    sql = f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})"
+                    try:
+                        counts[table] = executemany(sql, rows, batch_size=batch_size)
+                    except sqlite3.IntegrityError as exc:
+                        raise BulkImportError(f"{table}: {exc}; nothing was imported") from exc
+                    if progress:
+                        print(f"{table}: {counts[table]} rows in {time.perf_counter() - started:.1f}s", flush=True)
+                started = time.perf_counter()
+                for sql in recreate:
+                    db.execute(sql)
+                if {"hospitals", "doctors"} & set(tables):
+                    rebuild_search_indexes()
+                    db.execute(
+                        """
+                        INSERT INTO row_versions (entity, id, version) VALUES ('table', 'search', 1)
+                        ON CONFLICT (entity, id) DO UPDATE SET version = version + 1
+                        """
+                    )
+                if "appointments" in tables:
+                    rebuild_slot_bookings()
+                    rebuild_appointment_stats(last_rowid)
+                if "hospitals" in tables:
+                    try:
+                        sync_hospital_directory()
+                    except sqlite3.IntegrityError as exc:
+                        raise BulkImportError(
+                            f"hospitals: email already registered in another shard ({exc}); nothing was imported"
+                        ) from exc
+                if progress:
+                    print(f"indexes + triggers rebuilt in {time.perf_counter() - started:.1f}s", flush=True)
+                for table in tables:
+                    violations = db.execute(f"PRAGMA foreign_key_check({table})").fetchall()
+                    if violations:
+                        sample = violations[0]
+                        raise BulkImportError(
+                            f"{table}: {len(violations)} row(s) reference missing rows in {sample['parent']} "
+                            f"(first at rowid {sample['rowid']}); nothing was imported"
+                        )
+        finally:
+            db.execute("PRAGMA foreign_keys = ON")
+    return counts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    for table in TABLES:
+        parser.add_argument(f"--{table}", metavar="PATH", help=f"{table} file (.csv/.ndjson/.jsonl[.gz], - for stdin)")
+    parser.add_argument("--skip-existing", action="store_true", help="ignore rows whose id or email already exists")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rows per executemany call")
+    args = parser.parse_args()
+
+    sources = {t: read_records(getattr(args, t)) for t in TABLES if getattr(args, t)}
+    if not sources:
+        parser.error("nothing to import; pass at least one of " + ", ".join(f"--{t}" for t in TABLES))
+    init_db()
+    started = time.perf_counter()
+    try:
+        counts = load(sources, skip_existing=args.skip_existing, batch_size=args.batch_size, progress=True)
+    except BulkImportError as exc:
+        raise SystemExit(f"Import failed: {exc}")
+    total = sum(counts.values())
+    print(f"Imported {total} rows into {DB_PATH} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
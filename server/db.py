@@ -1,122 +1,1141 @@
+import functools
+import logging
 import os
+import queue
+import re
 import sqlite3
-from typing import Any, Dict, Iterable, List, Optional
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, TypeVar
 from flask import g
 
+from cache import LRUCache
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
 DB_PATH = os.environ.get("DB_PATH") or os.path.join(os.path.dirname(__file__), "data.db")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "8"))
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHED_STATEMENTS = 512
+# Route run() through one writer thread per worker that commits queued writes together.
+DB_GROUP_COMMIT = os.environ.get("DB_GROUP_COMMIT", "").lower() in {"1", "true", "yes"}
+DB_GROUP_COMMIT_MAX_BATCH = int(os.environ.get("DB_GROUP_COMMIT_MAX_BATCH", "64"))
+DB_GROUP_COMMIT_WINDOW_S = float(os.environ.get("DB_GROUP_COMMIT_WINDOW_MS", "2")) / 1000
+# Statements slower than this are counted and their query plan is logged.
+DB_SLOW_QUERY_S = float(os.environ.get("DB_SLOW_QUERY_MS", "100")) / 1000
+SLOW_QUERY_EXPLAIN_INTERVAL_S = 60.0
+HOME_SHARD = "home"
+SHARD_NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+SHARD_LOCATION_CACHE_SIZE = 65536
+
+
+def parse_shards(value: str) -> Dict[str, str]:
+    """``"east=/data/east.db,west=/data/west.db"`` -> ``{"east": "/data/east.db", ...}``."""
+    shards: Dict[str, str] = {}
+    for entry in filter(None, (part.strip() for part in value.split(","))):
+        name, sep, path = (s.strip() for s in entry.partition("="))
+        if not sep or not path or not SHARD_NAME.match(name) or name == HOME_SHARD or name in shards:
+            raise ValueError(f"invalid DB_SHARDS entry {entry!r}; expected <name>=<path> with a unique name")
+        shards[name] = path
+    return shards
+
+
+# Extra database files holding hospitals and everything under them (doctors,
+# appointments, slots, events); see locate(). Users and first-aid data stay in
+# DB_PATH, which is also the shard named "home". Unset keeps everything in DB_PATH.
+DB_SHARDS = parse_shards(os.environ.get("DB_SHARDS", ""))
+
+# Applied to every pooled connection. WAL lets readers proceed while the writer
+# commits; NORMAL sync is durable across application crashes in WAL mode.
+CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys = ON;",
+    f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS};",
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA cache_size = -16000;",
+    "PRAGMA mmap_size = 268435456;",
+    "PRAGMA temp_store = MEMORY;",
+)
+
+
+def attach_home(conn: sqlite3.Connection, home: str) -> None:
+    """Let a shard connection read users from the home database.
+
+    A temp view shadows the shard's empty ``users`` table, so joins written for a single
+    database work unchanged. Foreign keys are off because appointments reference users
+    in the other file; nothing deletes hospitals or doctors through the API.
+    """
+    conn.execute("PRAGMA foreign_keys = OFF;")
+    conn.execute("ATTACH DATABASE ? AS home", (f"file:{os.path.abspath(home)}?mode=ro",))
+    conn.execute("CREATE TEMP VIEW IF NOT EXISTS users AS SELECT * FROM home.users")
+
+
+def _connect(path: str, readonly: bool, home: Optional[str] = None) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        cached_statements=DB_CACHED_STATEMENTS,
+        check_same_thread=False,
+        uri=home is not None,
+    )
+    conn.row_factory = sqlite3.Row
+    if not readonly:
+        # Only takes effect on a new file (before WAL writes its header); lets archive.py
+        # return freed pages with incremental_vacuum. Existing files keep their mode.
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+        conn.execute("PRAGMA journal_mode = WAL;")
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    if home is not None:
+        attach_home(conn, home)
+    if readonly:
+        conn.execute("PRAGMA query_only = ON;")
+    return conn
+
+
+class ConnectionPool:
+    """Per-process pool: one serialized writer plus reusable read-only connections.
+
+    Pools for shards pass ``home``, the home database their connections attach.
+    """
+
+    def __init__(self, path: str, size: int = DB_POOL_SIZE, home: Optional[str] = None) -> None:
+        self.path = path
+        self.home = home
+        self.size = max(1, size)
+        self.pid = os.getpid()
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.RLock()
+        # Thread currently inside transaction() and its nesting depth; only touched under _writer_lock.
+        self._tx_owner: Optional[int] = None
+        self._tx_depth = 0
+        self._committer: Optional["GroupCommitter"] = None
+
+    def acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return _connect(self.path, readonly=True, home=self.home)
+
+    def release_reader(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        if self._idle.qsize() >= self.size:
+            conn.close()
+            return
+        self._idle.put_nowait(conn)
+
+    @property
+    def writer_lock(self) -> threading.RLock:
+        return self._writer_lock
+
+    def writer(self) -> sqlite3.Connection:
+        # Callers must hold ``writer_lock`` while using the returned connection.
+        if self._writer is None:
+            self._writer = _connect(self.path, readonly=False, home=self.home)
+        return self._writer
+
+    def in_transaction(self) -> bool:
+        """True when the calling thread is inside ``transaction()``."""
+        return self._tx_owner == threading.get_ident()
+
+    def committer(self) -> "GroupCommitter":
+        if self._committer is None:
+            with _pool_lock:
+                if self._committer is None:
+                    self._committer = GroupCommitter(self)
+        return self._committer
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+class _Write:
+    __slots__ = ("fn", "future")
+
+    def __init__(self, fn: Callable[[sqlite3.Connection], Any]) -> None:
+        self.fn = fn
+        self.future: "Future[Any]" = Future()
+
+
+class GroupCommitter:
+    """Single writer thread that applies queued writes in shared transactions.
+
+    Each write runs inside its own SAVEPOINT, so a failing statement only fails its
+    caller, while the whole batch pays for one commit (one WAL fsync).
+    """
+
+    def __init__(self, pool: ConnectionPool) -> None:
+        self.pool = pool
+        self._queue: "queue.Queue[_Write]" = queue.Queue()
+        threading.Thread(target=self._work, name="db-group-commit", daemon=True).start()
+
+    def submit(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        write = _Write(fn)
+        self._queue.put(write)
+        return write.future.result()
+
+    def _next_batch(self) -> List[_Write]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + DB_GROUP_COMMIT_WINDOW_S
+        while len(batch) < DB_GROUP_COMMIT_MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _work(self) -> None:
+        while True:
+            batch = self._next_batch()
+            results: List[tuple] = []
+            try:
+                with self.pool.writer_lock:
+                    db = self.pool.writer()
+                    db.execute("BEGIN IMMEDIATE")
+                    try:
+                        for write in batch:
+                            db.execute("SAVEPOINT group_write")
+                            try:
+                                results.append((write, write.fn(db), None))
+                                db.execute("RELEASE group_write")
+                            except Exception as exc:
+                                db.execute("ROLLBACK TO group_write")
+                                db.execute("RELEASE group_write")
+                                results.append((write, None, exc))
+                        db.commit()
+                    except Exception:
+                        db.rollback()
+                        raise
+            except Exception as exc:
+                for write in batch:
+                    if not write.future.done():
+                        write.future.set_exception(exc)
+                continue
+            for write, result, error in results:
+                if error is not None:
+                    write.future.set_exception(error)
+                else:
+                    write.future.set_result(result)
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pool_lock = threading.Lock()
+_current_shard: ContextVar[str] = ContextVar("db_shard", default=HOME_SHARD)
+
+
+def shard_names() -> List[str]:
+    return [HOME_SHARD, *DB_SHARDS]
+
+
+def shard_path(name: str) -> str:
+    if name == HOME_SHARD:
+        return DB_PATH
+    try:
+        return DB_SHARDS[name]
+    except KeyError:
+        raise ValueError(f"unknown shard {name!r}; configure it in DB_SHARDS") from None
+
+
+def current_shard() -> str:
+    return _current_shard.get()
+
+
+@contextmanager
+def use_shard(name: str) -> Iterator[None]:
+    """Point ``get_pool()``, and every helper built on it, at shard ``name`` inside the block.
+
+    Transactions are per shard: ``transaction()`` inside the block commits that shard only.
+    """
+    shard_path(name)
+    token = _current_shard.set(name)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
+
+
+def get_pool(shard: Optional[str] = None) -> ConnectionPool:
+    name = shard or _current_shard.get()
+    path = shard_path(name)
+    pool = _pools.get(name)
+    # Connections must never cross a fork (gunicorn --preload), so rebuild per pid.
+    if pool is None or pool.pid != os.getpid() or pool.path != path:
+        with _pool_lock:
+            pool = _pools.get(name)
+            if pool is None or pool.pid != os.getpid() or pool.path != path:
+                pool = _pools[name] = ConnectionPool(path, home=None if name == HOME_SHARD else DB_PATH)
+    return pool
+
+
+T = TypeVar("T")
+
+
+def scatter(fn: Callable[[], T], shards: Optional[Iterable[str]] = None) -> List[T]:
+    """Call ``fn`` once per shard, with that shard current, and return the results in shard order.
+
+    Runs in the calling thread, so ``fn`` can use the request's connections. Shards are
+    local files and the fan-out queries are indexed, so a thread hop would cost more
+    than it saves.
+    """
+    results = []
+    for name in shard_names() if shards is None else shards:
+        with use_shard(name):
+            results.append(fn())
+    return results
+
+
+def place_hospital(hospital_id: str) -> str:
+    """Shard for a newly registered hospital: spread by id over the DB_SHARDS files."""
+    names = list(DB_SHARDS) or [HOME_SHARD]
+    return names[zlib.crc32(hospital_id.encode()) % len(names)]
+
+
+_locations = LRUCache(SHARD_LOCATION_CACHE_SIZE)
+
+
+def _probe(shard: str, sql: str, params: Sequence[Any]) -> Optional[sqlite3.Row]:
+    pool = get_pool(shard)
+    db = pool.acquire_reader()
+    try:
+        started = time.perf_counter()
+        row = db.execute(sql, params).fetchone()
+        _observe(db, sql, params, started, 1 if row else 0)
+        return row
+    finally:
+        pool.release_reader(db)
+
+
+def locate(table: str, row_id: str) -> str:
+    """Shard holding row ``row_id`` of ``hospitals``, ``doctors`` or ``appointments``.
+
+    Hospitals are looked up in the ``hospital_shards`` directory; doctors and appointments
+    by probing each shard's primary key. Answers are cached for the life of the process,
+    since rows only move while the servers are stopped (see shards.py). Unknown ids
+    resolve to the home shard, where the lookup that follows finds nothing.
+    """
+    if not DB_SHARDS:
+        return HOME_SHARD
+    shard = _locations.get((table, row_id))
+    if shard is not None:
+        return shard
+    if table == "hospitals":
+        row = _probe(HOME_SHARD, "SELECT shard FROM hospital_shards WHERE hospital_id = ?", (row_id,))
+        shard = row["shard"] if row else None
+    else:
+        sql = f"SELECT 1 FROM {table} WHERE id = ?"
+        shard = next((name for name in shard_names() if _probe(name, sql, (row_id,))), None)
+    if shard is None:
+        return HOME_SHARD
+    _locations.set((table, row_id), shard)
+    return shard
+
+
+@contextmanager
+def transaction() -> Iterator[sqlite3.Connection]:
+    """Run a unit of work on the writer connection and commit it once.
+
+    Nested calls join the outer transaction. Inside it, ``run``/``get_one``/``get_all``
+    use the writer too, so reads see the transaction's own uncommitted writes.
+    """
+    pool = get_pool()
+    waited = time.perf_counter()
+    with pool.writer_lock:
+        db = pool.writer()
+        if pool.in_transaction():
+            pool._tx_depth += 1
+            try:
+                yield db
+            finally:
+                pool._tx_depth -= 1
+            return
+        # Includes busy_timeout waits on other processes' writers.
+        db.execute("BEGIN IMMEDIATE")
+        registry.observe("db_writer_lock_wait_seconds", None, time.perf_counter() - waited)
+        pool._tx_owner = threading.get_ident()
+        pool._tx_depth = 1
+        try:
+            yield db
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            pool._tx_owner = None
+            pool._tx_depth = 0
+
+
+def _read_connection() -> sqlite3.Connection:
+    pool = get_pool()
+    if pool.in_transaction():
+        return pool.writer()
+    return get_db()
 
 
 def get_db() -> sqlite3.Connection:
-    db = getattr(g, "_db", None)
+    shard = _current_shard.get()
+    dbs = g.setdefault("_dbs", {})
+    db = dbs.get(shard)
     if db is None:
-        db = sqlite3.connect(DB_PATH, detect_types=sqlite3.PARSE_DECLTYPES)
-        db.row_factory = sqlite3.Row
-        db.execute("PRAGMA foreign_keys = ON;")
-        g._db = db
+        db = dbs[shard] = get_pool(shard).acquire_reader()
     return db
 
 
 def close_db(_exc: Optional[BaseException] = None) -> None:
-    db = g.pop("_db", None)
-    if db is not None:
-        db.close()
+    for shard, db in g.pop("_dbs", {}).items():
+        get_pool(shard).release_reader(db)
 
 
 def row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
     return {k: row[k] for k in row.keys()} if row else {}
 
 
-def init_db() -> None:
-    db = get_db()
-    db.executescript(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            mobile TEXT,
-            password_hash TEXT NOT NULL,
-            height REAL,
-            weight REAL,
-            dob TEXT,
-            age INTEGER,
-            address TEXT,
-            latitude REAL,
-            longitude REAL,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
-        );
-
-        CREATE TABLE IF NOT EXISTS hospitals (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            emergency INTEGER DEFAULT 0,
-            morning_from TEXT,
-            morning_to TEXT,
-            evening_from TEXT,
-            evening_to TEXT,
-            address TEXT,
-            latitude REAL,
-            longitude REAL,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
-        );
-
-        CREATE TABLE IF NOT EXISTS doctors (
-            id TEXT PRIMARY KEY,
-            hospital_id TEXT NOT NULL,
-            name TEXT NOT NULL,
-            qualification TEXT,
-            specialization TEXT,
-            description TEXT,
-            latitude REAL,
-            longitude REAL,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (hospital_id) REFERENCES hospitals(id) ON DELETE CASCADE
-        );
-
-        CREATE TABLE IF NOT EXISTS appointments (
-            id TEXT PRIMARY KEY,
-            user_id TEXT NOT NULL,
-            hospital_id TEXT NOT NULL,
-            doctor_id TEXT NOT NULL,
-            problem TEXT,
-            status TEXT DEFAULT 'Booked',
-            preferred_time TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
-            FOREIGN KEY (hospital_id) REFERENCES hospitals(id) ON DELETE CASCADE,
-            FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE
-        );
-
-        CREATE TABLE IF NOT EXISTS firstaid_chats (
-            id TEXT PRIMARY KEY,
-            user_id TEXT,
-            prompt TEXT,
-            response TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
-        );
-        """
+# Ordered schema migrations; a database's position is tracked in PRAGMA user_version.
+# Append new entries, never edit shipped ones.
+MIGRATIONS: List[str] = [
+    # 1: base schema
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        mobile TEXT,
+        password_hash TEXT NOT NULL,
+        height REAL,
+        weight REAL,
+        dob TEXT,
+        age INTEGER,
+        address TEXT,
+        latitude REAL,
+        longitude REAL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS hospitals (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        emergency INTEGER DEFAULT 0,
+        morning_from TEXT,
+        morning_to TEXT,
+        evening_from TEXT,
+        evening_to TEXT,
+        address TEXT,
+        latitude REAL,
+        longitude REAL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS doctors (
+        id TEXT PRIMARY KEY,
+        hospital_id TEXT NOT NULL,
+        name TEXT NOT NULL,
+        qualification TEXT,
+        specialization TEXT,
+        description TEXT,
+        latitude REAL,
+        longitude REAL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (hospital_id) REFERENCES hospitals(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS appointments (
+        id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        hospital_id TEXT NOT NULL,
+        doctor_id TEXT NOT NULL,
+        problem TEXT,
+        status TEXT DEFAULT 'Booked',
+        preferred_time TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY (hospital_id) REFERENCES hospitals(id) ON DELETE CASCADE,
+        FOREIGN KEY (doctor_id) REFERENCES doctors(id) ON DELETE CASCADE
+    );
+
+    CREATE TABLE IF NOT EXISTS firstaid_chats (
+        id TEXT PRIMARY KEY,
+        user_id TEXT,
+        prompt TEXT,
+        response TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL
+    );
+    """,
+    # 2: hospital geo index
+    """
+    -- R*Tree over hospital coordinates, keyed by hospitals.rowid.
+    CREATE VIRTUAL TABLE IF NOT EXISTS hospitals_geo USING rtree(
+        id, min_lat, max_lat, min_lng, max_lng
+    );
+
+    CREATE TRIGGER IF NOT EXISTS hospitals_geo_ai AFTER INSERT ON hospitals
+    WHEN typeof(NEW.latitude) IN ('real', 'integer') AND typeof(NEW.longitude) IN ('real', 'integer')
+    BEGIN
+        INSERT INTO hospitals_geo VALUES (NEW.rowid, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS hospitals_geo_au AFTER UPDATE OF latitude, longitude ON hospitals
+    BEGIN
+        DELETE FROM hospitals_geo WHERE id = OLD.rowid;
+        INSERT INTO hospitals_geo
+        SELECT NEW.rowid, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+        WHERE typeof(NEW.latitude) IN ('real', 'integer') AND typeof(NEW.longitude) IN ('real', 'integer');
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS hospitals_geo_ad AFTER DELETE ON hospitals
+    BEGIN
+        DELETE FROM hospitals_geo WHERE id = OLD.rowid;
+    END;
+
+    DELETE FROM hospitals_geo;
+    INSERT INTO hospitals_geo
+    SELECT rowid, latitude, latitude, longitude, longitude FROM hospitals
+    WHERE typeof(latitude) IN ('real', 'integer') AND typeof(longitude) IN ('real', 'integer');
+    """,
+    # 3: doctor full-text index
+    """
+    -- Full-text index over the doctors' searchable columns (external content).
+    CREATE VIRTUAL TABLE IF NOT EXISTS doctors_fts USING fts5(
+        name, qualification, specialization, description,
+        content='doctors',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    );
+
+    CREATE TRIGGER IF NOT EXISTS doctors_fts_ai AFTER INSERT ON doctors
+    BEGIN
+        INSERT INTO doctors_fts (rowid, name, qualification, specialization, description)
+        VALUES (NEW.rowid, NEW.name, NEW.qualification, NEW.specialization, NEW.description);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS doctors_fts_au AFTER UPDATE OF name, qualification, specialization, description ON doctors
+    BEGIN
+        INSERT INTO doctors_fts (doctors_fts, rowid, name, qualification, specialization, description)
+        VALUES ('delete', OLD.rowid, OLD.name, OLD.qualification, OLD.specialization, OLD.description);
+        INSERT INTO doctors_fts (rowid, name, qualification, specialization, description)
+        VALUES (NEW.rowid, NEW.name, NEW.qualification, NEW.specialization, NEW.description);
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS doctors_fts_ad AFTER DELETE ON doctors
+    BEGIN
+        INSERT INTO doctors_fts (doctors_fts, rowid, name, qualification, specialization, description)
+        VALUES ('delete', OLD.rowid, OLD.name, OLD.qualification, OLD.specialization, OLD.description);
+    END;
+
+    INSERT INTO doctors_fts (doctors_fts) VALUES ('rebuild');
+    """,
+    # 4: secondary indexes for the listing and lookup paths
+    """
+    CREATE INDEX IF NOT EXISTS idx_doctors_hospital ON doctors (hospital_id);
+    CREATE INDEX IF NOT EXISTS idx_appointments_user_created ON appointments (user_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_appointments_doctor_created ON appointments (doctor_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_appointments_hospital_created ON appointments (hospital_id, created_at);
+    CREATE INDEX IF NOT EXISTS idx_appointments_created ON appointments (created_at);
+    CREATE INDEX IF NOT EXISTS idx_firstaid_chats_user ON firstaid_chats (user_id);
+    """,
+    # 5: background first-aid jobs
+    """
+    CREATE TABLE IF NOT EXISTS firstaid_jobs (
+        id TEXT PRIMARY KEY,
+        user_id TEXT,
+        prompt TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'queued',
+        chat_id TEXT,
+        error TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE SET NULL,
+        FOREIGN KEY (chat_id) REFERENCES firstaid_chats(id) ON DELETE SET NULL
+    );
+    """,
+    # 6: shared first-aid response text + prompt cache
+    """
+    CREATE TABLE IF NOT EXISTS firstaid_responses (
+        id TEXT PRIMARY KEY,
+        response TEXT NOT NULL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE TABLE IF NOT EXISTS firstaid_cache (
+        prompt_hash TEXT PRIMARY KEY,
+        response_id TEXT NOT NULL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        expires_at TEXT NOT NULL,
+        FOREIGN KEY (response_id) REFERENCES firstaid_responses(id) ON DELETE CASCADE
+    );
+    CREATE INDEX IF NOT EXISTS idx_firstaid_cache_created ON firstaid_cache (created_at);
+
+    ALTER TABLE firstaid_chats ADD COLUMN response_id TEXT REFERENCES firstaid_responses(id);
+    CREATE INDEX IF NOT EXISTS idx_firstaid_chats_response ON firstaid_chats (response_id);
+    """,
+    # 7: change counters for conditional GETs (per resource, plus 'table'/'search' for search results)
+    """
+    CREATE TABLE IF NOT EXISTS row_versions (
+        entity TEXT NOT NULL,
+        id TEXT NOT NULL,
+        version INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (entity, id)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS users_version_au AFTER UPDATE ON users
+    BEGIN
+        INSERT INTO row_versions (entity, id, version) VALUES ('user', NEW.id, 1)
+        ON CONFLICT (entity, id) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS users_version_ad AFTER DELETE ON users
+    BEGIN
+        INSERT INTO row_versions (entity, id, version) VALUES ('user', OLD.id, 1)
+        ON CONFLICT (entity, id) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS hospitals_version_ai AFTER INSERT ON hospitals
+    BEGIN
+        INSERT INTO row_versions (entity, id, version) VALUES ('table', 'search', 1)
+        ON CONFLICT (entity, id) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS hospitals_version_au AFTER UPDATE ON hospitals
+    BEGIN
+        INSERT INTO row_versions (entity, id, version) VALUES ('hospital', NEW.id, 1)
+        ON CONFLICT (entity, id) DO UPDATE SET version = version + 1;
+        INSERT INTO row_versions (entity, id, version) VALUES ('table', 'search', 1)
+        ON CONFLICT (entity, id) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS hospitals_version_ad AFTER DELETE ON hospitals
+    BEGIN
+        INSERT INTO row_versions (entity, id, version) VALUES ('hospital', OLD.id, 1)
+        ON CONFLICT (entity, id) DO UPDATE SET version = version + 1;
+        INSERT INTO row_versions (entity, id, version) VALUES ('table', 'search', 1)
+        ON CONFLICT (entity, id) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS doctors_version_ai AFTER INSERT ON doctors
+    BEGIN
+        INSERT INTO row_versions (entity, id, version) VALUES ('hospital', NEW.hospital_id, 1)
+        ON CONFLICT (entity, id) DO UPDATE SET version = version + 1;
+        INSERT INTO row_versions (entity, id, version) VALUES ('table', 'search', 1)
+        ON CONFLICT (entity, id) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS doctors_version_au AFTER UPDATE ON doctors
+    BEGIN
+        INSERT INTO row_versions (entity, id, version) VALUES ('hospital', NEW.hospital_id, 1)
+        ON CONFLICT (entity, id) DO UPDATE SET version = version + 1;
+        INSERT INTO row_versions (entity, id, version) VALUES ('table', 'search', 1)
+        ON CONFLICT (entity, id) DO UPDATE SET version = version + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS doctors_version_ad AFTER DELETE ON doctors
+    BEGIN
+        INSERT INTO row_versions (entity, id, version) VALUES ('hospital', OLD.hospital_id, 1)
+        ON CONFLICT (entity, id) DO UPDATE SET version = version + 1;
+        INSERT INTO row_versions (entity, id, version) VALUES ('table', 'search', 1)
+        ON CONFLICT (entity, id) DO UPDATE SET version = version + 1;
+    END;
+    """,
+    # 8: append-only appointment change log tailed by the SSE feeds. AUTOINCREMENT
+    # keeps ids unique after pruning, since clients resume from them.
+    """
+    CREATE TABLE IF NOT EXISTS appointment_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        appointment_id TEXT NOT NULL,
+        hospital_id TEXT,
+        doctor_id TEXT,
+        type TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_appointment_events_hospital ON appointment_events(hospital_id, id);
+    CREATE INDEX IF NOT EXISTS idx_appointment_events_doctor ON appointment_events(doctor_id, id);
+    """,
+    # 9: slot-based booking. slot_bookings counts the live (not cancelled) appointments
+    # per doctor and slot; the triggers keep it in step with every write to appointments.
+    """
+    ALTER TABLE doctors ADD COLUMN slot_capacity INTEGER NOT NULL DEFAULT 1;
+    ALTER TABLE appointments ADD COLUMN slot_start TEXT;
+
+    CREATE TABLE IF NOT EXISTS slot_bookings (
+        doctor_id TEXT NOT NULL,
+        slot_start TEXT NOT NULL,
+        booked INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (doctor_id, slot_start)
+    ) WITHOUT ROWID;
+
+    CREATE TRIGGER IF NOT EXISTS appointments_slot_ai AFTER INSERT ON appointments
+    WHEN NEW.slot_start IS NOT NULL AND NEW.status IS NOT 'Cancelled'
+    BEGIN
+        INSERT INTO slot_bookings (doctor_id, slot_start, booked) VALUES (NEW.doctor_id, NEW.slot_start, 1)
+        ON CONFLICT (doctor_id, slot_start) DO UPDATE SET booked = booked + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS appointments_slot_au AFTER UPDATE OF status, doctor_id, slot_start ON appointments
+    WHEN (OLD.status IS 'Cancelled') IS NOT (NEW.status IS 'Cancelled')
+      OR OLD.doctor_id IS NOT NEW.doctor_id OR OLD.slot_start IS NOT NEW.slot_start
+    BEGIN
+        UPDATE slot_bookings SET booked = booked - 1
+        WHERE doctor_id = OLD.doctor_id AND slot_start = OLD.slot_start AND OLD.status IS NOT 'Cancelled';
+        INSERT INTO slot_bookings (doctor_id, slot_start, booked)
+        SELECT NEW.doctor_id, NEW.slot_start, 1 WHERE NEW.slot_start IS NOT NULL AND NEW.status IS NOT 'Cancelled'
+        ON CONFLICT (doctor_id, slot_start) DO UPDATE SET booked = booked + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS appointments_slot_ad AFTER DELETE ON appointments
+    WHEN OLD.slot_start IS NOT NULL AND OLD.status IS NOT 'Cancelled'
+    BEGIN
+        UPDATE slot_bookings SET booked = booked - 1 WHERE doctor_id = OLD.doctor_id AND slot_start = OLD.slot_start;
+    END;
+    """,
+    # 10: shard directory, read from the home database only. Every hospital has a row
+    # naming the shard that holds it; the email column keeps logins unique across shards.
+    """
+    CREATE TABLE IF NOT EXISTS hospital_shards (
+        hospital_id TEXT PRIMARY KEY,
+        shard TEXT NOT NULL,
+        email TEXT UNIQUE NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS idx_hospital_shards_shard ON hospital_shards (shard);
+
+    INSERT OR IGNORE INTO hospital_shards (hospital_id, shard, email) SELECT id, 'home', email FROM hospitals;
+    """,
+    # 11: appointment statistics. Status changes are timestamped, and triggers add every
+    # booking and status change to appointment_stats, per hospital and per doctor and
+    # 15-minute UTC period (unix time / 900). Deletes leave those counts alone, so archived
+    # history keeps counting. appointment_queue counts the open appointments in this database.
+    """
+    ALTER TABLE appointments ADD COLUMN started_at TEXT;
+    ALTER TABLE appointments ADD COLUMN completed_at TEXT;
+    ALTER TABLE appointments ADD COLUMN cancelled_at TEXT;
+
+    CREATE TABLE IF NOT EXISTS appointment_stats (
+        entity TEXT NOT NULL,
+        id TEXT NOT NULL,
+        period INTEGER NOT NULL,
+        booked INTEGER NOT NULL DEFAULT 0,
+        started INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0,
+        cancelled INTEGER NOT NULL DEFAULT 0,
+        wait_seconds INTEGER NOT NULL DEFAULT 0,
+        timed_starts INTEGER NOT NULL DEFAULT 0,
+        turnaround_seconds INTEGER NOT NULL DEFAULT 0,
+        timed_completions INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (entity, id, period)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS appointment_queue (
+        entity TEXT NOT NULL,
+        id TEXT NOT NULL,
+        status TEXT NOT NULL,
+        appointments INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (entity, id, status)
+    ) WITHOUT ROWID;
+
+    -- What each appointment contributes to appointment_stats, one row per event and entity.
+    -- Rows from before this migration have no transition times; their events count at
+    -- created_at, without a duration.
+    CREATE VIEW IF NOT EXISTS appointment_stat_events AS
+    SELECT a.rowid AS appointment_rowid, 'booked' AS event, e.column1 AS entity,
+           IIF(e.column1 = 'hospital', a.hospital_id, a.doctor_id) AS id,
+           CAST(strftime('%s', a.created_at) AS INTEGER) / 900 AS period,
+           1 AS booked, 0 AS started, 0 AS completed, 0 AS cancelled,
+           0 AS wait_seconds, 0 AS timed_starts, 0 AS turnaround_seconds, 0 AS timed_completions
+    FROM appointments a, (VALUES ('hospital'), ('doctor')) e
+    UNION ALL
+    SELECT a.rowid, 'started', e.column1, IIF(e.column1 = 'hospital', a.hospital_id, a.doctor_id),
+           CAST(strftime('%s', COALESCE(a.started_at, a.created_at)) AS INTEGER) / 900,
+           0, 1, 0, 0,
+           COALESCE(strftime('%s', a.started_at) - strftime('%s', a.created_at), 0), a.started_at IS NOT NULL, 0, 0
+    FROM appointments a, (VALUES ('hospital'), ('doctor')) e
+    WHERE a.started_at IS NOT NULL OR a.status = 'In Consultation'
+    UNION ALL
+    SELECT a.rowid, 'completed', e.column1, IIF(e.column1 = 'hospital', a.hospital_id, a.doctor_id),
+           CAST(strftime('%s', COALESCE(a.completed_at, a.created_at)) AS INTEGER) / 900,
+           0, 0, 1, 0,
+           0, 0, COALESCE(strftime('%s', a.completed_at) - strftime('%s', a.created_at), 0), a.completed_at IS NOT NULL
+    FROM appointments a, (VALUES ('hospital'), ('doctor')) e
+    WHERE a.completed_at IS NOT NULL OR a.status = 'Completed'
+    UNION ALL
+    SELECT a.rowid, 'cancelled', e.column1, IIF(e.column1 = 'hospital', a.hospital_id, a.doctor_id),
+           CAST(strftime('%s', COALESCE(a.cancelled_at, a.created_at)) AS INTEGER) / 900,
+           0, 0, 0, 1, 0, 0, 0, 0
+    FROM appointments a, (VALUES ('hospital'), ('doctor')) e
+    WHERE a.cancelled_at IS NOT NULL OR a.status = 'Cancelled';
+
+    CREATE TRIGGER IF NOT EXISTS appointments_stats_ai AFTER INSERT ON appointments
+    BEGIN
+        INSERT INTO appointment_stats (entity, id, period, booked, started, completed, cancelled,
+                                       wait_seconds, timed_starts, turnaround_seconds, timed_completions)
+        SELECT entity, id, period, SUM(booked), SUM(started), SUM(completed), SUM(cancelled),
+               SUM(wait_seconds), SUM(timed_starts), SUM(turnaround_seconds), SUM(timed_completions)
+        FROM appointment_stat_events WHERE appointment_rowid = NEW.rowid AND period IS NOT NULL
+        GROUP BY entity, id, period
+        ON CONFLICT (entity, id, period) DO UPDATE SET
+            booked = booked + excluded.booked, started = started + excluded.started,
+            completed = completed + excluded.completed, cancelled = cancelled + excluded.cancelled,
+            wait_seconds = wait_seconds + excluded.wait_seconds, timed_starts = timed_starts + excluded.timed_starts,
+            turnaround_seconds = turnaround_seconds + excluded.turnaround_seconds,
+            timed_completions = timed_completions + excluded.timed_completions;
+        INSERT INTO appointment_queue (entity, id, status, appointments)
+        SELECT 'hospital', NEW.hospital_id, NEW.status, 1 WHERE NEW.status IN ('Booked', 'In Consultation')
+        UNION ALL
+        SELECT 'doctor', NEW.doctor_id, NEW.status, 1 WHERE NEW.status IN ('Booked', 'In Consultation')
+        ON CONFLICT (entity, id, status) DO UPDATE SET appointments = appointments + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS appointments_stats_au AFTER UPDATE OF status ON appointments
+    WHEN OLD.status IS NOT NEW.status
+    BEGIN
+        INSERT INTO appointment_stats (entity, id, period, booked, started, completed, cancelled,
+                                       wait_seconds, timed_starts, turnaround_seconds, timed_completions)
+        SELECT entity, id, period, SUM(booked), SUM(started), SUM(completed), SUM(cancelled),
+               SUM(wait_seconds), SUM(timed_starts), SUM(turnaround_seconds), SUM(timed_completions)
+        FROM appointment_stat_events
+        WHERE appointment_rowid = NEW.rowid AND period IS NOT NULL
+          AND event = CASE NEW.status
+              WHEN 'In Consultation' THEN 'started' WHEN 'Completed' THEN 'completed' WHEN 'Cancelled' THEN 'cancelled'
+          END
+        GROUP BY entity, id, period
+        ON CONFLICT (entity, id, period) DO UPDATE SET
+            booked = booked + excluded.booked, started = started + excluded.started,
+            completed = completed + excluded.completed, cancelled = cancelled + excluded.cancelled,
+            wait_seconds = wait_seconds + excluded.wait_seconds, timed_starts = timed_starts + excluded.timed_starts,
+            turnaround_seconds = turnaround_seconds + excluded.turnaround_seconds,
+            timed_completions = timed_completions + excluded.timed_completions;
+        UPDATE appointment_queue SET appointments = appointments - 1
+        WHERE entity = 'hospital' AND id = OLD.hospital_id AND status = OLD.status;
+        UPDATE appointment_queue SET appointments = appointments - 1
+        WHERE entity = 'doctor' AND id = OLD.doctor_id AND status = OLD.status;
+        INSERT INTO appointment_queue (entity, id, status, appointments)
+        SELECT 'hospital', NEW.hospital_id, NEW.status, 1 WHERE NEW.status IN ('Booked', 'In Consultation')
+        UNION ALL
+        SELECT 'doctor', NEW.doctor_id, NEW.status, 1 WHERE NEW.status IN ('Booked', 'In Consultation')
+        ON CONFLICT (entity, id, status) DO UPDATE SET appointments = appointments + 1;
+    END;
+
+    CREATE TRIGGER IF NOT EXISTS appointments_stats_ad AFTER DELETE ON appointments
+    WHEN OLD.status IN ('Booked', 'In Consultation')
+    BEGIN
+        UPDATE appointment_queue SET appointments = appointments - 1
+        WHERE entity = 'hospital' AND id = OLD.hospital_id AND status = OLD.status;
+        UPDATE appointment_queue SET appointments = appointments - 1
+        WHERE entity = 'doctor' AND id = OLD.doctor_id AND status = OLD.status;
+    END;
+
+    INSERT INTO appointment_stats (entity, id, period, booked, started, completed, cancelled,
+                                   wait_seconds, timed_starts, turnaround_seconds, timed_completions)
+    SELECT entity, id, period, SUM(booked), SUM(started), SUM(completed), SUM(cancelled),
+           SUM(wait_seconds), SUM(timed_starts), SUM(turnaround_seconds), SUM(timed_completions)
+    FROM appointment_stat_events WHERE period IS NOT NULL
+    GROUP BY entity, id, period;
+
+    INSERT INTO appointment_queue (entity, id, status, appointments)
+    SELECT 'hospital', hospital_id, status, COUNT(*) FROM appointments
+    WHERE status IN ('Booked', 'In Consultation') GROUP BY hospital_id, status
+    UNION ALL
+    SELECT 'doctor', doctor_id, status, COUNT(*) FROM appointments
+    WHERE status IN ('Booked', 'In Consultation') GROUP BY doctor_id, status;
+    """,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def _statements(script: str) -> List[str]:
+    statements: List[str] = []
+    buf = ""
+    for line in script.splitlines(keepends=True):
+        buf += line
+        if sqlite3.complete_statement(buf):
+            statements.append(buf.strip())
+            buf = ""
+    if buf.strip():
+        statements.append(buf.strip())
+    return statements
+
+
+def schema_version(db: sqlite3.Connection) -> int:
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+def init_db() -> int:
+    """Apply pending migrations to the current shard and return the resulting schema version.
+
+    Safe to call from several workers at once: BEGIN IMMEDIATE serializes them and
+    the version is re-read under the lock. Runs on a connection of its own because
+    pooled shard connections see ``users`` through the home database.
+    """
+    pool = get_pool()
+    with pool.writer_lock:
+        db = _connect(pool.path, readonly=False)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            version = schema_version(db)
+            for target in range(version + 1, SCHEMA_VERSION + 1):
+                for statement in _statements(MIGRATIONS[target - 1]):
+                    db.execute(statement)
+                db.execute(f"PRAGMA user_version = {target}")
+            db.commit()
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    return max(version, SCHEMA_VERSION)
+
+
+def init_shards() -> int:
+    """Migrate the home database and every DB_SHARDS file; return the schema version."""
+    return min(scatter(init_db))
+
+
+def sync_hospital_directory() -> None:
+    """Add directory rows for hospitals loaded straight into the home database.
+
+    Raises ``sqlite3.IntegrityError`` when one's email is already registered elsewhere.
+    """
+    with use_shard(HOME_SHARD), transaction() as db:
+        db.execute(
+            """
+            INSERT INTO hospital_shards (hospital_id, shard, email)
+            SELECT id, ?, email FROM hospitals h
+            WHERE NOT EXISTS (SELECT 1 FROM hospital_shards s WHERE s.hospital_id = h.id)
+            """,
+            (HOME_SHARD,),
+        )
+
+
+def rebuild_search_indexes() -> None:
+    # VACUUM may renumber rowids of tables without an INTEGER PRIMARY KEY, which the
+    # geo and full-text indexes are keyed on; run this after any full VACUUM.
+    with transaction() as db:
+        db.execute("DELETE FROM hospitals_geo")
+        db.execute(
+            """
+            INSERT INTO hospitals_geo
+            SELECT rowid, latitude, latitude, longitude, longitude FROM hospitals
+            WHERE typeof(latitude) IN ('real', 'integer') AND typeof(longitude) IN ('real', 'integer')
+            """
+        )
+        db.execute("INSERT INTO doctors_fts (doctors_fts) VALUES ('rebuild')")
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_label(sql: str) -> str:
+    """Whitespace-collapsed statement text, short enough to use as a metric label."""
+    text = re.sub(r"\s+", " ", sql).strip()
+    return text if len(text) <= 160 else text[:157] + "..."
+
+
+_explained_at: Dict[str, float] = {}
+
+
+def _observe(db: sqlite3.Connection, sql: str, params: Sequence[Any], started: float, rows: int) -> None:
+    elapsed = time.perf_counter() - started
+    label = {"statement": statement_label(sql)}
+    registry.observe("db_query_duration_seconds", label, elapsed)
+    if rows:
+        registry.inc("db_query_rows_total", label, rows)
+    if elapsed < DB_SLOW_QUERY_S:
+        return
+    registry.inc("db_slow_queries_total", label)
+    now = time.monotonic()
+    if now - _explained_at.get(label["statement"], float("-inf")) < SLOW_QUERY_EXPLAIN_INTERVAL_S:
+        return
+    _explained_at[label["statement"]] = now
+    try:
+        plan = [row["detail"] for row in db.execute(f"EXPLAIN QUERY PLAN {sql}", tuple(params))]
+    except sqlite3.Error:
+        plan = []
+    logger.warning("Slow query (%.0f ms): %s | plan: %s", elapsed * 1000, label["statement"], "; ".join(plan))
+    registry.record_slow_query(
+        {
+            "at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "sql": label["statement"],
+            "duration_ms": round(elapsed * 1000, 1),
+            "plan": plan,
+        }
     )
-    db.commit()
+
+
+def _execute(db: sqlite3.Connection, sql: str, params: Sequence[Any]) -> List[sqlite3.Row]:
+    started = time.perf_counter()
+    rows = db.execute(sql, params).fetchall()
+    _observe(db, sql, params, started, len(rows))
+    return rows
+
+
+def rebuild_slot_bookings() -> None:
+    """Recount ``slot_bookings`` from appointments (after a load that bypassed the triggers)."""
+    with transaction() as db:
+        db.execute("DELETE FROM slot_bookings")
+        db.execute(
+            """
+            INSERT INTO slot_bookings (doctor_id, slot_start, booked)
+            SELECT doctor_id, slot_start, COUNT(*) FROM appointments
+            WHERE slot_start IS NOT NULL AND status IS NOT 'Cancelled'
+            GROUP BY doctor_id, slot_start
+            """
+        )
+
+
+def rebuild_appointment_stats(after_rowid: int) -> None:
+    """Catch the statistics up with appointments loaded while the triggers were dropped.
+
+    Rows past ``after_rowid`` are added to ``appointment_stats``; earlier counts stay, since
+    they include archived appointments. ``appointment_queue`` is recounted from scratch.
+    """
+    with transaction() as db:
+        db.execute(
+            """
+            INSERT INTO appointment_stats (entity, id, period, booked, started, completed, cancelled,
+                                           wait_seconds, timed_starts, turnaround_seconds, timed_completions)
+            SELECT entity, id, period, SUM(booked), SUM(started), SUM(completed), SUM(cancelled),
+                   SUM(wait_seconds), SUM(timed_starts), SUM(turnaround_seconds), SUM(timed_completions)
+            FROM appointment_stat_events WHERE appointment_rowid > ? AND period IS NOT NULL
+            GROUP BY entity, id, period
+            ON CONFLICT (entity, id, period) DO UPDATE SET
+                booked = booked + excluded.booked, started = started + excluded.started,
+                completed = completed + excluded.completed, cancelled = cancelled + excluded.cancelled,
+                wait_seconds = wait_seconds + excluded.wait_seconds,
+                timed_starts = timed_starts + excluded.timed_starts,
+                turnaround_seconds = turnaround_seconds + excluded.turnaround_seconds,
+                timed_completions = timed_completions + excluded.timed_completions
+            """,
+            (after_rowid,),
+        )
+        db.execute("DELETE FROM appointment_queue")
+        db.execute(
+            """
+            INSERT INTO appointment_queue (entity, id, status, appointments)
+            SELECT 'hospital', hospital_id, status, COUNT(*) FROM appointments
+            WHERE status IN ('Booked', 'In Consultation') GROUP BY hospital_id, status
+            UNION ALL
+            SELECT 'doctor', doctor_id, status, COUNT(*) FROM appointments
+            WHERE status IN ('Booked', 'In Consultation') GROUP BY doctor_id, status
+            """
+        )
+
+
+def _write(apply: Callable[[sqlite3.Connection], Any]) -> Any:
+    pool = get_pool()
+    if DB_GROUP_COMMIT and not pool.in_transaction():
+        return pool.committer().submit(apply)
+    with transaction() as db:
+        return apply(db)
 
 
 def run(sql: str, params: Iterable[Any] = ()) -> None:
-    db = get_db()
-    db.execute(sql, tuple(params))
-    db.commit()
+    params = tuple(params)
+
+    def apply(db: sqlite3.Connection) -> None:
+        started = time.perf_counter()
+        cur = db.execute(sql, params)
+        _observe(db, sql, params, started, max(cur.rowcount, 0))
+
+    _write(apply)
+
+
+def mutate(sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
+    """Execute an ``INSERT/UPDATE/DELETE ... RETURNING`` statement and return the affected rows.
+
+    One round trip replaces the usual existence check + write + re-read; a row that
+    did not exist simply comes back as an empty list.
+    """
+    params = tuple(params)
+    return _write(lambda db: [row_to_dict(r) for r in _execute(db, sql, params)])
+
+
+def mutate_one(sql: str, params: Iterable[Any] = ()) -> Optional[Dict[str, Any]]:
+    rows = mutate(sql, params)
+    return rows[0] if rows else None
+
+
+def executemany(sql: str, rows: Iterable[Sequence[Any]], batch_size: int = 1000) -> int:
+    """Execute ``sql`` for every parameter row, committing once per ``batch_size`` rows.
+
+    Inside an enclosing ``transaction()`` everything is part of that single commit.
+    Returns the number of rows processed.
+    """
+    total = 0
+    batch: List[Sequence[Any]] = []
+
+    def flush() -> None:
+        with transaction() as db:
+            started = time.perf_counter()
+            db.executemany(sql, batch)
+            _observe(db, sql, batch[0], started, len(batch))
+
+    for row in rows:
+        batch.append(tuple(row))
+        if len(batch) >= batch_size:
+            flush()
+            total += len(batch)
+            batch = []
+    if batch:
+        flush()
+        total += len(batch)
+    return total
 
 
 def get_one(sql: str, params: Iterable[Any] = ()) -> Optional[Dict[str, Any]]:
-    db = get_db()
-    cur = db.execute(sql, tuple(params))
-    row = cur.fetchone()
+    params = tuple(params)
+    db = _read_connection()
+    started = time.perf_counter()
+    row = db.execute(sql, params).fetchone()
+    _observe(db, sql, params, started, 1 if row else 0)
     return row_to_dict(row) if row else None
 
 
 def get_all(sql: str, params: Iterable[Any] = ()) -> List[Dict[str, Any]]:
-    db = get_db()
-    cur = db.execute(sql, tuple(params))
-    rows = cur.fetchall()
-    return [row_to_dict(r) for r in rows]
+    db = _read_connection()
+    return [row_to_dict(r) for r in _execute(db, sql, tuple(params))]
+
+
+def row_version(entity: str, entity_id: str) -> int:
+    """Change counter maintained by triggers; 0 for rows that were never modified."""
+    row = get_one("SELECT version FROM row_versions WHERE entity = ? AND id = ?", (entity, entity_id))
+    return row["version"] if row else 0
+
+
+def iter_rows(sql: str, params: Iterable[Any] = (), batch_size: int = 200) -> Iterator[Dict[str, Any]]:
+    """Yield rows lazily from a dedicated pooled reader.
+
+    Unlike ``get_all`` this does not use the request's connection, so it is safe to
+    consume from a streamed response after the request context has been torn down.
+    The shard is fixed when this is called, not when iteration starts.
+    """
+    return _iter_rows(get_pool(), sql, tuple(params), batch_size)
+
+
+def _iter_rows(pool: ConnectionPool, sql: str, params: Sequence[Any], batch_size: int) -> Iterator[Dict[str, Any]]:
+    db = pool.acquire_reader()
+    try:
+        # Timed to the first batch; the rest depends on how fast the consumer reads.
+        started = time.perf_counter()
+        cur = db.execute(sql, params)
+        rows = cur.fetchmany(batch_size)
+        _observe(db, sql, params, started, len(rows))
+        while rows:
+            for row in rows:
+                yield row_to_dict(row)
+            rows = cur.fetchmany(batch_size)
+    finally:
+        pool.release_reader(db)
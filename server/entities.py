@@ -0,0 +1,70 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from cache import LRUCache
+from db import current_shard, row_version
+
+
+class VersionedCache:
+    """Read-through LRU for rows guarded by ``row_versions`` change counters.
+
+    Entries are served from memory until the ``scope`` counter, which triggers bump
+    on every write to the underlying tables from any worker, moves. That counter is
+    read at most once per ``check_interval`` seconds, so hot keys cost no database
+    round trip. After it moves, each entry is revalidated once against its own
+    counter and reloaded only if that changed as well. Counters live in each shard,
+    so call ``get`` with the key's shard current.
+    """
+
+    def __init__(
+        self,
+        entity: str,
+        load: Callable[[Hashable], Optional[Any]],
+        maxsize: int,
+        check_interval: float,
+        scope: Tuple[str, str],
+    ) -> None:
+        self.entity = entity
+        self.load = load
+        self.check_interval = check_interval
+        self.scope = scope
+        self._lru = LRUCache(maxsize)
+        # shard -> (scope counter, when it was read)
+        self._generations: Dict[str, Tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def _sync(self) -> int:
+        shard = current_shard()
+        now = time.monotonic()
+        generation, checked_at = self._generations.get(shard, (-1, float("-inf")))
+        if now - checked_at >= self.check_interval:
+            generation = row_version(*self.scope)
+            with self._lock:
+                self._generations[shard] = (generation, now)
+        return generation
+
+    def get(self, key: Hashable) -> Optional[Tuple[int, Any]]:
+        """Return ``(version, value)`` for ``key``, or None when the loader finds nothing."""
+        generation = self._sync()
+        entry = self._lru.get(key)
+        if entry is not None:
+            cached_generation, version, value = entry
+            if cached_generation == generation:
+                return version, value
+            if row_version(self.entity, key) == version:
+                self._lru.set(key, (generation, version, value))
+                return version, value
+        # Read the counter first: a write racing the load leaves a stale version, not stale data.
+        version = row_version(self.entity, key)
+        value = self.load(key)
+        if value is None:
+            return None
+        self._lru.set(key, (generation, version, value))
+        return version, value
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop ``key`` after a local write and re-read the scope counter on the next get."""
+        self._lru.pop(key)
+        with self._lock:
+            self._generations.clear()
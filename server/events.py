@@ -0,0 +1,191 @@
+"""Appointment change feed for the live dashboards.
+
+Writers append to the ``appointment_events`` table in the same transaction as the
+change itself. Each worker runs one ``EventTail`` thread that watches the log's
+newest id, so an event committed by any gunicorn worker wakes the SSE streams in
+every worker. The event id is also the SSE ``id:``, which browsers send back as
+``Last-Event-ID`` when they reconnect. Each shard keeps its own log and tail, and a
+hospital's feed reads the shard that holds the hospital.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+from db import HOME_SHARD, get_pool, mutate_one, row_to_dict, run
+
+EVENTS_POLL_INTERVAL_S = float(os.environ.get("EVENTS_POLL_INTERVAL_MS", "500")) / 1000
+EVENTS_RETAIN = int(os.environ.get("EVENTS_RETAIN", "10000"))
+EVENTS_PRUNE_EVERY = 256
+EVENTS_BATCH = 500
+# Reconnect delay suggested to EventSource clients, in milliseconds.
+EVENTS_RETRY_MS = 3000
+
+# Feed scope -> appointment_events column it filters on.
+SCOPES = {"hospital": "hospital_id", "doctor": "doctor_id"}
+
+
+def publish(event_type: str, appointment: Dict[str, Any]) -> int:
+    """Append an event for ``appointment``; call inside the transaction that changed it, on its shard."""
+    row = mutate_one(
+        """
+        INSERT INTO appointment_events (appointment_id, hospital_id, doctor_id, type, payload)
+        VALUES (?, ?, ?, ?, ?)
+        RETURNING id
+        """,
+        (
+            appointment["id"],
+            appointment.get("hospital_id"),
+            appointment.get("doctor_id"),
+            event_type,
+            json.dumps(appointment, default=str),
+        ),
+    )
+    event_id = row["id"]
+    if event_id % EVENTS_PRUNE_EVERY == 0:
+        run("DELETE FROM appointment_events WHERE id <= ?", (event_id - EVENTS_RETAIN,))
+    return event_id
+
+
+class EventTail:
+    """Per-worker watcher of the newest event id; streams wait on it instead of polling."""
+
+    def __init__(self, interval: float, shard: str = HOME_SHARD) -> None:
+        self.interval = interval
+        self.shard = shard
+        self.latest = 0
+        self._changed = threading.Condition()
+        self._poke = threading.Event()
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+
+    def _newest_id(self) -> int:
+        pool = get_pool(self.shard)
+        db = pool.acquire_reader()
+        try:
+            return db.execute("SELECT COALESCE(MAX(id), 0) FROM appointment_events").fetchone()[0]
+        finally:
+            pool.release_reader(db)
+
+    def _ensure_started(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Threads do not survive a fork; start this process's watcher.
+            self.latest = self._newest_id()
+            threading.Thread(target=self._watch, name=f"event-tail-{self.shard}", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _watch(self) -> None:
+        while True:
+            self._poke.wait(self.interval)
+            self._poke.clear()
+            newest = self._newest_id()
+            if newest != self.latest:
+                with self._changed:
+                    self.latest = newest
+                    self._changed.notify_all()
+
+    def poke(self) -> None:
+        """Check the log now rather than on the next tick; call after committing an event."""
+        self._poke.set()
+
+    def wait(self, seen: int, timeout: float) -> int:
+        """Block until the newest id differs from ``seen`` or ``timeout`` passes; return it."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.latest != seen, timeout)
+            return self.latest
+
+
+_tails: Dict[str, EventTail] = {}
+_tails_lock = threading.Lock()
+
+
+def tail_for(shard: str) -> EventTail:
+    with _tails_lock:
+        if shard not in _tails:
+            _tails[shard] = EventTail(EVENTS_POLL_INTERVAL_S, shard)
+        return _tails[shard]
+
+
+def _events_after(shard: str, column: str, scope_id: str, after: int) -> List[Dict[str, Any]]:
+    pool = get_pool(shard)
+    db = pool.acquire_reader()
+    try:
+        rows = db.execute(
+            f"""
+            SELECT id, type, payload FROM appointment_events
+            WHERE {column} = ? AND id > ?
+            ORDER BY id
+            LIMIT ?
+            """,
+            (scope_id, after, EVENTS_BATCH),
+        ).fetchall()
+        return [row_to_dict(r) for r in rows]
+    finally:
+        pool.release_reader(db)
+
+
+def _oldest_id(shard: str) -> int:
+    pool = get_pool(shard)
+    db = pool.acquire_reader()
+    try:
+        return db.execute("SELECT COALESCE(MIN(id), 0) FROM appointment_events").fetchone()[0]
+    finally:
+        pool.release_reader(db)
+
+
+def _frame(event_id: Optional[int], event_type: str, data: str) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event_type}\ndata: {data}\n\n"
+
+
+def stream(
+    scope: str,
+    scope_id: str,
+    last_event_id: Optional[int],
+    heartbeat: float,
+    max_age: float,
+    shard: str = HOME_SHARD,
+) -> Iterator[str]:
+    """Yield SSE frames for one hospital's or doctor's appointments from ``shard``'s log.
+
+    Without ``last_event_id`` only events after the connection opened are sent.
+    When the requested resume point has already been pruned, or lies beyond the
+    log (the hospital moved shards), a ``reset`` event tells the client to reload
+    its full list. The stream ends after ``max_age`` seconds and the browser
+    reconnects with ``Last-Event-ID``, so no worker thread is held forever.
+    """
+    column = SCOPES[scope]
+    tail = tail_for(shard)
+    tail._ensure_started()
+    seen = tail.latest
+    yield f"retry: {EVENTS_RETRY_MS}\n\n"
+    if last_event_id is None:
+        after = seen
+    else:
+        after = last_event_id
+        # The tail may lag other workers' commits, so compare with the log itself.
+        if after < _oldest_id(shard) - 1 or after > tail._newest_id():
+            yield _frame(seen, "reset", "{}")
+            after = seen
+    deadline = time.monotonic() + max_age
+    while True:
+        while True:
+            events = _events_after(shard, column, scope_id, after)
+            for event in events:
+                yield _frame(event["id"], event["type"], event["payload"])
+                after = event["id"]
+            if len(events) < EVENTS_BATCH:
+                break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        newest = tail.wait(seen, min(heartbeat, remaining))
+        if newest == seen:
+            yield ": keepalive\n\n"
+        seen = newest
@@ -0,0 +1,141 @@
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+from db import get_all
+
+EARTH_RADIUS_KM = 6371.0
+# Half the earth's circumference: no two points are further apart than this.
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM
+INITIAL_SEARCH_RADIUS_KM = 10.0
+
+Box = Tuple[float, float, float, float]
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    to_rad = lambda deg: (deg * math.pi) / 180
+    dlat = to_rad(lat2 - lat1)
+    dlon = to_rad(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(to_rad(lat1)) * math.cos(to_rad(lat2)) * math.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def bounding_boxes(lat: float, lng: float, radius_km: float) -> List[Box]:
+    """Return (min_lat, max_lat, min_lng, max_lng) boxes covering the radius.
+
+    Boxes are split at the antimeridian; near the poles the full longitude range is used.
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = lat - dlat, lat + dlat
+    if min_lat <= -90 or max_lat >= 90:
+        return [(max(min_lat, -90.0), min(max_lat, 90.0), -180.0, 180.0)]
+
+    # Widest longitude reached on the circle (where it touches a meridian tangentially),
+    # not r / (R cos lat), which is too narrow away from the equator.
+    angular = math.sin(radius_km / EARTH_RADIUS_KM)
+    cos_lat = math.cos(math.radians(lat))
+    if angular >= cos_lat:
+        return [(min_lat, max_lat, -180.0, 180.0)]
+    dlng = math.degrees(math.asin(angular / cos_lat))
+    min_lng, max_lng = lng - dlng, lng + dlng
+    if min_lng < -180:
+        return [(min_lat, max_lat, min_lng + 360, 180.0), (min_lat, max_lat, -180.0, max_lng)]
+    if max_lng > 180:
+        return [(min_lat, max_lat, min_lng, 180.0), (min_lat, max_lat, -180.0, max_lng - 360)]
+    return [(min_lat, max_lat, min_lng, max_lng)]
+
+
+def _candidates_in_box(box: Box, where_sql: str, params: List[object]) -> List[Dict[str, Any]]:
+    return get_all(
+        f"""
+        SELECT
+          d.*, h.name AS hospital_name, h.address AS hospital_address,
+          h.latitude AS hospital_latitude, h.longitude AS hospital_longitude
+        FROM hospitals_geo gi
+        JOIN hospitals h ON h.rowid = gi.id
+        JOIN doctors d ON d.hospital_id = h.id
+        WHERE gi.max_lat >= ? AND gi.min_lat <= ? AND gi.max_lng >= ? AND gi.min_lng <= ?
+        {where_sql}
+        """,
+        [box[0], box[1], box[2], box[3], *params],
+    )
+
+
+def _scan(
+    lat: float,
+    lng: float,
+    radius_km: float,
+    inner: List[Box],
+    where_sql: str,
+    params: List[object],
+    seen: Dict[str, Dict[str, Any]],
+) -> None:
+    """Add the doctors in ``radius_km``'s boxes to ``seen``, with ``distance_km`` set.
+
+    Hospitals inside the ``inner`` boxes of an earlier, smaller scan are already in ``seen``
+    and are filtered out on the R*Tree row, before any join or distance is computed.
+    """
+    skip_sql = "".join(
+        " AND NOT (gi.min_lat >= ? AND gi.max_lat <= ? AND gi.min_lng >= ? AND gi.max_lng <= ?)" for _ in inner
+    )
+    skip_params = [edge for box in inner for edge in box]
+    for box in bounding_boxes(lat, lng, radius_km):
+        for doc in _candidates_in_box(box, skip_sql + where_sql, [*skip_params, *params]):
+            if doc["id"] in seen:
+                continue
+            doc["distance_km"] = haversine_km(lat, lng, float(doc["hospital_latitude"]), float(doc["hospital_longitude"]))
+            seen[doc["id"]] = doc
+
+
+def _within(seen: Dict[str, Dict[str, Any]], radius_km: float) -> List[Dict[str, Any]]:
+    # Rounding can put the far side of the earth a hair past MAX_DISTANCE_KM.
+    if radius_km >= MAX_DISTANCE_KM:
+        return list(seen.values())
+    return [doc for doc in seen.values() if doc["distance_km"] <= radius_km]
+
+
+def doctors_within(
+    lat: float,
+    lng: float,
+    radius_km: float,
+    where_sql: str = "",
+    params: Optional[List[object]] = None,
+    limit: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Doctors whose hospital lies within ``radius_km``, nearest first, with ``distance_km`` set.
+
+    ``where_sql`` is an optional ``AND ...`` fragment over the ``d``/``h`` aliases. With a
+    ``limit``, the search widens from a small ring and stops once that many are found.
+    """
+    if limit is not None:
+        return nearest_doctors(lat, lng, limit, where_sql, params, max_radius_km=radius_km)
+    seen: Dict[str, Dict[str, Any]] = {}
+    _scan(lat, lng, radius_km, [], where_sql, params or [], seen)
+    return sorted(_within(seen, radius_km), key=lambda d: d["distance_km"])
+
+
+def nearest_doctors(
+    lat: float,
+    lng: float,
+    limit: int,
+    where_sql: str = "",
+    params: Optional[List[object]] = None,
+    max_radius_km: float = MAX_DISTANCE_KM,
+) -> List[Dict[str, Any]]:
+    """Top-``limit`` doctors by hospital distance, widening the search ring until it is full.
+
+    Each wider ring only reads the hospitals outside the previous ring's boxes. Anyone not
+    yet read lies outside the current ring, so once ``limit`` doctors are inside it they
+    are the nearest.
+    """
+    params = params or []
+    max_radius_km = min(max_radius_km, MAX_DISTANCE_KM)
+    seen: Dict[str, Dict[str, Any]] = {}
+    inner: List[Box] = []
+    radius = min(INITIAL_SEARCH_RADIUS_KM, max_radius_km)
+    while True:
+        _scan(lat, lng, radius, inner, where_sql, params, seen)
+        doctors = _within(seen, radius)
+        if len(doctors) >= limit or radius >= max_radius_km:
+            return sorted(doctors, key=lambda d: d["distance_km"])[:limit]
+        inner = bounding_boxes(lat, lng, radius)
+        radius = min(radius * 4, max_radius_km)
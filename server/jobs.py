@@ -0,0 +1,79 @@
+import logging
+import os
+import queue
+import threading
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class JobQueue:
+    """Bounded in-process worker pool.
+
+    At most ``max_depth`` jobs wait for a worker; further submissions raise
+    ``QueueFullError`` so callers can shed load instead of piling up. Worker threads
+    start lazily and are recreated after a fork.
+    """
+
+    def __init__(self, name: str, workers: int, max_depth: int) -> None:
+        self.name = name
+        self.workers = max(1, workers)
+        self.max_depth = max(1, max_depth)
+        self._queue: "queue.Queue[tuple[str, Callable[..., Any], tuple]]" = queue.Queue(maxsize=self.max_depth)
+        self._done: Dict[str, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+
+    def _ensure_started(self) -> None:
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Threads do not survive a fork; start a fresh set in this process.
+            self._queue = queue.Queue(maxsize=self.max_depth)
+            self._done = {}
+            for i in range(self.workers):
+                threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True).start()
+            self._pid = os.getpid()
+
+    def _work(self) -> None:
+        jobs = self._queue
+        while True:
+            job_id, fn, args = jobs.get()
+            try:
+                fn(*args)
+            except Exception:  # pragma: no cover - fn is expected to record its own failure
+                logger.exception("Unhandled error in %s job %s", self.name, job_id)
+            finally:
+                with self._lock:
+                    event = self._done.pop(job_id, None)
+                if event is not None:
+                    event.set()
+                jobs.task_done()
+
+    def submit(self, job_id: str, fn: Callable[..., Any], *args: Any) -> None:
+        self._ensure_started()
+        with self._lock:
+            self._done[job_id] = threading.Event()
+        try:
+            self._queue.put_nowait((job_id, fn, args))
+        except queue.Full:
+            with self._lock:
+                self._done.pop(job_id, None)
+            raise QueueFullError(f"{self.name} queue is full ({self.max_depth} waiting)")
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def wait(self, job_id: str, timeout: float) -> bool:
+        """Block until ``job_id`` finishes in this process; False if unknown here or timed out."""
+        with self._lock:
+            event = self._done.get(job_id)
+        if event is None:
+            return False
+        return event.wait(timeout)
@@ -0,0 +1,144 @@
+"""Admission control for expensive endpoints: token-bucket rate limits and concurrency caps.
+
+Buckets live in a small SQLite file of their own (``RATE_LIMIT_DB``) so every gunicorn
+worker draws from the same budget without contending with the main database's writer.
+A take is a single UPSERT, so it is atomic across processes. Concurrency caps are
+per worker, because the threads they protect are per worker too. Capping expensive
+routes leaves threads free in every worker for cheap endpoints.
+
+If the bucket store is unavailable the limiter fails open: it logs and lets the
+request through rather than turning a limiter fault into an outage.
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from db import DB_PATH
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "1").lower() not in {"0", "false", "no"}
+RATE_LIMIT_DB = os.environ.get("RATE_LIMIT_DB") or os.path.join(
+    tempfile.gettempdir(), f"pulsecare-ratelimit-{hashlib.sha1(os.path.abspath(DB_PATH).encode()).hexdigest()[:10]}.db"
+)
+# Buckets untouched for this long are full again and can be forgotten.
+BUCKET_IDLE_S = 3600
+PRUNE_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+# Refill to ``burst`` tokens and spend one, in one statement; no row comes back when
+# the bucket holds less than a whole token.
+TAKE_SQL = """
+INSERT INTO buckets (key, tokens, updated) VALUES (:key, :burst - 1, :now)
+ON CONFLICT (key) DO UPDATE SET
+    tokens = MIN(:burst, tokens + (:now - updated) * :rate) - 1,
+    updated = :now
+WHERE MIN(:burst, tokens + (:now - updated) * :rate) >= 1
+RETURNING tokens
+"""
+
+Rate = Tuple[int, float]  # (requests, per seconds)
+
+
+def parse_rate(value: str) -> Rate:
+    """``"10/60"`` -> 10 requests per 60 seconds (bursts of up to 10)."""
+    count, _, seconds = value.partition("/")
+    rate = (int(count), float(seconds or 1))
+    if rate[0] < 1 or rate[1] <= 0:
+        raise ValueError(f"invalid rate {value!r}; expected <requests>/<seconds>")
+    return rate
+
+
+class Policy:
+    def __init__(self, name: str, per_ip: Optional[str], per_account: Optional[str], concurrency: int) -> None:
+        env = f"RATE_LIMIT_{name.upper()}"
+        ip = os.environ.get(f"{env}_IP", per_ip or "")
+        account = os.environ.get(f"{env}_ACCOUNT", per_account or "")
+        self.name = name
+        self.per_ip: Optional[Rate] = parse_rate(ip) if ip else None
+        self.per_account: Optional[Rate] = parse_rate(account) if account else None
+        self.concurrency = int(os.environ.get(f"{env}_CONCURRENCY", concurrency))
+        self._slots = threading.BoundedSemaphore(max(1, self.concurrency))
+
+    def try_enter(self) -> bool:
+        return self._slots.acquire(blocking=False)
+
+    def leave(self) -> None:
+        self._slots.release()
+
+
+class BucketStore:
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=0.25, isolation_level=None)
+            # Losing bucket state in a crash only forgives a few requests.
+            conn.executescript("PRAGMA journal_mode = WAL; PRAGMA synchronous = OFF;" + SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key: str, rate: Rate) -> float:
+        """Spend one token from ``key``; return 0 when allowed, else seconds until the next token."""
+        count, seconds = rate
+        params = {"key": key, "burst": count, "rate": count / seconds, "now": time.time()}
+        conn = self._conn()
+        # fetchall() steps the statement to completion, which releases the write lock.
+        if conn.execute(TAKE_SQL, params).fetchall():
+            self._takes += 1
+            if self._takes % PRUNE_EVERY == 0:
+                conn.execute("DELETE FROM buckets WHERE updated < ?", (params["now"] - BUCKET_IDLE_S,))
+            return 0.0
+        row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+        tokens = min(count, row[0] + (params["now"] - row[1]) * params["rate"]) if row else 0.0
+        return max(0.0, (1 - tokens) / params["rate"])
+
+
+store = BucketStore(RATE_LIMIT_DB)
+
+
+def check(policy: Policy, ip: Optional[str], account: Optional[str]) -> float:
+    """Charge the request to its IP and account buckets; seconds to wait, or 0 when admitted."""
+    if not RATE_LIMIT_ENABLED:
+        return 0.0
+    charges = []
+    if policy.per_ip and ip:
+        charges.append((f"{policy.name}:ip:{ip}", policy.per_ip))
+    if policy.per_account and account:
+        charges.append((f"{policy.name}:account:{account.strip().lower()}", policy.per_account))
+    try:
+        for key, rate in charges:
+            wait = store.take(key, rate)
+            if wait:
+                return wait
+    except sqlite3.Error:
+        logger.exception("Rate limiter unavailable; admitting request")
+    return 0.0
+
+
+POLICIES: Dict[str, Policy] = {
+    p.name: p
+    for p in (
+        Policy("login", per_ip="30/60", per_account="10/300", concurrency=4),
+        Policy("register", per_ip="10/600", per_account=None, concurrency=2),
+        Policy("firstaid", per_ip="20/60", per_account="20/60", concurrency=4),
+    )
+}
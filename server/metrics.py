@@ -0,0 +1,237 @@
+"""In-process metrics with Prometheus text exposition, aggregated across workers.
+
+Each worker records counters, gauges and fixed-bucket histograms in memory and
+every ``METRICS_FLUSH_S`` seconds writes a snapshot to ``METRICS_DIR/<pid>.json``
+(atomically). ``render()`` merges the snapshots of all live workers, so whichever
+gunicorn worker answers ``/api/metrics`` reports totals for the whole server.
+Snapshots of workers that have exited are dropped; Prometheus treats the drop as a
+counter reset.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# One directory per database, so separate deployments on a host don't mix.
+_DB_KEY = os.path.abspath(os.environ.get("DB_PATH") or os.path.join(os.path.dirname(__file__), "data.db"))
+METRICS_DIR = os.environ.get("METRICS_DIR") or os.path.join(
+    tempfile.gettempdir(), "pulsecare-metrics-" + hashlib.sha1(_DB_KEY.encode()).hexdigest()[:10]
+)
+METRICS_FLUSH_S = float(os.environ.get("METRICS_FLUSH_S", "2"))
+# Upper bounds in seconds; +Inf is implicit.
+BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_QUERY_LOG_SIZE = 50
+
+HELP = {
+    "http_requests_total": ("counter", "HTTP requests by route, method and status."),
+    "http_request_duration_seconds": ("histogram", "Time to produce the response, by route and method."),
+    "http_requests_in_flight": ("gauge", "Requests currently being handled."),
+    "db_query_duration_seconds": ("histogram", "SQL statement execution time, by statement."),
+    "db_query_rows_total": ("counter", "Rows returned or affected, by statement."),
+    "db_slow_queries_total": ("counter", "Statements slower than DB_SLOW_QUERY_MS, by statement."),
+    "db_writer_lock_wait_seconds": ("histogram", "Time spent waiting for the writer connection."),
+    "upstream_request_duration_seconds": ("histogram", "Outbound API call time, by upstream and outcome."),
+    "upstream_rejected_total": ("counter", "Calls refused by an open circuit breaker."),
+    "upstream_circuit_open": ("gauge", "Workers whose circuit breaker for the upstream is open."),
+    "firstaid_queue_depth": ("gauge", "First-aid jobs waiting for a worker thread."),
+    "admission_rejected_total": ("counter", "Requests refused by rate limits or concurrency caps, by policy."),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Optional[Dict[str, Any]]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        # [per-bucket counts..., +Inf count, sum]
+        self._histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        self._slow: Deque[Dict[str, Any]] = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+        self._collectors: List[Callable[["Registry"], None]] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flushed_at = 0.0
+
+    def inc(self, name: str, labels: Optional[Dict[str, Any]] = None, amount: float = 1.0) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + amount
+        self._maybe_flush()
+
+    def add_gauge(self, name: str, labels: Optional[Dict[str, Any]] = None, delta: float = 1.0) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._gauges[key] = self._gauges.get(key, 0.0) + delta
+
+    def set_gauge(self, name: str, labels: Optional[Dict[str, Any]] = None, value: float = 0.0) -> None:
+        with self._lock:
+            self._gauges[(name, _labels(labels))] = value
+
+    def observe(self, name: str, labels: Optional[Dict[str, Any]], seconds: float) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0.0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+                    break
+            else:
+                hist[len(BUCKETS)] += 1
+            hist[-1] += seconds
+        self._maybe_flush()
+
+    def record_slow_query(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._slow.append(entry)
+
+    def add_collector(self, collect: Callable[["Registry"], None]) -> None:
+        """Run ``collect(registry)`` before every snapshot, e.g. to set gauges from live state."""
+        self._collectors.append(collect)
+
+    def snapshot(self) -> Dict[str, Any]:
+        for collect in self._collectors:
+            collect(self)
+        with self._lock:
+            return {
+                "pid": os.getpid(),
+                "counters": [[n, list(lbl), v] for (n, lbl), v in self._counters.items()],
+                "gauges": [[n, list(lbl), v] for (n, lbl), v in self._gauges.items()],
+                "histograms": [[n, list(lbl), list(h)] for (n, lbl), h in self._histograms.items()],
+                "slow_queries": list(self._slow),
+            }
+
+    def _maybe_flush(self) -> None:
+        if time.monotonic() - self._flushed_at >= METRICS_FLUSH_S:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            self._flushed_at = time.monotonic()
+            try:
+                os.makedirs(METRICS_DIR, exist_ok=True)
+                path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+                with open(path + ".tmp", "w", encoding="utf-8") as fh:
+                    json.dump(self.snapshot(), fh)
+                os.replace(path + ".tmp", path)
+            except OSError:
+                pass  # metrics must never break a request
+
+
+registry = Registry()
+
+
+def _alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def collect_workers() -> List[Dict[str, Any]]:
+    """Flush this worker and return every live worker's latest snapshot."""
+    registry.flush()
+    snapshots = []
+    try:
+        names = os.listdir(METRICS_DIR)
+    except FileNotFoundError:
+        names = []
+    for name in names:
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(METRICS_DIR, name)
+        try:
+            pid = int(name[:-5])
+        except ValueError:
+            continue
+        if not _alive(pid):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(path, encoding="utf-8") as fh:
+                snapshots.append(json.load(fh))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _series(name: str, labels: List[List[str]] | Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = [*map(tuple, labels), *extra]
+    if not pairs:
+        return name
+    return name + "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render() -> str:
+    """Prometheus text format (0.0.4) summed over all live workers."""
+    counters: Dict[Tuple[str, Labels], float] = {}
+    gauges: Dict[Tuple[str, Labels], float] = {}
+    histograms: Dict[Tuple[str, Labels], List[float]] = {}
+    for snap in collect_workers():
+        for name, labels, value in snap["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0.0) + value
+        for name, labels, value in snap["gauges"]:
+            key = (name, tuple(map(tuple, labels)))
+            gauges[key] = gauges.get(key, 0.0) + value
+        for name, labels, values in snap["histograms"]:
+            key = (name, tuple(map(tuple, labels)))
+            merged = histograms.setdefault(key, [0.0] * len(values))
+            for i, v in enumerate(values):
+                merged[i] += v
+
+    by_name: Dict[str, List[str]] = {}
+    for (name, labels), value in sorted(counters.items()):
+        by_name.setdefault(name, []).append(f"{_series(name, labels)} {_number(value)}")
+    for (name, labels), value in sorted(gauges.items()):
+        by_name.setdefault(name, []).append(f"{_series(name, labels)} {_number(value)}")
+    for (name, labels), values in sorted(histograms.items()):
+        lines = by_name.setdefault(name, [])
+        cumulative = 0.0
+        for bound, count in zip(BUCKETS, values):
+            cumulative += count
+            lines.append(f"{_series(name + '_bucket', labels, (('le', repr(bound)),))} {_number(cumulative)}")
+        cumulative += values[len(BUCKETS)]
+        lines.append(f"{_series(name + '_bucket', labels, (('le', '+Inf'),))} {_number(cumulative)}")
+        lines.append(f"{_series(name + '_sum', labels)} {values[-1]!r}")
+        lines.append(f"{_series(name + '_count', labels)} {_number(cumulative)}")
+
+    out = []
+    for name in sorted(by_name):
+        kind, text = HELP.get(name, ("untyped", name))
+        out.append(f"# HELP {name} {text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(by_name[name])
+    return "\n".join(out) + "\n"
+
+
+def slow_queries() -> List[Dict[str, Any]]:
+    """Recent slow statements with their query plans, newest first, across all workers."""
+    entries = [entry for snap in collect_workers() for entry in snap.get("slow_queries", [])]
+    return sorted(entries, key=lambda e: e["at"], reverse=True)
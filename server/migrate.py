@@ -0,0 +1,45 @@
+"""Apply pending schema migrations to the SQLite database.
+
+Usage:
+    cd server
+    python migrate.py                     # migrate to the latest version
+    python migrate.py --status            # print current/latest version only
+    python migrate.py --rebuild-indexes   # also resync geo + full-text indexes (after VACUUM)
+
+Notes:
+- Respects `DB_PATH` env var; default is `server/data.db`. Shard files in `DB_SHARDS` are
+  migrated too.
+- Workers also migrate on startup, so running this is optional; it is safe while the server runs.
+"""
+
+import argparse
+
+from db import SCHEMA_VERSION, get_pool, init_db, rebuild_search_indexes, scatter, schema_version
+
+
+def migrate(status_only: bool, rebuild_indexes: bool) -> None:
+    pool = get_pool()
+    if status_only:
+        with pool.writer_lock:
+            current = schema_version(pool.writer())
+        print(f"{pool.path}: schema version {current} (latest {SCHEMA_VERSION})")
+        return
+
+    version = init_db()
+    print(f"{pool.path}: schema version {version}")
+    if rebuild_indexes:
+        rebuild_search_indexes()
+        print(f"{pool.path}: rebuilt hospitals_geo and doctors_fts")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--status", action="store_true", help="show the schema version and exit")
+    parser.add_argument("--rebuild-indexes", action="store_true", help="rebuild the geo and full-text indexes")
+    args = parser.parse_args()
+
+    scatter(lambda: migrate(args.status, args.rebuild_indexes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Password hashing off the request thread.
+
+KDF work runs in a small per-worker process pool so a login burst cannot pin the
+request threads, with admission control once the pool's queue is full. The hash
+method is configurable and stale hashes are upgraded on the next successful login.
+"""
+
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Any werkzeug method string, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000".
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", str(min(2, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE", "16"))
+PASSWORD_HASH_TIMEOUT = float(os.environ.get("PASSWORD_HASH_TIMEOUT", "10"))
+
+
+class PasswordServiceBusy(RuntimeError):
+    pass
+
+
+def _hash(password: str, method: str) -> str:
+    return generate_password_hash(password, method=method)
+
+
+def _check(pwhash: str, password: str) -> bool:
+    return check_password_hash(pwhash, password)
+
+
+class PasswordService:
+    def __init__(self, method: str, workers: int, max_pending: int, timeout: float) -> None:
+        self.method = method
+        # werkzeug expands short methods ("scrypt" -> "scrypt:32768:8:1"), so compare
+        # stored hashes against the prefix it actually writes.
+        self.prefix = _hash("", method).split("$", 1)[0]
+        self.workers = max(0, workers)
+        self.max_pending = max(1, max_pending)
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._inflight = 0
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._pid = os.getpid()
+        return self._executor
+
+    def _release(self, _future: Optional[Future] = None) -> None:
+        with self._lock:
+            self._inflight -= 1
+
+    def _call(self, fn, *args):
+        if self.workers == 0:
+            return fn(*args)
+        with self._lock:
+            if self._inflight >= self.workers + self.max_pending:
+                raise PasswordServiceBusy("Password hashing queue is full")
+            self._inflight += 1
+            pool = self._pool()
+        future: Optional[Future] = None
+        try:
+            future = pool.submit(fn, *args)
+            # A job that times out keeps its worker busy, so it only frees its place once it finishes.
+            future.add_done_callback(self._release)
+            return future.result(timeout=self.timeout)
+        except FutureTimeout as exc:
+            raise PasswordServiceBusy("Password hashing timed out") from exc
+        except BrokenProcessPool:
+            with self._lock:
+                self._executor = None
+            raise
+        finally:
+            if future is None:
+                self._release()
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        return pwhash.split("$", 1)[0] != self.prefix
+
+    def hash(self, password: str) -> str:
+        return self._call(_hash, password, self.method)
+
+    def verify(self, pwhash: str, password: str) -> Tuple[bool, Optional[str]]:
+        """Return ``(ok, upgraded_hash)``; ``upgraded_hash`` is set when a stale hash should be replaced."""
+        if not self._call(_check, pwhash, password):
+            return False, None
+        if not self.needs_rehash(pwhash):
+            return True, None
+        try:
+            return True, self.hash(password)
+        except PasswordServiceBusy:
+            # The login already succeeded; upgrade on a quieter attempt.
+            return True, None
+
+
+passwords = PasswordService(PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS, PASSWORD_HASH_QUEUE, PASSWORD_HASH_TIMEOUT)
@@ -6,21 +6,22 @@ Usage (Windows PowerShell):
 
 Notes:
 - Stop the running server before resetting to avoid file-lock issues on Windows.
-- Respects `DB_PATH` env var; default is `server/data.db`.
+- Respects `DB_PATH` env var; default is `server/data.db`. Shard files in `DB_SHARDS` are
+  reset along with it.
 """
 
 import os
 
-from app import app
-from db import DB_PATH, init_db
+from db import DB_PATH, DB_SHARDS, init_shards
 
 
-def main() -> None:
-    path = os.environ.get("DB_PATH") or DB_PATH
-
+def _delete(path: str) -> None:
     if os.path.exists(path):
         try:
-            os.remove(path)
+            # WAL mode keeps committed pages in the -wal/-shm side files; drop them too.
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
             print(f"Deleted existing DB: {path}")
         except PermissionError as exc:
             raise SystemExit(
@@ -29,10 +30,14 @@ def main() -> None:
     else:
         print(f"No existing DB found at: {path}")
 
-    # Recreate schema (init_db uses flask.g, so it must run under app context)
-    with app.app_context():
-        init_db()
-    print(f"Created fresh DB + schema at: {path}")
+
+def main() -> None:
+    path = os.environ.get("DB_PATH") or DB_PATH
+    for shard_path in (path, *DB_SHARDS.values()):
+        _delete(shard_path)
+
+    version = init_shards()
+    print(f"Created fresh DB + schema (version {version}) at: {path}")
 
 
 if __name__ == "__main__":
@@ -14,4 +14,6 @@ from app import app
 if __name__ == "__main__":
     host = os.environ.get("HOST", "0.0.0.0")
     port = int(os.environ.get("PORT", "4000"))
-    serve(app, host=host, port=port)
+    # Room for EVENTS_MAX_STREAMS open live feeds plus the regular API traffic.
+    threads = int(os.environ.get("WAITRESS_THREADS", "16"))
+    serve(app, host=host, port=port, threads=threads)
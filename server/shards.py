@@ -0,0 +1,305 @@
+"""Inspect the hospital shards and move hospitals between them.
+
+Usage:
+    cd server
+    python shards.py status
+    python shards.py move <hospital_id> <shard>
+    python shards.py rebalance                       # even out load over the DB_SHARDS files
+    python shards.py rebalance --shards home,east --dry-run
+    python shards.py split east east2                # move about half of east's load to east2
+    python shards.py prune                           # drop directory entries with no hospital
+
+Notes:
+- Respects `DB_PATH` and `DB_SHARDS` (`name=path,...`); the home database is the shard
+  named `home`. Add a new shard to `DB_SHARDS` before splitting into it; missing files are
+  created and migrated.
+- Run it with the servers stopped: workers cache where each hospital lives.
+- A hospital moves with its doctors, appointments, slot counts and statistics. Each move
+  copies it to the target in one transaction, repoints the `hospital_shards` directory,
+  then deletes it from every other shard, so running an interrupted move again finishes
+  it. Its live-feed events stay behind; dashboards reconnect with a reset. Archives are
+  shared and don't move.
+- A hospital's load is its appointment count plus one. Rebalancing first drains shards
+  outside the target set (e.g. home after a bulk import), then repeatedly moves the
+  largest hospital that narrows the gap from the heaviest shard to the lightest, until
+  the heaviest is within `--tolerance` of the mean.
+- Registration writes the directory entry before the hospital, so a crash in between can
+  leave an entry that blocks its email; `prune` deletes entries whose hospital is on no shard.
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from db import DB_SHARDS, HOME_SHARD, init_shards, iter_rows, shard_names, shard_path, transaction, use_shard
+
+# Tables moved with a hospital, parents first, and the column naming the hospital.
+MOVED_TABLES: Tuple[Tuple[str, str], ...] = (
+    ("hospitals", "id"),
+    ("doctors", "hospital_id"),
+    ("appointments", "hospital_id"),
+)
+# Per-hospital and per-doctor statistics, keyed by (entity, id, ...).
+STATS_TABLES = ("appointment_stats", "appointment_queue")
+
+Loads = Dict[str, Dict[str, int]]  # shard -> {hospital_id: load}
+Move = Tuple[str, str, str]  # (hospital_id, from shard, to shard)
+
+
+class ShardError(RuntimeError):
+    pass
+
+
+def hospital_loads() -> Loads:
+    """Every hospital's load, grouped by the shard the directory puts it in."""
+    with use_shard(HOME_SHARD):
+        directory = [(row["hospital_id"], row["shard"]) for row in iter_rows("SELECT * FROM hospital_shards")]
+    counts: Dict[Tuple[str, str], int] = {}
+    for name in shard_names():
+        with use_shard(name):
+            for row in iter_rows("SELECT hospital_id, COUNT(*) AS n FROM appointments GROUP BY hospital_id"):
+                counts[(name, row["hospital_id"])] = row["n"]
+    loads: Loads = {name: {} for name in shard_names()}
+    for hospital_id, shard in directory:
+        loads.setdefault(shard, {})[hospital_id] = counts.get((shard, hospital_id), 0) + 1
+    return loads
+
+
+def plan_moves(loads: Loads, targets: Sequence[str], tolerance: float) -> List[Move]:
+    """Moves that spread the hospitals in ``loads`` evenly over ``targets``."""
+    origin = {hospital_id: shard for shard, hospitals in loads.items() for hospital_id in hospitals}
+    placed = {name: dict(loads.get(name, {})) for name in targets}
+    totals = {name: sum(hospitals.values()) for name, hospitals in placed.items()}
+
+    def move(hospital_id: str, load: int, dest: str) -> None:
+        placed[dest][hospital_id] = load
+        totals[dest] += load
+
+    for shard, hospitals in loads.items():
+        if shard in placed:
+            continue
+        for hospital_id, load in sorted(hospitals.items(), key=lambda item: -item[1]):
+            move(hospital_id, load, min(targets, key=lambda name: totals[name]))
+
+    mean = sum(totals[name] for name in targets) / len(targets)
+    while True:
+        heavy = max(targets, key=lambda name: totals[name])
+        light = min(targets, key=lambda name: totals[name])
+        gap = totals[heavy] - totals[light]
+        if totals[heavy] <= mean * (1 + tolerance):
+            break
+        # Moving less than the whole gap always narrows it, so this terminates.
+        fits = [(load, hospital_id) for hospital_id, load in placed[heavy].items() if 2 * load <= gap]
+        if not fits:
+            break
+        load, hospital_id = max(fits)
+        del placed[heavy][hospital_id]
+        totals[heavy] -= load
+        move(hospital_id, load, light)
+
+    final = {hospital_id: name for name in targets for hospital_id in placed[name]}
+    return sorted((h, origin[h], final[h]) for h in final if origin[h] != final[h])
+
+
+def _purge_stats(
+    db: sqlite3.Connection, hospital_id: str, doctor_ids: Sequence[str], tables: Sequence[str] = STATS_TABLES
+) -> None:
+    for entity, ids in (("hospital", [hospital_id]), ("doctor", doctor_ids)):
+        if not ids:
+            continue
+        placeholders = ", ".join("?" for _ in ids)
+        for table in tables:
+            db.execute(f"DELETE FROM {table} WHERE entity = ? AND id IN ({placeholders})", (entity, *ids))
+
+
+def _purge(db: sqlite3.Connection, hospital_id: str) -> None:
+    doctor_ids = [row[0] for row in db.execute("SELECT id FROM doctors WHERE hospital_id = ?", (hospital_id,))]
+    db.execute("DELETE FROM appointments WHERE hospital_id = ?", (hospital_id,))
+    db.execute("DELETE FROM appointment_events WHERE hospital_id = ?", (hospital_id,))
+    if doctor_ids:
+        placeholders = ", ".join("?" for _ in doctor_ids)
+        db.execute(f"DELETE FROM slot_bookings WHERE doctor_id IN ({placeholders})", doctor_ids)
+    _purge_stats(db, hospital_id, doctor_ids)
+    db.execute("DELETE FROM doctors WHERE hospital_id = ?", (hospital_id,))
+    db.execute("DELETE FROM hospitals WHERE id = ?", (hospital_id,))
+
+
+def hospital_shard(hospital_id: str) -> Optional[str]:
+    with use_shard(HOME_SHARD):
+        entry = next(iter_rows("SELECT shard FROM hospital_shards WHERE hospital_id = ?", (hospital_id,)), None)
+    return entry["shard"] if entry else None
+
+
+def _hospital_version(hospital_id: str) -> int:
+    sql = "SELECT version FROM row_versions WHERE entity = 'hospital' AND id = ?"
+    row = next(iter_rows(sql, (hospital_id,)), None)
+    return row["version"] if row else 0
+
+
+def move_hospital(hospital_id: str, target: str) -> int:
+    """Move a hospital and everything under it to ``target``; return the rows copied."""
+    shard_path(target)
+    source = hospital_shard(hospital_id)
+    if source is None:
+        raise ShardError(f"hospital {hospital_id} is not in the shard directory")
+
+    copied = 0
+    if source != target:
+        with use_shard(source):
+            rows = {
+                table: list(iter_rows(f"SELECT * FROM {table} WHERE {column} = ?", (hospital_id,)))
+                for table, column in MOVED_TABLES
+            }
+            version = _hospital_version(hospital_id)
+            # Statistics include archived appointments, so they are copied rather than
+            # recounted from the rows that move.
+            doctor_ids = [row["id"] for row in rows["doctors"]]
+            placeholders = ", ".join("?" for _ in doctor_ids) or "NULL"
+            stats_rows = list(
+                iter_rows(
+                    f"""
+                    SELECT * FROM appointment_stats
+                    WHERE (entity = 'hospital' AND id = ?) OR (entity = 'doctor' AND id IN ({placeholders}))
+                    """,
+                    (hospital_id, *doctor_ids),
+                )
+            )
+        if not rows["hospitals"]:
+            raise ShardError(f"hospital {hospital_id} is missing from shard {source}")
+        # Inserting fires the geo, full-text and slot triggers, which rebuild the target's
+        # derived rows; a copy left by an earlier attempt is purged first so none count twice.
+        with use_shard(target), transaction() as db:
+            _purge(db, hospital_id)
+            for table, table_rows in rows.items():
+                if not table_rows:
+                    continue
+                columns = list(table_rows[0])
+                db.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                    [tuple(row[c] for c in columns) for row in table_rows],
+                )
+                copied += len(table_rows)
+            # The insert triggers counted the moved rows afresh; replace that with the
+            # source's totals. The open-appointment queue counts they made are right as is.
+            _purge_stats(db, hospital_id, doctor_ids, tables=("appointment_stats",))
+            if stats_rows:
+                columns = list(stats_rows[0])
+                db.executemany(
+                    f"INSERT INTO appointment_stats ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+                    [tuple(row[c] for c in columns) for row in stats_rows],
+                )
+            # Past the source's counter, so no ETag a client holds can match the moved row.
+            db.execute(
+                """
+                INSERT INTO row_versions (entity, id, version) VALUES ('hospital', ?, ?)
+                ON CONFLICT (entity, id) DO UPDATE SET version = MAX(version, excluded.version) + 1
+                """,
+                (hospital_id, version + 1),
+            )
+        with use_shard(HOME_SHARD), transaction() as db:
+            db.execute("UPDATE hospital_shards SET shard = ? WHERE hospital_id = ?", (target, hospital_id))
+
+    for name in shard_names():
+        if name != target:
+            with use_shard(name), transaction() as db:
+                _purge(db, hospital_id)
+    return copied
+
+
+def prune_directory() -> List[str]:
+    """Delete directory entries whose hospital is on no shard; return their hospital ids."""
+    present = set()
+    for name in shard_names():
+        with use_shard(name):
+            present.update(row["id"] for row in iter_rows("SELECT id FROM hospitals"))
+    with use_shard(HOME_SHARD):
+        dangling = [row["hospital_id"] for row in iter_rows("SELECT hospital_id FROM hospital_shards")]
+    dangling = [hospital_id for hospital_id in dangling if hospital_id not in present]
+    if dangling:
+        with use_shard(HOME_SHARD), transaction() as db:
+            db.executemany("DELETE FROM hospital_shards WHERE hospital_id = ?", [(h,) for h in dangling])
+    return dangling
+
+
+def apply_moves(moves: Sequence[Move]) -> None:
+    started = time.perf_counter()
+    for done, (hospital_id, source, target) in enumerate(moves, 1):
+        rows = move_hospital(hospital_id, target)
+        print(f"[{done}/{len(moves)}] {hospital_id}: {source} -> {target} ({rows} rows)", flush=True)
+    print(f"Moved {len(moves)} hospitals in {time.perf_counter() - started:.1f}s")
+
+
+def print_status(loads: Loads) -> None:
+    for name, hospitals in loads.items():
+        try:
+            path = shard_path(name)
+        except ValueError:
+            print(f"{name}: not configured in DB_SHARDS but holds {len(hospitals)} hospitals")
+            continue
+        size_mb = os.path.getsize(path) / 1e6 if os.path.exists(path) else 0.0
+        print(f"{name}: {len(hospitals)} hospitals, load {sum(hospitals.values())}, {size_mb:.1f} MB ({path})")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="hospitals and load per shard")
+    commands.add_parser("prune", help="drop directory entries whose hospital is on no shard")
+    move = commands.add_parser("move", help="move one hospital")
+    move.add_argument("hospital_id")
+    move.add_argument("shard")
+    rebalance = commands.add_parser("rebalance", help="even out load over a set of shards")
+    rebalance.add_argument("--shards", help="comma-separated target shards (default: every DB_SHARDS entry)")
+    split = commands.add_parser("split", help="move about half of one shard's load into another")
+    split.add_argument("source")
+    split.add_argument("target")
+    for sub in (rebalance, split):
+        sub.add_argument("--tolerance", type=float, default=0.1, help="allowed excess over the mean load")
+        sub.add_argument("--dry-run", action="store_true", help="print the moves without making them")
+    args = parser.parse_args()
+
+    init_shards()
+    if args.command == "move":
+        try:
+            apply_moves([(args.hospital_id, hospital_shard(args.hospital_id) or "?", args.shard)])
+        except (ShardError, ValueError) as exc:
+            raise SystemExit(f"Move failed: {exc}")
+        return
+    if args.command == "prune":
+        pruned = prune_directory()
+        for hospital_id in pruned:
+            print(f"{hospital_id}: removed from the directory")
+        print(f"Pruned {len(pruned)} entries")
+        return
+
+    loads = hospital_loads()
+    if args.command == "status":
+        print_status(loads)
+        return
+    if args.command == "split":
+        targets = [args.source, args.target]
+        loads = {name: loads.get(name, {}) for name in targets}
+    else:
+        targets = args.shards.split(",") if args.shards else list(DB_SHARDS)
+    if not targets:
+        raise SystemExit("No target shards; set DB_SHARDS or pass --shards")
+    for name in targets:
+        try:
+            shard_path(name)
+        except ValueError as exc:
+            raise SystemExit(str(exc))
+
+    moves = plan_moves(loads, targets, args.tolerance)
+    if args.dry_run:
+        for hospital_id, source, target in moves:
+            print(f"{hospital_id}: {source} -> {target}")
+        print(f"{len(moves)} moves planned")
+        return
+    apply_moves(moves)
+    print_status(hospital_loads())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Discrete appointment slots cut from hospital opening hours.
+
+A hospital's morning and evening windows are split into ``SLOT_MINUTES`` slots, and
+each doctor takes up to ``doctors.slot_capacity`` bookings per slot. Triggers keep a
+per-slot count in ``slot_bookings``, keyed by ``(doctor_id, slot_start)``. That key is
+the interval index: free slots for any set of doctors over a date range come from one
+range scan. Slot times are the hospital's wall-clock time, formatted ``YYYY-MM-DD HH:MM``.
+"""
+
+import os
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from db import get_all, get_one
+
+SLOT_MINUTES = int(os.environ.get("SLOT_MINUTES", "15"))
+SLOT_FORMAT = "%Y-%m-%d %H:%M"
+WINDOWS = (("morning", "morning_from", "morning_to"), ("evening", "evening_from", "evening_to"))
+
+_SCHEDULE_SQL = """
+    SELECT d.id, d.hospital_id, d.slot_capacity,
+           h.morning_from, h.morning_to, h.evening_from, h.evening_to
+    FROM doctors d
+    JOIN hospitals h ON h.id = d.hospital_id
+"""
+
+
+class SlotError(ValueError):
+    pass
+
+
+def parse_clock(value: Optional[str]) -> Optional[int]:
+    """Minutes after midnight for ``HH:MM`` (or ``HH:MM:SS``); None when unset or malformed."""
+    if not value:
+        return None
+    try:
+        parsed = time.fromisoformat(value.strip())
+    except ValueError:
+        return None
+    return parsed.hour * 60 + parsed.minute
+
+
+def slot_offsets(schedule: Dict[str, Any]) -> Dict[int, str]:
+    """Start of every slot in a day (minutes after midnight) mapped to its window name."""
+    offsets: Dict[int, str] = {}
+    for window, start_key, end_key in WINDOWS:
+        start, end = parse_clock(schedule.get(start_key)), parse_clock(schedule.get(end_key))
+        if start is None or end is None:
+            continue
+        for minute in range(start, end - SLOT_MINUTES + 1, SLOT_MINUTES):
+            offsets.setdefault(minute, window)
+    return dict(sorted(offsets.items()))
+
+
+def doctor_schedule(doctor_id: str) -> Optional[Dict[str, Any]]:
+    return get_one(f"{_SCHEDULE_SQL} WHERE d.id = ?", (doctor_id,))
+
+
+def parse_slot(value: str, schedule: Dict[str, Any], now: datetime) -> str:
+    """Validate a requested slot start against the doctor's hours and return it normalized."""
+    try:
+        start = datetime.fromisoformat(str(value).strip())
+    except ValueError as exc:
+        raise SlotError("slotStart must be YYYY-MM-DD HH:MM") from exc
+    if start.tzinfo is not None or start.second or start.microsecond:
+        raise SlotError("slotStart must be YYYY-MM-DD HH:MM")
+    if start.hour * 60 + start.minute not in slot_offsets(schedule):
+        raise SlotError("slotStart is not a slot in this hospital's opening hours")
+    if start < now:
+        raise SlotError("slotStart is in the past")
+    return start.strftime(SLOT_FORMAT)
+
+
+def availability(
+    doctor_ids: Iterable[str], first_day: date, days: int, now: datetime
+) -> Dict[str, List[Dict[str, Any]]]:
+    """Free slots per doctor from ``first_day`` for ``days`` days, skipping slots before ``now``.
+
+    Doctors whose hospital has no opening hours are left out; an empty list means fully booked.
+
+    Two queries regardless of how many doctors are asked for: one for their hours and
+    capacity, one range scan over ``slot_bookings`` for the bookings in the window.
+    """
+    ids = list(dict.fromkeys(doctor_ids))
+    if not ids:
+        return {}
+    placeholders = ", ".join("?" for _ in ids)
+    schedules = get_all(f"{_SCHEDULE_SQL} WHERE d.id IN ({placeholders})", ids)
+    start = datetime.combine(first_day, time())
+    end = start + timedelta(days=days)
+    booked: Dict[Tuple[str, str], int] = {
+        (row["doctor_id"], row["slot_start"]): row["booked"]
+        for row in get_all(
+            f"""
+            SELECT doctor_id, slot_start, booked FROM slot_bookings
+            WHERE doctor_id IN ({placeholders}) AND slot_start >= ? AND slot_start < ?
+            """,
+            [*ids, start.strftime(SLOT_FORMAT), end.strftime(SLOT_FORMAT)],
+        )
+    }
+
+    # Doctors with the same hours share their slot times; format them once.
+    slot_times: Dict[Tuple[Tuple[int, str], ...], List[Tuple[str, str]]] = {}
+    result: Dict[str, List[Dict[str, Any]]] = {}
+    for schedule in schedules:
+        offsets = tuple(slot_offsets(schedule).items())
+        if not offsets:
+            # No opening hours: booked by preferred time instead, so not listed at all.
+            continue
+        starts = slot_times.get(offsets)
+        if starts is None:
+            starts = slot_times[offsets] = [
+                (slot.strftime(SLOT_FORMAT), window)
+                for d in range(days)
+                for minute, window in offsets
+                if (slot := start + timedelta(days=d, minutes=minute)) >= now
+            ]
+        capacity = schedule["slot_capacity"]
+        free = []
+        for slot, window in starts:
+            left = capacity - booked.get((schedule["id"], slot), 0)
+            if left > 0:
+                free.append({"start": slot, "window": window, "free": left})
+        result[schedule["id"]] = free
+    return result
@@ -129,13 +129,25 @@
     updateHospital: (id, data) => request(`/hospitals/${id}`, { method: 'PUT', body: data }),
     updateDoctor: (id, data) => request(`/doctors/${id}`, { method: 'PUT', body: data }),
     searchDoctors: (params) => request(`/doctors/search?${new URLSearchParams(params).toString()}`),
+    doctorAvailability: (params) => request(`/doctors/availability?${new URLSearchParams(params).toString()}`),
     createAppointment: (data) => request('/appointments', { method: 'POST', body: data }),
     cancelAppointment: (id) => request(`/appointments/${id}/cancel`, { method: 'PUT' }),
     getInAppointment: (id) => request(`/appointments/${id}/get-in`, { method: 'PUT' }),
     completeAppointment: (id) => request(`/appointments/${id}/complete`, { method: 'PUT' }),
     listAppointments: (params) => request(`/appointments?${new URLSearchParams(params).toString()}`),
     listTodayAppointments: (params) => request(`/appointments/today?${new URLSearchParams(params).toString()}`),
-    firstAid: (data) => request('/firstaid', { method: 'POST', body: data }),
+    stats: (params) => request(`/stats?${new URLSearchParams(params).toString()}`),
+    firstAid: async (data) => {
+      const submitted = await request('/firstaid', { method: 'POST', body: data });
+      if (submitted.status === 'done') return { response: submitted.response || '', id: submitted.id };
+      const { jobId } = submitted;
+      for (;;) {
+        const { job } = await request(`/firstaid/jobs/${jobId}`);
+        if (job.status === 'done') return { response: job.response || '', id: job.chat_id };
+        if (job.status === 'failed') throw new Error(job.error || 'First-aid request failed');
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+      }
+    },
     getHospital: (id) => request(`/hospitals/${id}`)
   };
 
@@ -438,6 +450,7 @@
     const results = qs('#book-results');
     const empty = qs('#book-empty');
     let selected = null;
+    let listed = [];
 
     const renderResults = (doctors) => {
       results.innerHTML = '';
@@ -445,7 +458,7 @@
         const col = document.createElement('div');
         col.className = 'col-md-6';
         col.innerHTML = `
-          <div class="card h-100" data-id="${doc.id}">
+          <div class="card h-100" data-id="${doc.id}" data-hospital-id="${doc.hospital_id}">
             <div class="card-body">
               <div class="d-flex justify-content-between align-items-start">
                 <div>
@@ -455,8 +468,9 @@
                   <p class="text-muted mb-1">${doc.hospital_address || ''}</p>
                   ${doc.distance_km !== undefined && doc.distance_km !== null ? `<p class="text-muted mb-1">${doc.distance_km.toFixed(1)} km away</p>` : ''}
                 </div>
-                <span class="badge bg-secondary">Queue live</span>
+                <span class="badge bg-secondary slot-badge">Checking slots…</span>
               </div>
+              <select class="form-select form-select-sm mt-2 slot-select" disabled></select>
               <button class="btn btn-outline-primary btn-sm mt-2 select-doc" type="button">Select</button>
             </div>
           </div>`;
@@ -465,6 +479,41 @@
       empty.classList.toggle('d-none', doctors.length > 0);
     };
 
+    // One batched request for every listed doctor instead of one per card.
+    const loadAvailability = async (doctors, prefs) => {
+      if (!doctors.length) return;
+      const params = { doctorIds: doctors.map((d) => d.id).join(','), tz: Intl.DateTimeFormat().resolvedOptions().timeZone };
+      if (prefs.date) params.from = prefs.date;
+      const session = prefs.slot ? prefs.slot.toLowerCase() : '';
+      let availability = {};
+      try {
+        ({ availability } = await api.doctorAvailability(params));
+      } catch (_err) {
+        availability = {};
+      }
+      qsa('.card', results).forEach((card) => {
+        const badge = qs('.slot-badge', card);
+        const select = qs('.slot-select', card);
+        // Doctors without opening hours are not listed; they take a preferred time instead.
+        card.dataset.slotted = card.dataset.id in availability ? '1' : '';
+        if (!card.dataset.slotted) {
+          badge.textContent = 'Preferred time';
+          badge.className = 'badge slot-badge bg-info';
+          select.classList.add('d-none');
+          return;
+        }
+        const slots = (availability[card.dataset.id] || []).filter((s) =>
+          (!session || s.window === session) && (!prefs.date || s.start.startsWith(prefs.date)));
+        select.classList.remove('d-none');
+        badge.textContent = slots.length ? `${slots.length} free slot${slots.length === 1 ? '' : 's'}` : 'No free slots';
+        badge.className = `badge slot-badge ${slots.length ? 'bg-success' : 'bg-secondary'}`;
+        select.innerHTML = slots.length
+          ? slots.map((s) => `<option value="${s.start}">${s.start}${s.free > 1 ? ` (${s.free} left)` : ''}</option>`).join('')
+          : '<option value="">No free slots</option>';
+        select.disabled = !slots.length;
+      });
+    };
+
     form.addEventListener('submit', async (e) => {
       e.preventDefault();
       hideAlert(alertId);
@@ -483,6 +532,8 @@
         }) : doctors || [];
         renderResults(filtered);
         selected = null;
+        listed = filtered;
+        loadAvailability(filtered, body);
       } catch (err) {
         showAlert(alertId, 'danger', err.message);
       }
@@ -504,23 +555,28 @@
       const problem = qs('#book-problem')?.value || 'N/A';
       const body = Object.fromEntries(new FormData(form).entries());
       const doctorCard = qsa('.card', results).find((c) => c.dataset.id === selected);
-      const doctorData = doctorCard ? (doctorCard.querySelector('h5')?.textContent || '') : '';
       try {
-        const all = await api.searchDoctors({});
-        const doc = (all.doctors || []).find((d) => d.id === selected);
-        if (!doc) throw new Error('Doctor not found');
+        if (!doctorCard) throw new Error('Doctor not found');
         const payload = {
           userId: user.id,
-          hospitalId: doc.hospital_id,
-          doctorId: doc.id,
-          problem,
-          preferredTime: `${body.date || 'soon'} ${body.slot || ''}`.trim()
+          hospitalId: doctorCard.dataset.hospitalId,
+          doctorId: selected,
+          problem
         };
+        if (doctorCard.dataset.slotted) {
+          const slotStart = qs('.slot-select', doctorCard)?.value;
+          if (!slotStart) throw new Error('No free slot selected for this doctor');
+          Object.assign(payload, { slotStart, tz: Intl.DateTimeFormat().resolvedOptions().timeZone });
+        } else {
+          payload.preferredTime = `${body.date || 'soon'} ${body.slot || ''}`.trim();
+        }
         await api.createAppointment(payload);
         showAlert(alertId, 'success', 'Appointment booked');
         setTimeout(() => { location.href = '/user/dashboard'; }, 800);
       } catch (err) {
         showAlert(alertId, 'danger', err.message);
+        // Someone may have taken the slot meanwhile; show what is still free.
+        loadAvailability(listed, body);
       }
     });
   }
@@ -671,53 +727,77 @@
       tplWrap?.appendChild(btn);
     });
 
-    async function loadAppointments() {
-      loadingText.textContent = 'Loading…';
-      hideAlert(alertId);
+    let appointments = [];
+    let today = [];
+    const tz = Intl.DateTimeFormat().resolvedOptions().timeZone || 'UTC';
+
+    const renderCards = (container, items, emptyEl, withActions) => {
+      container.innerHTML = '';
+      items.forEach((a) => {
+        const col = document.createElement('div');
+        col.className = 'col-md-6';
+        col.innerHTML = `
+          <div class="card h-100">
+            <div class="card-body">
+              <h5 class="card-title">${a.reason || 'Visit'}</h5>
+              <p class="text-muted mb-1">Patient: ${a.user_name || a.user_id || 'N/A'}</p>
+              <p class="text-muted mb-1">Contact: ${a.user_email || 'N/A'} · ${a.user_mobile || 'N/A'}</p>
+              <p class="text-muted mb-1">Time: ${a.preferred_time || 'N/A'}</p>
+              <p class="text-muted mb-1">Status: ${a.status}</p>
+              <p class="text-muted mb-1">Problem: ${a.problem || 'N/A'}</p>
+              ${withActions ? `
+              <div class="d-flex gap-2 flex-wrap mt-2">
+                <button class="btn btn-outline-primary btn-sm appt-action" data-id="${a.id}" data-action="get-in" ${a.status === 'In Consultation' || a.status === 'Completed' ? 'disabled' : ''}>Get-in</button>
+                <button class="btn btn-success btn-sm appt-action" data-id="${a.id}" data-action="complete" ${a.status === 'Completed' ? 'disabled' : ''}>Complete</button>
+                <button class="btn btn-outline-danger btn-sm appt-action" data-id="${a.id}" data-action="cancel" ${a.status === 'Cancelled' ? 'disabled' : ''}>Cancel</button>
+              </div>` : ''}
+            </div>
+          </div>`;
+        container.appendChild(col);
+      });
+      emptyEl.classList.toggle('d-none', items.length > 0);
+    };
+
+    function render() {
+      renderCards(todayList, today, todayEmpty, false);
+      renderCards(apptList, appointments, apptEmpty, true);
+    }
+
+    const minutes = (seconds) => (seconds == null ? 'N/A' : `${Math.round(seconds / 60)} min`);
+
+    // Headline numbers come from the pre-aggregated stats, not from the lists on screen.
+    async function loadStats() {
       try {
-        const [{ appointments = [] }, { appointments: today = [] }] = await Promise.all([
-          api.listAppointments({ doctorId: doctor.id }),
-          api.listTodayAppointments({ doctorId: doctor.id })
-        ]);
-        const counts = { Booked: 0, 'In Consultation': 0, Completed: 0, Cancelled: 0 };
-        appointments.forEach((a) => { counts[a.status] = (counts[a.status] || 0) + 1; });
-        waitingEl.textContent = counts['Booked'] || 0;
+        const { queue, totals } = await api.stats({ doctorId: doctor.id, tz });
+        waitingEl.textContent = queue.booked;
         countsList.innerHTML = '';
-        Object.entries(counts).forEach(([label, value]) => {
+        [
+          ['Booked', totals.booked],
+          ['In Consultation', queue.inConsultation],
+          ['Completed', totals.completed],
+          ['Cancelled', totals.cancelled],
+          ['Avg wait', minutes(totals.avgWaitSeconds)],
+          ['Avg booked to completed', minutes(totals.avgTurnaroundSeconds)]
+        ].forEach(([label, value]) => {
           const li = document.createElement('li');
           li.textContent = `${label}: ${value}`;
           countsList.appendChild(li);
         });
+      } catch (err) {
+        showAlert(alertId, 'danger', err.message);
+      }
+    }
 
-        const renderCards = (container, items, emptyEl, withActions) => {
-          container.innerHTML = '';
-          items.forEach((a) => {
-            const col = document.createElement('div');
-            col.className = 'col-md-6';
-            col.innerHTML = `
-              <div class="card h-100">
-                <div class="card-body">
-                  <h5 class="card-title">${a.reason || 'Visit'}</h5>
-                  <p class="text-muted mb-1">Patient: ${a.user_name || a.user_id || 'N/A'}</p>
-                  <p class="text-muted mb-1">Contact: ${a.user_email || 'N/A'} · ${a.user_mobile || 'N/A'}</p>
-                  <p class="text-muted mb-1">Time: ${a.preferred_time || 'N/A'}</p>
-                  <p class="text-muted mb-1">Status: ${a.status}</p>
-                  <p class="text-muted mb-1">Problem: ${a.problem || 'N/A'}</p>
-                  ${withActions ? `
-                  <div class="d-flex gap-2 flex-wrap mt-2">
-                    <button class="btn btn-outline-primary btn-sm appt-action" data-id="${a.id}" data-action="get-in" ${a.status === 'In Consultation' || a.status === 'Completed' ? 'disabled' : ''}>Get-in</button>
-                    <button class="btn btn-success btn-sm appt-action" data-id="${a.id}" data-action="complete" ${a.status === 'Completed' ? 'disabled' : ''}>Complete</button>
-                    <button class="btn btn-outline-danger btn-sm appt-action" data-id="${a.id}" data-action="cancel" ${a.status === 'Cancelled' ? 'disabled' : ''}>Cancel</button>
-                  </div>` : ''}
-                </div>
-              </div>`;
-            container.appendChild(col);
-          });
-          emptyEl.classList.toggle('d-none', items.length > 0);
-        };
-
-        renderCards(todayList, today, todayEmpty, false);
-        renderCards(apptList, appointments, apptEmpty, true);
+    async function loadAppointments() {
+      loadingText.textContent = 'Loading…';
+      hideAlert(alertId);
+      try {
+        [{ appointments = [] }, { appointments: today = [] }] = await Promise.all([
+          api.listAppointments({ doctorId: doctor.id }),
+          api.listTodayAppointments({ doctorId: doctor.id, tz })
+        ]);
+        render();
+        loadStats();
       } catch (err) {
         showAlert(alertId, 'danger', err.message);
       } finally {
@@ -725,16 +805,67 @@
       }
     }
 
+    // Merge a changed appointment into the lists already on screen (newest first).
+    function applyChange(appt, isNew) {
+      const merge = (list) => {
+        const i = list.findIndex((a) => a.id === appt.id);
+        if (i >= 0) { list[i] = { ...list[i], ...appt }; return true; }
+        return false;
+      };
+      if (!merge(appointments) && isNew) appointments.unshift(appt);
+      if (!merge(today) && isNew) today.unshift(appt);
+      render();
+      loadStats();
+    }
+
+    const POLL_MS = 15000;
+    const RESUBSCRIBE_MS = 60000;
+    let live = false;
+    let pollTimer = null;
+
+    function poll() {
+      if (!pollTimer) pollTimer = setInterval(loadAppointments, POLL_MS);
+    }
+
+    function subscribe() {
+      if (!window.EventSource) { poll(); return; }
+      // Opened before the first load, so nothing committed in between is missed.
+      const feed = new EventSource(`${API_BASE}/doctors/${encodeURIComponent(doctor.id)}/events`);
+      feed.addEventListener('open', () => {
+        live = true;
+        if (!pollTimer) return;
+        // Back from polling: stop it and catch up on anything since the last poll.
+        clearInterval(pollTimer);
+        pollTimer = null;
+        loadAppointments();
+      });
+      feed.addEventListener('appointment.created', (e) => applyChange(JSON.parse(e.data), true));
+      feed.addEventListener('appointment.updated', (e) => applyChange(JSON.parse(e.data), false));
+      feed.addEventListener('reset', () => loadAppointments());
+      // A refused stream (503 while the server is at its stream limit) closes instead of
+      // reconnecting; poll meanwhile and try the feed again later.
+      feed.addEventListener('error', () => {
+        if (feed.readyState !== EventSource.CLOSED) return;
+        live = false;
+        poll();
+        setTimeout(subscribe, RESUBSCRIBE_MS);
+      });
+    }
+
+    subscribe();
+
     apptList?.addEventListener('click', async (e) => {
       if (!e.target.classList.contains('appt-action')) return;
       const id = e.target.dataset.id;
       const action = e.target.dataset.action;
       hideAlert(alertId);
       try {
-        if (action === 'get-in') await api.getInAppointment(id);
-        if (action === 'complete') await api.completeAppointment(id);
-        if (action === 'cancel') await api.cancelAppointment(id);
-        await loadAppointments();
+        let result;
+        if (action === 'get-in') result = await api.getInAppointment(id);
+        if (action === 'complete') result = await api.completeAppointment(id);
+        if (action === 'cancel') result = await api.cancelAppointment(id);
+        if (live && result?.appointment) applyChange(result.appointment, false);
+        else await loadAppointments();
       } catch (err) {
         showAlert(alertId, 'danger', err.message);
       }
@@ -0,0 +1,89 @@
+"""Per-hospital and per-doctor appointment statistics, kept current by triggers.
+
+Every booking and status change is added to ``appointment_stats`` in the same
+transaction, keyed by ``(entity, id, period)`` where a period is 15 minutes of UTC time.
+15 minutes divides every UTC offset in use, so whole periods add up to calendar days in
+any timezone, and a day costs at most 96 rows to read however much history there is.
+``appointment_queue`` holds the current number of booked and in-consultation
+appointments. Archival and shard moves leave both intact.
+"""
+
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List
+from zoneinfo import ZoneInfo
+
+from db import get_all
+
+# Fixed by migration 11, which buckets by unix time / 900.
+PERIOD_SECONDS = 900
+COUNTERS = (
+    "booked",
+    "started",
+    "completed",
+    "cancelled",
+    "wait_seconds",
+    "timed_starts",
+    "turnaround_seconds",
+    "timed_completions",
+)
+
+
+def _period(day: date, tz: ZoneInfo) -> int:
+    return int(datetime.combine(day, time(), tzinfo=tz).timestamp()) // PERIOD_SECONDS
+
+
+def summarize(counts: Dict[str, int]) -> Dict[str, Any]:
+    """Event counts plus mean wait (booked to started) and turnaround (booked to completed)."""
+    return {
+        "booked": counts["booked"],
+        "started": counts["started"],
+        "completed": counts["completed"],
+        "cancelled": counts["cancelled"],
+        "avgWaitSeconds": round(counts["wait_seconds"] / counts["timed_starts"]) if counts["timed_starts"] else None,
+        "avgTurnaroundSeconds": (
+            round(counts["turnaround_seconds"] / counts["timed_completions"]) if counts["timed_completions"] else None
+        ),
+    }
+
+
+def daily_counts(
+    entity: str, entity_id: str, first_day: date, days: int, tz: ZoneInfo
+) -> Dict[date, Dict[str, int]]:
+    """Raw counters for each local calendar day from ``first_day``, zeros included.
+
+    One primary-key range scan over the periods in the window.
+    """
+    result = {first_day + timedelta(days=d): dict.fromkeys(COUNTERS, 0) for d in range(days)}
+    rows = get_all(
+        f"""
+        SELECT period, {", ".join(COUNTERS)} FROM appointment_stats
+        WHERE entity = ? AND id = ? AND period >= ? AND period < ?
+        """,
+        (entity, entity_id, _period(first_day, tz), _period(first_day + timedelta(days=days), tz)),
+    )
+    for row in rows:
+        day = datetime.fromtimestamp(row["period"] * PERIOD_SECONDS, tz).date()
+        counts = result[day]
+        for name in COUNTERS:
+            counts[name] += row[name]
+    return result
+
+
+def queue(entity: str, entity_id: str) -> Dict[str, int]:
+    """Appointments currently booked and in consultation."""
+    sql = "SELECT status, appointments FROM appointment_queue WHERE entity = ? AND id = ?"
+    found = {row["status"]: row["appointments"] for row in get_all(sql, (entity, entity_id))}
+    return {"booked": found.get("Booked", 0), "inConsultation": found.get("In Consultation", 0)}
+
+
+def report(entity: str, entity_id: str, first_day: date, days: int, tz: ZoneInfo) -> Dict[str, Any]:
+    by_day = daily_counts(entity, entity_id, first_day, days, tz)
+    totals = dict.fromkeys(COUNTERS, 0)
+    for counts in by_day.values():
+        for name in COUNTERS:
+            totals[name] += counts[name]
+    return {
+        "queue": queue(entity, entity_id),
+        "totals": summarize(totals),
+        "days": [{"date": day.isoformat(), **summarize(counts)} for day, counts in by_day.items()],
+    }
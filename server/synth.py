@@ -0,0 +1,316 @@
+"""Generate a deterministic synthetic dataset for local load and performance testing.
+
+Usage:
+    cd server
+    python synth.py --hospitals 2000 --users 200000 --appointments 2000000            # load into DB_PATH
+    python synth.py --hospitals 500 --users 10000 --appointments 50000 --out ./synthetic --format csv
+
+Notes:
+- The same `--seed`, counts and `--until` always produce identical rows (ids included),
+  so a slow query seen on one machine can be reproduced on another.
+- Hospitals and users cluster around Indian cities weighted by population, with a
+  minority spread into the surrounding region; appointments go to hospitals in the
+  patient's city, fall in daytime hours over the last `--days` days and older ones
+  are mostly completed or cancelled.
+- Every synthetic account's password is `password`.
+- Without `--out` rows are streamed straight into the database through `bulk_import.load`.
+"""
+
+import argparse
+import csv
+import gzip
+import hashlib
+import json
+import math
+import os
+import random
+import uuid
+from array import array
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterator, Tuple
+
+from bulk_import import load
+from db import DB_PATH, init_db
+
+SYNTHETIC_PASSWORD = "password"
+NAMESPACE = uuid.uuid5(uuid.NAMESPACE_DNS, "synthetic.pulsecare")
+
+# (name, latitude, longitude, metro population in millions)
+CITIES: Tuple[Tuple[str, float, float, float], ...] = (
+    ("Delhi", 28.6139, 77.2090, 32.9),
+    ("Mumbai", 19.0760, 72.8777, 21.3),
+    ("Kolkata", 22.5726, 88.3639, 15.3),
+    ("Bengaluru", 12.9716, 77.5946, 13.6),
+    ("Chennai", 13.0827, 80.2707, 11.8),
+    ("Hyderabad", 17.3850, 78.4867, 10.8),
+    ("Ahmedabad", 23.0225, 72.5714, 8.6),
+    ("Pune", 18.5204, 73.8567, 7.2),
+    ("Surat", 21.1702, 72.8311, 7.8),
+    ("Jaipur", 26.9124, 75.7873, 4.3),
+    ("Lucknow", 26.8467, 80.9462, 3.9),
+    ("Kochi", 9.9312, 76.2673, 3.3),
+    ("Nagpur", 21.1458, 79.0882, 3.0),
+    ("Indore", 22.7196, 75.8577, 3.3),
+    ("Patna", 25.5941, 85.1376, 2.6),
+    ("Bhopal", 23.2599, 77.4126, 2.5),
+    ("Visakhapatnam", 17.6868, 83.2185, 2.3),
+    ("Coimbatore", 11.0168, 76.9558, 2.8),
+    ("Chandigarh", 30.7333, 76.7794, 1.3),
+    ("Guwahati", 26.1445, 91.7362, 1.2),
+)
+# Spread in degrees (about 110 km per degree of latitude).
+URBAN_SPREAD = 0.08
+REGIONAL_SPREAD = 0.6
+REGIONAL_SHARE = 0.15
+
+FIRST_NAMES = (
+    "Aarav", "Vivaan", "Aditya", "Arjun", "Sai", "Reyansh", "Ishaan", "Kabir", "Rohan", "Rahul",
+    "Ananya", "Diya", "Aadhya", "Saanvi", "Priya", "Kavya", "Meera", "Isha", "Neha", "Pooja",
+)
+LAST_NAMES = (
+    "Sharma", "Verma", "Iyer", "Reddy", "Nair", "Patel", "Gupta", "Singh", "Das", "Mukherjee",
+    "Rao", "Menon", "Joshi", "Kulkarni", "Khan", "Bose", "Pillai", "Chopra", "Mehta", "Agarwal",
+)
+HOSPITAL_WORDS = ("City", "Care", "Lifeline", "Sunrise", "Apollo Road", "Green Valley", "Metro", "Unity", "Hope", "Wellness")
+STREETS = ("MG Road", "Station Road", "Ring Road", "Main Street", "Temple Road", "Lake View Road", "Market Road", "Park Street")
+SPECIALIZATIONS = (
+    ("General Medicine", 30), ("Pediatrics", 12), ("Cardiology", 8), ("Orthopedics", 9), ("Dermatology", 7),
+    ("ENT", 7), ("Gynecology", 9), ("Ophthalmology", 6), ("Neurology", 4), ("Psychiatry", 4), ("Dentistry", 8),
+)
+QUALIFICATIONS = ("MBBS", "MBBS, MD", "MBBS, MS", "MBBS, DNB", "MBBS, MD, DM", "BDS")
+PROBLEMS = (
+    "Fever and body ache", "Persistent cough", "Chest pain on exertion", "Skin rash", "Knee pain",
+    "Ear infection", "Headache and dizziness", "Routine check-up", "Back pain", "Blurred vision",
+    "Stomach ache", "Follow-up visit", "Toothache", "Anxiety and poor sleep", "Child vaccination",
+)
+# Status mix for appointments older than a day; newer ones are mostly still booked.
+PAST_STATUSES = (("Completed", 80), ("Cancelled", 15), ("Booked", 5))
+RECENT_STATUSES = (("Booked", 70), ("In Consultation", 10), ("Completed", 15), ("Cancelled", 5))
+TABLES = ("hospitals", "doctors", "users", "appointments")
+
+
+def synthetic_id(kind: str, *key: Any) -> str:
+    """``uuid5(NAMESPACE, "kind-key...")``, built by hand since ``uuid.UUID`` dominates generation time."""
+    name = "-".join([kind, *map(str, key)])
+    raw = bytearray(hashlib.sha1(NAMESPACE.bytes + name.encode()).digest()[:16])
+    raw[6] = (raw[6] & 0x0F) | 0x50
+    raw[8] = (raw[8] & 0x3F) | 0x80
+    h = raw.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+def synthetic_password_hash(password: str, seed: int) -> str:
+    """Werkzeug-format scrypt hash with a seed-derived salt, so generated files are reproducible."""
+    n, r, p = 32768, 8, 1
+    salt = hashlib.sha256(f"{seed}:salt".encode()).hexdigest()[:16]
+    digest = hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p, maxmem=132 * n * r * p)
+    return f"scrypt:{n}:{r}:{p}${salt}${digest.hex()}"
+
+
+def _weighted(options):
+    values = [value for value, _ in options]
+    cumulative = []
+    total = 0
+    for _, weight in options:
+        total += weight
+        cumulative.append(total)
+    return values, cumulative
+
+
+class SyntheticDataset:
+    def __init__(
+        self,
+        hospitals: int,
+        users: int,
+        appointments: int,
+        doctors_per_hospital: int = 1,
+        days: int = 365,
+        until: date | None = None,
+        seed: int = 1,
+        password_hash: str = "",
+    ) -> None:
+        self.counts = {
+            "hospitals": hospitals,
+            "doctors": hospitals * doctors_per_hospital,
+            "users": users,
+            "appointments": appointments if hospitals and users else 0,
+        }
+        self.doctors_per_hospital = doctors_per_hospital
+        self.days = max(1, days)
+        self.until = until or date.today()
+        self.seed = seed
+        self.password_hash = password_hash
+        city_rng = self._rng("cities")
+        city_weights = [c[3] for c in CITIES]
+        city_range = range(len(CITIES))
+        self.hospital_city = array("H", city_rng.choices(city_range, city_weights, k=hospitals))
+        self.user_city = array("H", city_rng.choices(city_range, city_weights, k=users))
+        self.hospital_ids = [synthetic_id("hospital", h) for h in range(hospitals)]
+        self.doctor_ids = [[synthetic_id("doctor", h, k) for k in range(doctors_per_hospital)] for h in range(hospitals)]
+        self.hospitals_by_city: Dict[int, array] = {}
+        for index, city in enumerate(self.hospital_city):
+            self.hospitals_by_city.setdefault(city, array("I")).append(index)
+
+    def _rng(self, stream: str) -> random.Random:
+        # One independent stream per table, so changing one count leaves the others' rows unchanged.
+        return random.Random(f"{self.seed}:{stream}")
+
+    @staticmethod
+    def _point(rng: random.Random, city: int) -> Tuple[float, float]:
+        _, lat, lng, _ = CITIES[city]
+        spread = REGIONAL_SPREAD if rng.random() < REGIONAL_SHARE else URBAN_SPREAD
+        lat += rng.gauss(0, spread)
+        # Keep the spread roughly circular on the ground.
+        lng += rng.gauss(0, spread) / max(0.2, math.cos(math.radians(lat)))
+        return round(lat, 6), round(lng, 6)
+
+    @staticmethod
+    def _person(rng: random.Random) -> str:
+        return f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+
+    def hospitals(self) -> Iterator[Dict[str, Any]]:
+        rng = self._rng("hospitals")
+        for i, city in enumerate(self.hospital_city):
+            name = CITIES[city][0]
+            lat, lng = self._point(rng, city)
+            yield {
+                "id": self.hospital_ids[i],
+                "name": f"{name} {rng.choice(HOSPITAL_WORDS)} Hospital {i}",
+                "email": f"hospital{i}@synthetic.pulsecare.test",
+                "password_hash": self.password_hash,
+                "emergency": 1 if rng.random() < 0.3 else 0,
+                "morning_from": "09:00",
+                "morning_to": rng.choice(("12:00", "13:00")),
+                "evening_from": rng.choice(("16:00", "17:00")),
+                "evening_to": rng.choice(("20:00", "21:00")),
+                "address": f"{rng.randint(1, 400)} {rng.choice(STREETS)}, {name}",
+                "latitude": lat,
+                "longitude": lng,
+            }
+
+    def doctors(self) -> Iterator[Dict[str, Any]]:
+        rng = self._rng("doctors")
+        specializations, cumulative = _weighted(SPECIALIZATIONS)
+        for h in range(self.counts["hospitals"]):
+            for k in range(self.doctors_per_hospital):
+                specialization = rng.choices(specializations, cum_weights=cumulative)[0]
+                years = rng.randint(2, 35)
+                yield {
+                    "id": self.doctor_ids[h][k],
+                    "hospital_id": self.hospital_ids[h],
+                    "name": f"Dr. {self._person(rng)}",
+                    "qualification": "BDS" if specialization == "Dentistry" else rng.choice(QUALIFICATIONS[:-1]),
+                    "specialization": specialization,
+                    "description": f"{specialization} specialist with {years} years of experience.",
+                }
+
+    def users(self) -> Iterator[Dict[str, Any]]:
+        rng = self._rng("users")
+        for i, city in enumerate(self.user_city):
+            age = min(95, max(1, int(rng.gauss(36, 16))))
+            dob = self.until.replace(year=self.until.year - age, month=1, day=1) + timedelta(days=rng.randint(0, 364))
+            lat, lng = self._point(rng, city)
+            yield {
+                "id": synthetic_id("user", i),
+                "name": self._person(rng),
+                "email": f"user{i}@synthetic.pulsecare.test",
+                "mobile": f"9{rng.randint(0, 999_999_999):09d}",
+                "password_hash": self.password_hash,
+                "height": round(rng.gauss(165, 10), 1),
+                "weight": round(rng.gauss(65, 12), 1),
+                "dob": dob.isoformat(),
+                "age": age,
+                "address": f"{rng.randint(1, 999)} {rng.choice(STREETS)}, {CITIES[city][0]}",
+                "latitude": lat,
+                "longitude": lng,
+            }
+
+    def appointments(self) -> Iterator[Dict[str, Any]]:
+        rng = self._rng("appointments")
+        past, past_cumulative = _weighted(PAST_STATUSES)
+        recent, recent_cumulative = _weighted(RECENT_STATUSES)
+        end = datetime.combine(self.until, datetime.min.time()) + timedelta(days=1)
+        hospitals, users = self.counts["hospitals"], self.counts["users"]
+        for i in range(self.counts["appointments"]):
+            user = rng.randrange(users)
+            nearby = self.hospitals_by_city.get(self.user_city[user])
+            hospital = rng.choice(nearby) if nearby and rng.random() < 0.95 else rng.randrange(hospitals)
+            age_days = rng.randrange(self.days)
+            # Clinic hours, busiest late morning (times are UTC-naive like CURRENT_TIMESTAMP).
+            minute = min(23 * 60 + 59, max(0, int(rng.gauss(11.5 * 60, 180))))
+            created = end - timedelta(days=age_days + 1) + timedelta(minutes=minute, seconds=rng.randrange(60))
+            if age_days >= 1:
+                status = rng.choices(past, cum_weights=past_cumulative)[0]
+            else:
+                status = rng.choices(recent, cum_weights=recent_cumulative)[0]
+            yield {
+                "id": synthetic_id("appointment", i),
+                "user_id": synthetic_id("user", user),
+                "hospital_id": self.hospital_ids[hospital],
+                "doctor_id": rng.choice(self.doctor_ids[hospital]),
+                "problem": rng.choice(PROBLEMS),
+                "status": status,
+                "preferred_time": rng.choice(("Morning", "Afternoon", "Evening")),
+                "created_at": created.strftime("%Y-%m-%d %H:%M:%S"),
+            }
+
+    def tables(self) -> Dict[str, Iterator[Dict[str, Any]]]:
+        return {table: getattr(self, table)() for table in TABLES if self.counts[table]}
+
+
+def write_files(dataset: SyntheticDataset, out_dir: str, fmt: str, compress: bool) -> None:
+    os.makedirs(out_dir, exist_ok=True)
+    for table, records in dataset.tables().items():
+        path = os.path.join(out_dir, f"{table}.{fmt}" + (".gz" if compress else ""))
+        opener = gzip.open if compress else open
+        count = 0
+        with opener(path, "wt", encoding="utf-8", newline="") as fh:
+            writer = None
+            for record in records:
+                if fmt == "csv":
+                    if writer is None:
+                        writer = csv.DictWriter(fh, fieldnames=list(record))
+                        writer.writeheader()
+                    writer.writerow(record)
+                else:
+                    fh.write(json.dumps(record, separators=(",", ":")) + "\n")
+                count += 1
+        print(f"Wrote {count} {table} to {path}", flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hospitals", type=int, default=1000)
+    parser.add_argument("--doctors-per-hospital", type=int, default=1)
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--appointments", type=int, default=500000)
+    parser.add_argument("--days", type=int, default=365, help="spread appointments over this many days")
+    parser.add_argument("--until", type=date.fromisoformat, default=None, help="last day (YYYY-MM-DD), default today")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", metavar="DIR", help="write files here instead of loading into the database")
+    parser.add_argument("--format", choices=("ndjson", "csv"), default="ndjson")
+    parser.add_argument("--gzip", action="store_true", help="gzip the written files")
+    args = parser.parse_args()
+
+    dataset = SyntheticDataset(
+        hospitals=args.hospitals,
+        users=args.users,
+        appointments=args.appointments,
+        doctors_per_hospital=max(1, args.doctors_per_hospital),
+        days=args.days,
+        until=args.until,
+        seed=args.seed,
+        # One hash shared by every account; hashing millions of rows would dominate the run.
+        password_hash=synthetic_password_hash(SYNTHETIC_PASSWORD, args.seed),
+    )
+    if args.out:
+        write_files(dataset, args.out, args.format, args.gzip)
+        return
+
+    init_db()
+    counts = load(dataset.tables(), progress=True)
+    print(f"Loaded {sum(counts.values())} synthetic rows into {DB_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Every test session runs the app against throwaway databases in a temp directory.
+
+The environment is set before any server module is imported, since they read it at
+import time; values already set win over ``server/.env``, so no real key is used.
+"""
+
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+TMP_DIR = tempfile.mkdtemp(prefix="pulsecare-tests-")
+os.environ.update(
+    DB_PATH=os.path.join(TMP_DIR, "home.db"),
+    DB_SHARDS="",
+    GEMINI_API_KEY="",
+    RECAPTCHA_SECRET="",
+    RATE_LIMIT_ENABLED="0",
+    RATE_LIMIT_DB=os.path.join(TMP_DIR, "ratelimit.db"),
+    PASSWORD_HASH_WORKERS="0",
+    PASSWORD_HASH_METHOD="pbkdf2:sha256:1000",
+    ARCHIVE_DIR=os.path.join(TMP_DIR, "archive"),
+    METRICS_DIR=os.path.join(TMP_DIR, "metrics"),
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_ids = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import app as flask_app
+
+    return flask_app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user(client):
+    n = next(_ids)
+    resp = client.post("/api/users/register", json={"name": f"User {n}", "email": f"user{n}@test", "password": "pw"})
+    assert resp.status_code == 200, resp.get_json()
+    return resp.get_json()["user"]
+
+
+@pytest.fixture
+def register_hospital(client):
+    """Register a hospital with one doctor; keyword arguments override the form fields."""
+
+    def register(**fields):
+        n = next(_ids)
+        body = {"name": f"Hospital {n}", "email": f"hospital{n}@test", "password": "pw", "doctorName": f"Doctor {n}"}
+        resp = client.post("/api/hospitals/register", json={**body, **fields})
+        assert resp.status_code == 200, resp.get_json()
+        return resp.get_json()
+
+    return register
@@ -0,0 +1,79 @@
+import pytest
+
+from db import run, transaction
+
+
+@pytest.fixture
+def booked(app, client, user, register_hospital):
+    """Book ``n`` appointments with one doctor; return the doctor id and appointment ids."""
+
+    def book(n):
+        registered = register_hospital()
+        ids = []
+        for _ in range(n):
+            resp = client.post(
+                "/api/appointments",
+                json={
+                    "userId": user["id"],
+                    "hospitalId": registered["hospital"]["id"],
+                    "doctorId": registered["doctor"]["id"],
+                    "preferredTime": "soon",
+                },
+            )
+            assert resp.status_code == 200
+            ids.append(resp.get_json()["appointment"]["id"])
+        return registered["doctor"]["id"], ids
+
+    return book
+
+
+def _set_created_at(app, stamps):
+    with app.app_context(), transaction():
+        for appt_id, created_at in stamps.items():
+            run("UPDATE appointments SET created_at = ? WHERE id = ?", (created_at, appt_id))
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_cursor_pages_return_every_row_once_in_order(app, client, booked, stream):
+    doctor_id, ids = booked(7)
+    # Ties on created_at are broken by id, so give several rows the same second.
+    stamps = ["2024-05-01 10:00:00"] * 4 + ["2024-05-01 09:00:00", "2024-05-02 08:00:00", "2024-04-30 23:59:59"]
+    _set_created_at(app, dict(zip(ids, stamps)))
+    expected = [i for _, i in sorted(zip(stamps, ids), reverse=True)]
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        url = f"/api/appointments?doctorId={doctor_id}&limit=3" + ("&stream=1" if stream else "")
+        resp = client.get(url + (f"&after={cursor}" if cursor else ""))
+        assert resp.status_code == 200
+        body = resp.get_json()
+        seen += [a["id"] for a in body["appointments"]]
+        pages += 1
+        cursor = body["nextCursor"]
+        if cursor is None:
+            break
+    assert seen == expected
+    assert pages == 3
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "bm9waXBl", "%FF%FE"])
+def test_malformed_cursors_are_rejected(client, booked, cursor):
+    doctor_id, _ = booked(1)
+    assert client.get(f"/api/appointments?doctorId={doctor_id}&limit=3&after={cursor}").status_code == 400
+
+
+@pytest.mark.parametrize(
+    "tz, inside, outside",
+    [
+        # UTC+5:30: 10 March runs from 18:30 on the 9th to 18:30 on the 10th, UTC.
+        ("Asia/Kolkata", ["2024-03-09 18:30:00", "2024-03-10 18:29:59"], ["2024-03-09 18:29:59", "2024-03-10 18:30:00"]),
+        # New York moves to daylight time that day, so it is 23 hours long.
+        ("America/New_York", ["2024-03-10 05:00:00", "2024-03-11 03:59:59"], ["2024-03-10 04:59:59", "2024-03-11 04:00:00"]),
+    ],
+)
+def test_today_list_uses_the_local_day(app, client, booked, tz, inside, outside):
+    doctor_id, ids = booked(4)
+    _set_created_at(app, dict(zip(ids, inside + outside)))
+    resp = client.get(f"/api/appointments/today?doctorId={doctor_id}&tz={tz}&date=2024-03-10")
+    assert resp.status_code == 200
+    assert sorted(a["id"] for a in resp.get_json()["appointments"]) == sorted(ids[: len(inside)])
@@ -0,0 +1,18 @@
+from datetime import date, timedelta
+
+import archive
+
+
+def test_today_list_reads_archives_only_for_days_past_the_horizon(client, register_hospital, monkeypatch):
+    doctor_id = register_hospital()["doctor"]["id"]
+    asked = []
+    monkeypatch.setattr(archive, "months_between", lambda start, end: asked.append((start, end)) or [])
+
+    resp = client.get(f"/api/appointments/today?doctorId={doctor_id}&tz=UTC")
+    assert resp.status_code == 200
+    assert asked == []
+
+    old = date.today() - timedelta(days=archive.ARCHIVE_AFTER_DAYS + 1)
+    resp = client.get(f"/api/appointments/today?doctorId={doctor_id}&tz=UTC&date={old.isoformat()}")
+    assert resp.status_code == 200
+    assert asked == [(old - timedelta(days=1), old + timedelta(days=2))]
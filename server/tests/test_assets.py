@@ -0,0 +1,16 @@
+import brotli
+
+from assets import build, pick_encoding
+
+
+def test_build_writes_brotli_and_gzip_variants(tmp_path):
+    static = tmp_path / "static"
+    (static / "js").mkdir(parents=True)
+    (static / "js" / "app.js").write_text("console.log('hello');\n" * 50)
+    dist = tmp_path / "dist"
+
+    manifest = build(str(static), str(dist))
+    built = dist / manifest["js/app.js"]
+    assert brotli.decompress((dist / (manifest["js/app.js"] + ".br")).read_bytes()) == built.read_bytes()
+    assert pick_encoding("gzip, deflate, br", str(built)) == ("br", ".br")
+    assert pick_encoding("gzip", str(built)) == ("gzip", ".gz")
@@ -0,0 +1,53 @@
+import threading
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def pool(tmp_path, monkeypatch):
+    # A wide window so every write submitted below lands in the same batch.
+    monkeypatch.setattr(db, "DB_GROUP_COMMIT_WINDOW_S", 0.5)
+    pool = db.ConnectionPool(str(tmp_path / "group.db"))
+    pool.committer().submit(lambda conn: conn.execute("CREATE TABLE t (name TEXT UNIQUE)"))
+    yield pool
+    pool.close()
+
+
+def test_group_commit_rolls_back_only_the_failing_write(pool):
+    def insert(name, fail=False):
+        def write(conn):
+            conn.execute("INSERT INTO t (name) VALUES (?)", (name,))
+            if fail:
+                raise ValueError(name)
+            return name
+
+        return write
+
+    writes = {"first": insert("first"), "broken": insert("broken", fail=True), "second": insert("second")}
+    outcomes = {}
+
+    def submit(key):
+        try:
+            outcomes[key] = pool.committer().submit(writes[key])
+        except ValueError as exc:
+            outcomes[key] = exc
+
+    commits = []
+    threads = [threading.Thread(target=submit, args=(key,)) for key in writes]
+    with pool.writer_lock:
+        pool.writer().set_trace_callback(lambda sql: commits.append(sql) if sql == "COMMIT" else None)
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert outcomes["first"] == "first"
+    assert outcomes["second"] == "second"
+    assert isinstance(outcomes["broken"], ValueError)
+    assert commits == ["COMMIT"]
+
+    with pool.writer_lock:
+        names = {row[0] for row in pool.writer().execute("SELECT name FROM t")}
+    assert names == {"first", "second"}
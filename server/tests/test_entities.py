@@ -0,0 +1,37 @@
+import app as app_module
+from db import run, transaction
+
+
+def _write_elsewhere(app, sql, params):
+    # As another worker would: straight to the database, without touching this worker's cache.
+    with app.app_context(), transaction():
+        run(sql, params)
+
+
+def test_hospital_cache_sees_writes_from_other_workers(app, client, register_hospital, monkeypatch):
+    monkeypatch.setattr(app_module.hospital_cache, "check_interval", 0)
+    registered = register_hospital(doctorSpecialization="Cachetology")
+    hospital_id, doctor_id = registered["hospital"]["id"], registered["doctor"]["id"]
+    url = f"/api/hospitals/{hospital_id}"
+    assert client.get(url).get_json()["hospital"]["name"] == registered["hospital"]["name"]
+
+    _write_elsewhere(app, "UPDATE hospitals SET name = ? WHERE id = ?", ("Renamed General", hospital_id))
+    assert client.get(url).get_json()["hospital"]["name"] == "Renamed General"
+
+    _write_elsewhere(app, "UPDATE doctors SET qualification = ? WHERE id = ?", ("MD", doctor_id))
+    assert client.get(url).get_json()["doctor"]["qualification"] == "MD"
+
+    doctors = client.get("/api/doctors/search?specialization=Cachetology").get_json()["doctors"]
+    assert [(d["hospital_name"], d["qualification"]) for d in doctors] == [("Renamed General", "MD")]
+
+
+def test_hospital_update_is_served_at_once_by_the_writing_worker(client, register_hospital):
+    registered = register_hospital(doctorSpecialization="Freshology")
+    url = f"/api/hospitals/{registered['hospital']['id']}"
+    client.get(url)
+
+    assert client.put(url, json={"name": "Updated Clinic", "emergency": True}).status_code == 200
+    hospital = client.get(url).get_json()["hospital"]
+    assert (hospital["name"], hospital["emergency"]) == ("Updated Clinic", 1)
+    doctors = client.get("/api/doctors/search?specialization=Freshology").get_json()["doctors"]
+    assert [d["hospital_name"] for d in doctors] == ["Updated Clinic"]
@@ -0,0 +1,47 @@
+def _revalidate(client, url):
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    again = client.get(url, headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+    return etag
+
+
+def _changed(client, url, etag):
+    resp = client.get(url, headers={"If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers["ETag"] != etag
+    return resp.get_json()
+
+
+def test_user_etag_changes_after_an_update(client, user):
+    url = f"/api/users/{user['id']}"
+    etag = _revalidate(client, url)
+    assert client.put(url, json={"address": "1 New Street"}).status_code == 200
+    assert _changed(client, url, etag)["user"]["address"] == "1 New Street"
+
+
+def test_hospital_etag_changes_after_hospital_and_doctor_updates(client, register_hospital):
+    registered = register_hospital()
+    url = f"/api/hospitals/{registered['hospital']['id']}"
+
+    etag = _revalidate(client, url)
+    assert client.put(url, json={"address": "2 Clinic Road"}).status_code == 200
+    assert _changed(client, url, etag)["hospital"]["address"] == "2 Clinic Road"
+
+    etag = _revalidate(client, url)
+    doctor_url = f"/api/doctors/{registered['doctor']['id']}"
+    assert client.put(doctor_url, json={"qualification": "FRCS"}).status_code == 200
+    assert _changed(client, url, etag)["doctor"]["qualification"] == "FRCS"
+
+
+def test_search_etag_changes_after_a_doctor_update(client, register_hospital):
+    registered = register_hospital(doctorSpecialization="Etagology")
+    url = "/api/doctors/search?specialization=Etagology"
+
+    etag = _revalidate(client, url)
+    doctor_url = f"/api/doctors/{registered['doctor']['id']}"
+    assert client.put(doctor_url, json={"description": "Sees walk-ins"}).status_code == 200
+    doctors = _changed(client, url, etag)["doctors"]
+    assert [d["description"] for d in doctors] == ["Sees walk-ins"]
@@ -0,0 +1,20 @@
+import threading
+
+import app as app_module
+
+
+def test_streams_beyond_the_cap_are_turned_away_until_one_closes(app, client, register_hospital, monkeypatch):
+    monkeypatch.setattr(app_module, "event_stream_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setitem(app.config, "EVENTS_STREAM_MAX_AGE", 0.1)
+    url = f"/api/doctors/{register_hospital()['doctor']['id']}/events"
+
+    first = client.get(url)
+    assert first.status_code == 200
+    refused = client.get(url)
+    assert refused.status_code == 503
+    assert refused.headers["Retry-After"] == "30"
+
+    first.close()
+    again = client.get(url)
+    assert again.status_code == 200
+    again.close()
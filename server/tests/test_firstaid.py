@@ -0,0 +1,18 @@
+import app as app_module
+from db import get_all
+
+
+def test_gemini_errors_fail_the_job_without_leaking_details(app, client, monkeypatch):
+    def broken(prompt):
+        raise app_module.GeminiError("Gemini request failed: https://example.test/generate?key=secret-key")
+
+    monkeypatch.setattr(app_module, "gemini_generate", broken)
+    queued = client.post("/api/firstaid", json={"prompt": "burnt my hand on the stove"})
+    assert queued.status_code == 202
+
+    job = client.get(f"/api/firstaid/jobs/{queued.get_json()['jobId']}?wait=10").get_json()["job"]
+    assert job["status"] == "failed"
+    assert job["response"] is None
+    assert "secret-key" not in job["error"]
+    with app.app_context():
+        assert not get_all("SELECT 1 FROM firstaid_responses WHERE response LIKE '%secret-key%'")
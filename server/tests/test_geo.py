@@ -0,0 +1,56 @@
+import random
+
+from db import get_all
+from geo import bounding_boxes, doctors_within, haversine_km, nearest_doctors
+
+FILTER = " AND d.rowid IN (SELECT rowid FROM doctors_fts WHERE doctors_fts MATCH ?)"
+
+
+def test_boxes_cover_the_whole_circle():
+    rng = random.Random(7)
+    for _ in range(2000):
+        lat, lng = rng.uniform(-89, 89), rng.uniform(-180, 180)
+        radius = rng.choice([1.0, 50.0, 500.0, 3000.0])
+        lat2, lng2 = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        if haversine_km(lat, lng, lat2, lng2) > radius:
+            continue
+        assert any(b[0] <= lat2 <= b[1] and b[2] <= lng2 <= b[3] for b in bounding_boxes(lat, lng, radius))
+
+
+def test_ring_search_matches_a_full_scan(app, register_hospital):
+    rng = random.Random(11)
+    # Clustered round one point, plus a few across the antimeridian and far away.
+    spots = [(rng.gauss(12.9, 2.0), rng.gauss(77.6, 2.0)) for _ in range(30)]
+    spots += [(rng.uniform(-60, 60), rng.choice([179.9, -179.9])) for _ in range(5)]
+    spots += [(rng.uniform(-80, 80), rng.uniform(-180, 180)) for _ in range(10)]
+    for lat, lng in spots:
+        register_hospital(latitude=lat, longitude=lng, doctorSpecialization="Ringtestology")
+
+    with app.app_context():
+        everyone = get_all(
+            """
+            SELECT d.id, h.latitude, h.longitude FROM doctors d JOIN hospitals h ON h.id = d.hospital_id
+            WHERE d.specialization = 'Ringtestology'
+            """
+        )
+        for lat, lng in [(12.9, 77.6), (0.0, 179.95), (-75.0, 10.0)]:
+            distance = {d["id"]: haversine_km(lat, lng, d["latitude"], d["longitude"]) for d in everyone}
+            ranked = sorted(distance, key=distance.get)
+            for limit in (1, 5, 20, 100):
+                found = nearest_doctors(lat, lng, limit, FILTER, ["ringtestology"])
+                assert [d["id"] for d in found] == ranked[:limit]
+            for radius in (50.0, 500.0, 5000.0):
+                inside = [i for i in ranked if distance[i] <= radius]
+                assert [d["id"] for d in doctors_within(lat, lng, radius, FILTER, ["ringtestology"])] == inside
+                limited = doctors_within(lat, lng, radius, FILTER, ["ringtestology"], limit=3)
+                assert [d["id"] for d in limited] == inside[:3]
+
+
+def test_search_with_a_radius_honours_the_limit(client, register_hospital):
+    for offset in range(5):
+        register_hospital(latitude=-33.86 + offset * 0.01, longitude=151.2, doctorSpecialization="Limitology")
+    resp = client.get("/api/doctors/search?specialization=Limitology&userLat=-33.86&userLng=151.2&radiusKm=100&limit=2")
+    assert resp.status_code == 200
+    doctors = resp.get_json()["doctors"]
+    assert len(doctors) == 2
+    assert doctors[0]["distance_km"] <= doctors[1]["distance_km"]
@@ -0,0 +1,62 @@
+import itertools
+import threading
+
+import pytest
+
+import app as app_module
+import limits
+
+_ips = (f"203.0.113.{n}" for n in itertools.count(1))
+
+
+@pytest.fixture
+def policy(monkeypatch):
+    """The login policy, enabled and shrunk to 2 requests a minute per IP and one slot."""
+    monkeypatch.setattr(limits, "RATE_LIMIT_ENABLED", True)
+    login = limits.POLICIES["login"]
+    monkeypatch.setattr(login, "per_ip", (2, 60.0))
+    monkeypatch.setattr(login, "per_account", None)
+    monkeypatch.setattr(login, "_slots", threading.BoundedSemaphore(1))
+    return login
+
+
+def _login(client, ip):
+    return client.post(
+        "/api/users/login", json={"email": "nobody@test", "password": "wrong"}, environ_base={"REMOTE_ADDR": ip}
+    )
+
+
+def test_empty_bucket_answers_429_with_retry_after(client, policy):
+    ip, other = next(_ips), next(_ips)
+    assert [_login(client, ip).status_code for _ in range(2)] == [401, 401]
+    refused = _login(client, ip)
+    assert refused.status_code == 429
+    assert 1 <= int(refused.headers["Retry-After"]) <= 30
+    # Buckets are per client address.
+    assert _login(client, other).status_code == 401
+
+
+def test_concurrency_slot_is_released_after_each_request(client, policy):
+    assert _login(client, next(_ips)).status_code == 401
+    assert _login(client, next(_ips)).status_code == 401
+
+    assert policy.try_enter()
+    try:
+        busy = _login(client, next(_ips))
+        assert busy.status_code == 503
+        assert busy.headers["Retry-After"] == "1"
+    finally:
+        policy.leave()
+
+
+def test_concurrency_slot_is_released_when_the_view_raises(app, policy):
+    @app_module.admit("login")
+    def broken():
+        raise RuntimeError("boom")
+
+    for _ in range(2):
+        with app.test_request_context("/", method="POST", json={}, environ_base={"REMOTE_ADDR": next(_ips)}):
+            with pytest.raises(RuntimeError):
+                broken()
+    assert policy.try_enter()
+    policy.leave()
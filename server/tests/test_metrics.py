@@ -0,0 +1,14 @@
+def test_metrics_are_closed_without_a_token(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, "METRICS_TOKEN", "")
+    assert client.get("/api/metrics").status_code == 401
+    assert client.get("/api/metrics/slow-queries").status_code == 401
+
+    monkeypatch.setitem(app.config, "METRICS_PUBLIC", True)
+    assert client.get("/api/metrics").status_code == 200
+
+
+def test_metrics_token_is_required_when_set(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, "METRICS_TOKEN", "scrape")
+    monkeypatch.setitem(app.config, "METRICS_PUBLIC", True)
+    assert client.get("/api/metrics").status_code == 401
+    assert client.get("/api/metrics", headers={"Authorization": "Bearer scrape"}).status_code == 200
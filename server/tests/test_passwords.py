@@ -0,0 +1,23 @@
+import time
+
+from passwords import PasswordService, PasswordServiceBusy, _hash
+
+
+def test_short_method_names_do_not_force_a_rehash():
+    service = PasswordService("pbkdf2", workers=0, max_pending=1, timeout=1)
+    assert not service.needs_rehash(_hash("pw", "pbkdf2"))
+    assert service.needs_rehash(_hash("pw", "pbkdf2:sha256:1000"))
+
+
+def test_timed_out_job_holds_its_place_until_it_finishes():
+    service = PasswordService("pbkdf2", workers=1, max_pending=1, timeout=0.001)
+    try:
+        service.hash("pw")
+    except PasswordServiceBusy:
+        pass
+    assert service._inflight == 1
+    deadline = time.monotonic() + 30
+    while service._inflight and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert service._inflight == 0
+    service._pool().shutdown()
@@ -0,0 +1,99 @@
+import pytest
+
+import db
+import shards
+from cache import LRUCache
+
+
+@pytest.fixture
+def sharded(app, tmp_path, monkeypatch):
+    """Two shards next to the home database, for the length of one test."""
+    for name in ("east", "west"):
+        monkeypatch.setitem(db.DB_SHARDS, name, str(tmp_path / f"{name}.db"))
+    monkeypatch.setattr(db, "_locations", LRUCache(64))
+    db.init_shards()
+    yield ["east", "west"]
+    for name in ("east", "west"):
+        pool = db._pools.pop(name, None)
+        if pool is not None:
+            pool.close()
+
+
+def _fresh_locations(monkeypatch):
+    # Workers cache locations for the life of the process; moves assume a restart.
+    monkeypatch.setattr(db, "_locations", LRUCache(64))
+
+
+def _derived_rows(shard, hospital_id, doctor_id):
+    with db.use_shard(shard):
+        geo = list(
+            db.iter_rows("SELECT h.id FROM hospitals_geo g JOIN hospitals h ON h.rowid = g.id WHERE h.id = ?", (hospital_id,))
+        )
+        fts = list(
+            db.iter_rows(
+                "SELECT d.id FROM doctors_fts f JOIN doctors d ON d.rowid = f.rowid WHERE doctors_fts MATCH ? AND d.id = ?",
+                ("cardiology", doctor_id),
+            )
+        )
+        stats = {
+            (row["entity"], row["id"]): row["booked"]
+            for row in db.iter_rows("SELECT entity, id, SUM(booked) AS booked FROM appointment_stats GROUP BY entity, id")
+        }
+        queue = {
+            (row["entity"], row["id"]): row["appointments"]
+            for row in db.iter_rows("SELECT entity, id, appointments FROM appointment_queue WHERE status = 'Booked'")
+        }
+    keys = {("hospital", hospital_id), ("doctor", doctor_id)}
+    return {
+        "geo": len(geo),
+        "fts": len(fts),
+        "stats": {key: n for key, n in stats.items() if key in keys},
+        "queue": {key: n for key, n in queue.items() if key in keys},
+    }
+
+
+def test_moved_hospital_takes_its_rows_with_it(client, user, register_hospital, sharded, monkeypatch):
+    registered = register_hospital(latitude=12.97, longitude=77.59, doctorSpecialization="Cardiology")
+    hospital_id = registered["hospital"]["id"]
+    doctor_id = registered["doctor"]["id"]
+    booked = client.post(
+        "/api/appointments",
+        json={"userId": user["id"], "hospitalId": hospital_id, "doctorId": doctor_id, "preferredTime": "soon"},
+    )
+    assert booked.status_code == 200
+
+    source = shards.hospital_shard(hospital_id)
+    assert source in sharded
+    target = next(name for name in sharded if name != source)
+    before = _derived_rows(source, hospital_id, doctor_id)
+    assert before["geo"] == 1 and before["fts"] == 1
+    assert before["stats"] == {("hospital", hospital_id): 1, ("doctor", doctor_id): 1}
+
+    assert shards.move_hospital(hospital_id, target) == 3
+    _fresh_locations(monkeypatch)
+
+    assert shards.hospital_shard(hospital_id) == target
+    assert db.locate("hospitals", hospital_id) == target
+    assert db.locate("doctors", doctor_id) == target
+    assert db.locate("appointments", booked.get_json()["appointment"]["id"]) == target
+    assert _derived_rows(target, hospital_id, doctor_id) == before
+    assert _derived_rows(source, hospital_id, doctor_id) == {"geo": 0, "fts": 0, "stats": {}, "queue": {}}
+
+    resp = client.get(f"/api/stats?hospitalId={hospital_id}")
+    assert resp.status_code == 200
+    assert resp.get_json()["queue"]["booked"] == 1
+    assert resp.get_json()["totals"]["booked"] == 1
+
+
+def test_prune_drops_directory_entries_without_a_hospital(register_hospital, sharded):
+    kept = register_hospital()["hospital"]["id"]
+    with db.use_shard(db.HOME_SHARD), db.transaction() as conn:
+        conn.execute(
+            "INSERT INTO hospital_shards (hospital_id, shard, email) VALUES ('ghost', 'east', 'ghost@test')"
+        )
+
+    # Earlier tests may leave entries pointing at their own, since deleted, shard files.
+    pruned = shards.prune_directory()
+    assert "ghost" in pruned and kept not in pruned
+    assert shards.hospital_shard("ghost") is None
+    assert shards.hospital_shard(kept) in sharded
@@ -0,0 +1,80 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+
+def _tomorrow_slot() -> str:
+    return (datetime.now(timezone.utc) + timedelta(days=1)).strftime("%Y-%m-%d 09:00")
+
+
+def _book(client, user, hospital, slot):
+    return client.post(
+        "/api/appointments",
+        json={
+            "userId": user["id"],
+            "hospitalId": hospital["hospital"]["id"],
+            "doctorId": hospital["doctor"]["id"],
+            "slotStart": slot,
+            "tz": "UTC",
+        },
+    )
+
+
+def test_concurrent_bookings_cannot_overbook_a_slot(app, user, register_hospital):
+    hospital = register_hospital(morningFrom="09:00", morningTo="12:00")
+    slot = _tomorrow_slot()
+    barrier = threading.Barrier(2)
+    statuses = []
+
+    def book():
+        client = app.test_client()
+        barrier.wait()
+        statuses.append(_book(client, user, hospital, slot).status_code)
+
+    threads = [threading.Thread(target=book) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [200, 409]
+
+
+def test_cancelling_frees_the_slot(client, user, register_hospital):
+    hospital = register_hospital(morningFrom="09:00", morningTo="12:00")
+    doctor_id = hospital["doctor"]["id"]
+    slot = _tomorrow_slot()
+    day = slot[:10]
+
+    def free_starts():
+        resp = client.get(f"/api/doctors/availability?doctorIds={doctor_id}&from={day}&days=1&tz=UTC")
+        return [s["start"] for s in resp.get_json()["availability"][doctor_id]]
+
+    booked = _book(client, user, hospital, slot)
+    assert booked.status_code == 200
+    assert slot not in free_starts()
+    assert _book(client, user, hospital, slot).status_code == 409
+
+    appt_id = booked.get_json()["appointment"]["id"]
+    assert client.put(f"/api/appointments/{appt_id}/cancel").status_code == 200
+    assert slot in free_starts()
+    assert _book(client, user, hospital, slot).status_code == 200
+
+
+def test_doctors_without_hours_are_booked_by_preferred_time(client, user, register_hospital):
+    hospital = register_hospital()
+    doctor_id = hospital["doctor"]["id"]
+
+    resp = client.get(f"/api/doctors/availability?doctorIds={doctor_id}&tz=UTC")
+    assert doctor_id not in resp.get_json()["availability"]
+
+    resp = client.post(
+        "/api/appointments",
+        json={
+            "userId": user["id"],
+            "hospitalId": hospital["hospital"]["id"],
+            "doctorId": doctor_id,
+            "preferredTime": "soon Morning",
+        },
+    )
+    assert resp.status_code == 200
+    assert resp.get_json()["appointment"]["slot_start"] is None
@@ -0,0 +1,106 @@
+from datetime import date, datetime, timedelta, timezone
+
+from db import get_all, get_one
+
+
+def _book(client, user, registered):
+    resp = client.post(
+        "/api/appointments",
+        json={
+            "userId": user["id"],
+            "hospitalId": registered["hospital"]["id"],
+            "doctorId": registered["doctor"]["id"],
+            "preferredTime": "soon",
+        },
+    )
+    assert resp.status_code == 200
+    return resp.get_json()["appointment"]["id"]
+
+
+def _assert_counters_match_appointments(column, entity, entity_id):
+    totals = get_one(
+        """
+        SELECT COALESCE(SUM(booked), 0) AS booked, COALESCE(SUM(started), 0) AS started,
+               COALESCE(SUM(completed), 0) AS completed, COALESCE(SUM(cancelled), 0) AS cancelled
+        FROM appointment_stats WHERE entity = ? AND id = ?
+        """,
+        (entity, entity_id),
+    )
+    counted = get_one(
+        f"""
+        SELECT COUNT(*) AS booked, COUNT(started_at) AS started, COUNT(completed_at) AS completed,
+               SUM(status = 'Cancelled') AS cancelled
+        FROM appointments WHERE {column} = ?
+        """,
+        (entity_id,),
+    )
+    assert totals == counted
+    queue = {
+        row["status"]: row["appointments"]
+        for row in get_all("SELECT status, appointments FROM appointment_queue WHERE entity = ? AND id = ?", (entity, entity_id))
+        if row["appointments"]
+    }
+    open_now = {
+        row["status"]: row["n"]
+        for row in get_all(
+            f"""
+            SELECT status, COUNT(*) AS n FROM appointments
+            WHERE {column} = ? AND status IN ('Booked', 'In Consultation') GROUP BY status
+            """,
+            (entity_id,),
+        )
+    }
+    assert queue == open_now
+
+
+def test_triggers_keep_counters_equal_to_the_appointments(app, client, user, register_hospital):
+    registered = register_hospital()
+    hospital_id, doctor_id = registered["hospital"]["id"], registered["doctor"]["id"]
+
+    def check():
+        with app.app_context():
+            _assert_counters_match_appointments("hospital_id", "hospital", hospital_id)
+            _assert_counters_match_appointments("doctor_id", "doctor", doctor_id)
+
+    ids = [_book(client, user, registered) for _ in range(4)]
+    check()
+    for appt_id in ids[:2]:
+        assert client.put(f"/api/appointments/{appt_id}/get-in").status_code == 200
+    check()
+    assert client.put(f"/api/appointments/{ids[0]}/complete").status_code == 200
+    check()
+    assert client.put(f"/api/appointments/{ids[2]}/cancel").status_code == 200
+    assert client.put(f"/api/appointments/{ids[1]}/cancel").status_code == 200
+    check()
+
+    report = client.get(f"/api/stats?doctorId={doctor_id}&tz=UTC").get_json()
+    assert report["queue"] == {"booked": 1, "inConsultation": 0}
+    totals = report["totals"]
+    assert (totals["booked"], totals["started"], totals["completed"], totals["cancelled"]) == (4, 2, 1, 2)
+    assert totals["avgWaitSeconds"] is not None and totals["avgTurnaroundSeconds"] is not None
+
+
+def test_stats_ranges(client, register_hospital):
+    hospital_id = register_hospital()["hospital"]["id"]
+    url = f"/api/stats?hospitalId={hospital_id}&tz=UTC"
+    today = datetime.now(timezone.utc).date()
+
+    report = client.get(url).get_json()
+    assert (report["from"], report["to"]) == (today.isoformat(), today.isoformat())
+    assert [d["date"] for d in report["days"]] == [today.isoformat()]
+
+    first = today - timedelta(days=6)
+    report = client.get(f"{url}&from={first.isoformat()}").get_json()
+    assert (report["from"], report["to"]) == (first.isoformat(), today.isoformat())
+    assert len(report["days"]) == 7
+
+    report = client.get(f"{url}&from=2024-02-27&to=2024-03-01").get_json()
+    assert [d["date"] for d in report["days"]] == ["2024-02-27", "2024-02-28", "2024-02-29", "2024-03-01"]
+
+    assert client.get(f"{url}&from=2024-13-01").status_code == 400
+    assert client.get(f"{url}&from=yesterday").status_code == 400
+    assert client.get(f"{url}&from=2024-03-02&to=2024-03-01").status_code == 400
+    assert client.get(f"{url}&from={date(2000, 1, 1).isoformat()}").status_code == 400
+    assert client.get(f"/api/stats?hospitalId={hospital_id}&tz=Mars/Olympus").status_code == 400
+    assert client.get("/api/stats").status_code == 400
+    assert client.get("/api/stats?hospitalId=missing").status_code == 404
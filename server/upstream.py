@@ -0,0 +1,244 @@
+"""Shared outbound HTTP layer for third-party APIs (Gemini, reCAPTCHA).
+
+Each upstream gets a pooled keep-alive ``requests.Session``, separate connect/read
+timeouts, bounded retries with jittered backoff, a circuit breaker that fails fast
+while the upstream is erroring or slow, and latency statistics.
+"""
+
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import registry
+
+
+class CircuitOpenError(requests.RequestException):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures; lets one probe through after ``reset_timeout``."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class LatencyStats:
+    def __init__(self, window: int = 512) -> None:
+        self.count = 0
+        self.errors = 0
+        self.rejected = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self._recent: "deque[float]" = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self.count += 1
+            self.total_s += seconds
+            self.max_s = max(self.max_s, seconds)
+            self._recent.append(seconds)
+            if not ok:
+                self.errors += 1
+
+    def reject(self) -> None:
+        with self._lock:
+            self.rejected += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = sorted(self._recent)
+            count, errors, rejected, total, peak = self.count, self.errors, self.rejected, self.total_s, self.max_s
+
+        def pct(q: float) -> Optional[float]:
+            return recent[min(len(recent) - 1, int(q * len(recent)))] if recent else None
+
+        return {
+            "count": count,
+            "errors": errors,
+            "rejected": rejected,
+            "avg_s": total / count if count else None,
+            "max_s": peak,
+            "p50_s": pct(0.50),
+            "p95_s": pct(0.95),
+            "p99_s": pct(0.99),
+        }
+
+
+class Upstream:
+    def __init__(
+        self,
+        name: str,
+        connect_timeout: float,
+        read_timeout: float,
+        retries: int = 1,
+        backoff: float = 0.2,
+        retry_statuses: frozenset = frozenset(),
+        slow_call_s: Optional[float] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        pool_size: int = 10,
+    ) -> None:
+        self.name = name
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.retry_statuses = retry_statuses
+        self.slow_call_s = slow_call_s
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = LatencyStats()
+        self.pool_size = pool_size
+        self._session: Optional[requests.Session] = None
+        self._session_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        # Sockets must not be shared across a fork, so each process builds its own session.
+        if self._session is None or self._session_pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._session_pid != os.getpid():
+                    session = requests.Session()
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+                    self._session_pid = os.getpid()
+        return self._session
+
+    def _sleep_before_retry(self, attempt: int) -> None:
+        time.sleep(self.backoff * (2**attempt) * random.uniform(0.5, 1.5))
+
+    def request(self, method: str, url: str, **kwargs: Any) -> requests.Response:
+        """Send a request, retrying only when it is safe to.
+
+        Connection failures are retried; HTTP statuses only if listed in
+        ``retry_statuses``. Read timeouts are never retried, since the upstream may
+        already have acted on the request.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                self.stats.reject()
+                registry.inc("upstream_rejected_total", {"upstream": self.name})
+                raise CircuitOpenError(f"{self.name} circuit open; failing fast")
+            started = time.perf_counter()
+            try:
+                resp = self.session.request(method, url, **kwargs)
+            except requests.ConnectionError:
+                # Includes ConnectTimeout; a ReadTimeout is not a ConnectionError.
+                self._finish(started, ok=False)
+                if attempt < self.retries:
+                    self._sleep_before_retry(attempt)
+                    attempt += 1
+                    continue
+                raise
+            except requests.RequestException:
+                self._finish(started, ok=False)
+                raise
+            failed = resp.status_code >= 500 or resp.status_code == 429
+            self._finish(started, ok=not failed)
+            if resp.status_code in self.retry_statuses and attempt < self.retries:
+                self._sleep_before_retry(attempt)
+                attempt += 1
+                continue
+            return resp
+
+    def _finish(self, started: float, ok: bool) -> None:
+        elapsed = time.perf_counter() - started
+        self.stats.observe(elapsed, ok)
+        registry.observe(
+            "upstream_request_duration_seconds", {"upstream": self.name, "outcome": "ok" if ok else "error"}, elapsed
+        )
+        if ok and (self.slow_call_s is None or elapsed <= self.slow_call_s):
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def post(self, url: str, **kwargs: Any) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"circuit": self.breaker.state, **self.stats.snapshot()}
+
+
+def _env_float(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+gemini = Upstream(
+    "gemini",
+    connect_timeout=_env_float("GEMINI_CONNECT_TIMEOUT", 3.0),
+    read_timeout=_env_float("GEMINI_READ_TIMEOUT", 20.0),
+    retries=int(os.environ.get("GEMINI_RETRIES", "2")),
+    retry_statuses=frozenset({429, 503}),
+    slow_call_s=_env_float("GEMINI_SLOW_CALL_S", 15.0),
+    breaker=CircuitBreaker(failure_threshold=5, reset_timeout=30.0),
+)
+
+recaptcha = Upstream(
+    "recaptcha",
+    connect_timeout=_env_float("RECAPTCHA_CONNECT_TIMEOUT", 1.0),
+    read_timeout=_env_float("RECAPTCHA_READ_TIMEOUT", 3.0),
+    # Tokens are single-use, so only requests that never reached Google are retried.
+    retries=int(os.environ.get("RECAPTCHA_RETRIES", "1")),
+    slow_call_s=_env_float("RECAPTCHA_SLOW_CALL_S", 2.0),
+    breaker=CircuitBreaker(failure_threshold=5, reset_timeout=15.0),
+)
+
+UPSTREAMS: Dict[str, Upstream] = {u.name: u for u in (gemini, recaptcha)}
+
+
+def _collect_circuits(reg) -> None:
+    for name, u in UPSTREAMS.items():
+        reg.set_gauge("upstream_circuit_open", {"upstream": name}, 1.0 if u.breaker.state == "open" else 0.0)
+
+
+registry.add_collector(_collect_circuits)
+
+
+def upstream_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: u.snapshot() for name, u in UPSTREAMS.items()}